@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+HTTP API for Linda Goodman's Zodiac Guide
+Serves the RAG engine over JSON and Server-Sent Events for the UI, mobile apps and batch jobs
+
+    python api_server.py --port 8080
+
+POST /v1/ask          {"question": "...", "history": [...] | "session": "id", "prompt_variant": "condensed"}
+POST /v1/ask/stream   same body; answers as SSE "delta" events followed by one "done" event
+GET  /healthz         the process is up
+GET  /readyz          the process accepts requests (503 while starting, warming up or draining)
+GET  /metrics         Prometheus metrics
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from aiohttp import web
+from client_pool import close_async_clients
+from history import ConversationHistory
+from metrics import REGISTRY
+from prompt_registry import SYSTEM_PROMPT_VARIANTS
+from session_store import create_conversation_store
+from warmup import WARMUP_ON_START, warm, warmup_questions
+
+API_HOST = os.getenv("API_HOST", "0.0.0.0")
+API_PORT = int(os.getenv("API_PORT", "8080"))
+# Requests answered at once; the rest wait up to API_QUEUE_TIMEOUT seconds for a slot, then get a 503
+API_MAX_CONCURRENCY = int(os.getenv("API_MAX_CONCURRENCY", "32"))
+API_QUEUE_TIMEOUT = float(os.getenv("API_QUEUE_TIMEOUT", "10"))
+# Seconds in-flight requests get to finish on shutdown
+API_SHUTDOWN_TIMEOUT = float(os.getenv("API_SHUTDOWN_TIMEOUT", "30"))
+
+MAX_QUESTION_CHARS = 2000
+
+ENGINE = web.AppKey("engine", object)
+STORE = web.AppKey("store", object)
+SLOTS = web.AppKey("slots", asyncio.Semaphore)
+STATE = web.AppKey("state", dict)
+WARMUP = web.AppKey("warmup", list)
+PENDING = web.AppKey("pending", dict)  # session id -> the background task storing its last turn
+
+
+class BadRequest(Exception):
+    """The request body cannot be answered"""
+
+
+def parse_ask(body):
+    """Validate an ask request body; returns (question, history, session_id, prompt_variant)"""
+    if not isinstance(body, dict):
+        raise BadRequest("Expected a JSON object")
+    question = body.get("question")
+    if not isinstance(question, str) or not question.strip():
+        raise BadRequest("'question' must be a non-empty string")
+    if len(question) > MAX_QUESTION_CHARS:
+        raise BadRequest(f"'question' is longer than {MAX_QUESTION_CHARS} characters")
+
+    history = body.get("history")
+    session_id = body.get("session")
+    if history is not None and session_id is not None:
+        raise BadRequest("Send either 'history' or 'session', not both")
+    if history is not None:
+        if not isinstance(history, list) or not all(
+            isinstance(m, dict) and m.get("role") in ("user", "assistant") and isinstance(m.get("content"), str)
+            for m in history
+        ):
+            raise BadRequest("'history' must be a list of {role: user|assistant, content} messages")
+    if session_id is not None and (not isinstance(session_id, str) or not session_id):
+        raise BadRequest("'session' must be a non-empty string")
+
+    variant = body.get("prompt_variant")
+    if variant is not None and variant not in SYSTEM_PROMPT_VARIANTS:
+        raise BadRequest(f"'prompt_variant' must be one of: {', '.join(sorted(SYSTEM_PROMPT_VARIANTS))}")
+    return question.strip(), history, session_id, variant
+
+
+def error_response(status, message):
+    return web.json_response({"error": message}, status=status)
+
+
+class Slot:
+    """One of the API_MAX_CONCURRENCY request slots, or a 503 when none frees up in time"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __aenter__(self):
+        if not self.app[STATE]["ready"]:
+            raise web.HTTPServiceUnavailable(text="Not ready", headers={"Retry-After": "1"})
+        try:
+            await asyncio.wait_for(self.app[SLOTS].acquire(), API_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise web.HTTPServiceUnavailable(text="Too many requests in flight", headers={"Retry-After": "1"})
+        self.app[STATE]["in_flight"] += 1
+
+    async def __aexit__(self, *exc):
+        self.app[STATE]["in_flight"] -= 1
+        self.app[SLOTS].release()
+
+
+async def read_ask(request):
+    try:
+        body = await request.json()
+    except ValueError:
+        raise BadRequest("Body must be JSON")
+    return parse_ask(body)
+
+
+async def load_history(app, history, session_id):
+    """The conversation to answer in: the request's own history, a stored session, or none.
+
+    A request's own history gets the same token-budgeted window as a stored session.
+    """
+    if session_id is not None:
+        pending = app[PENDING].get(session_id)
+        if pending is not None:
+            await asyncio.shield(pending)  # Let the previous turn land first
+        return await asyncio.to_thread(app[STORE].load, session_id)
+    if history:
+        conversation = ConversationHistory()
+        conversation.messages = list(history)
+        return conversation
+    return history
+
+
+async def _store_turn(app, session_id, conversation, previous):
+    if previous is not None:
+        await asyncio.gather(previous, return_exceptions=True)
+    try:
+        await app[ENGINE].acompact_history(conversation)
+    except Exception as e:
+        print(f"⚠️ Could not summarize older turns of session {session_id}: {e}", file=sys.stderr)
+    try:
+        await asyncio.to_thread(app[STORE].save, session_id, conversation)
+    except Exception as e:
+        print(f"⚠️ Could not save session {session_id}: {e}", file=sys.stderr)
+
+
+def save_turn(app, session_id, conversation, question, answer_text):
+    """Append a finished turn to a stored session in the background.
+
+    Summarizing older turns is a model call of its own, so it runs after the
+    answer is sent and outside the request's concurrency slot. The next
+    request on the session waits for it before loading the session.
+    """
+    if session_id is None or not answer_text:
+        return
+    conversation.add_turn(question, answer_text)
+    pending = app[PENDING]
+    task = asyncio.get_running_loop().create_task(
+        _store_turn(app, session_id, conversation, pending.get(session_id))
+    )
+    pending[session_id] = task
+    task.add_done_callback(lambda done: pending.pop(session_id) if pending.get(session_id) is done else None)
+
+
+async def ask(request):
+    """POST /v1/ask: the whole answer as JSON"""
+    app = request.app
+    try:
+        question, history, session_id, variant = await read_ask(request)
+    except BadRequest as e:
+        return error_response(400, str(e))
+
+    async with Slot(app):
+        conversation = await load_history(app, history, session_id)
+        try:
+            answer = await app[ENGINE].aask(question, conversation, variant)
+        except Exception as e:
+            return error_response(502, f"{type(e).__name__}: {e}")
+
+    save_turn(app, session_id, conversation, question, answer.text)
+    return web.json_response({
+        "answer": answer.text,
+        "citations": answer.citations,
+        "finish_reason": answer.finish_reason,
+        "cached": answer.cached,
+        "session": session_id,
+        "metrics": answer.metrics.to_dict() if answer.metrics else None,
+    })
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+
+
+async def ask_stream(request):
+    """POST /v1/ask/stream: text deltas as Server-Sent Events"""
+    app = request.app
+    try:
+        question, history, session_id, variant = await read_ask(request)
+    except BadRequest as e:
+        return error_response(400, str(e))
+
+    async with Slot(app):
+        conversation = await load_history(app, history, session_id)
+        try:
+            response = await app[ENGINE].aask_stream(question, conversation, variant)
+        except Exception as e:
+            return error_response(502, f"{type(e).__name__}: {e}")
+
+        stream = web.StreamResponse(headers={
+            "Content-Type": "text/event-stream",
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # Keep reverse proxies from buffering the stream
+        })
+        await stream.prepare(request)
+        try:
+            async for delta in response:
+                await stream.write(sse_event("delta", {"text": delta}))
+        except ConnectionResetError:
+            await response.aclose()  # The client went away; stop generating for it
+            return stream
+        except Exception as e:
+            await stream.write(sse_event("error", {"error": f"{type(e).__name__}: {e}"}))
+            await stream.write_eof()
+            return stream
+
+        await stream.write(sse_event("done", {
+            "citations": response.citations,
+            "finish_reason": response.finish_reason,
+            "cached": response.cached,
+            "session": session_id,
+            "metrics": response.metrics.to_dict() if response.metrics else None,
+        }))
+        await stream.write_eof()
+    save_turn(app, session_id, conversation, question, response.text)
+    return stream
+
+
+async def healthz(request):
+    return web.json_response({"status": "ok"})
+
+
+async def readyz(request):
+    state = request.app[STATE]
+    body = {"ready": state["ready"], "in_flight": state["in_flight"], "warmup": state.get("warmup")}
+    return web.json_response(body, status=200 if state["ready"] else 503)
+
+
+async def metrics(request):
+    return web.Response(text=REGISTRY.render(), content_type="text/plain", charset="utf-8")
+
+
+async def warm_up(app):
+    """Answer the warm-up questions, then start accepting requests"""
+    print(f"🔥 Warming {len(app[WARMUP])} questions before accepting requests...")
+    try:
+        result = await warm(app[ENGINE], app[WARMUP])
+        app[STATE]["warmup"] = result
+        print(f"✅ Warmed up in {result['seconds']}s: {result['generated']} generated, {result['kept']} kept, "
+              f"{result['failed']} failed, {result['connections']} connections open")
+    except Exception as e:
+        app[STATE]["warmup"] = {"error": f"{type(e).__name__}: {e}"}
+        print(f"⚠️ Warm-up failed, serving cold: {e}", file=sys.stderr)
+    app[STATE]["ready"] = True
+
+
+async def on_startup(app):
+    app[STATE]["started"] = time.time()
+    if app[WARMUP]:
+        # Readiness stays false until warming is done, so no traffic is routed here cold
+        app[STATE]["warmup_task"] = asyncio.get_running_loop().create_task(warm_up(app))
+    else:
+        app[STATE]["ready"] = True
+
+
+async def on_shutdown(app):
+    # aiohttp has already closed the listening sockets when this runs, so no new requests arrive
+    # while in-flight ones drain; readiness is cleared only for whatever still reads the state
+    app[STATE]["ready"] = False
+    task = app[STATE].get("warmup_task")
+    if task and not task.done():
+        task.cancel()
+    print(f"🛑 Draining {app[STATE]['in_flight']} in-flight requests...")
+
+
+async def on_cleanup(app):
+    # Requests have finished; let the turns they are still storing land before the clients close
+    await asyncio.gather(*app[PENDING].values(), return_exceptions=True)
+    await close_async_clients()
+
+
+def create_app(engine, store=None, max_concurrency=API_MAX_CONCURRENCY, warmup=None):
+    """Build the aiohttp application around a RagEngine; ``warmup`` questions are answered before it is ready"""
+    app = web.Application(client_max_size=64 * 1024)
+    app[ENGINE] = engine
+    app[STORE] = store if store is not None else create_conversation_store()
+    app[SLOTS] = asyncio.Semaphore(max_concurrency)
+    app[STATE] = {"ready": False, "in_flight": 0, "started": None, "warmup": None}
+    app[WARMUP] = list(warmup or [])
+    app[PENDING] = {}
+    app.router.add_post("/v1/ask", ask)
+    app.router.add_post("/v1/ask/stream", ask_stream)
+    app.router.add_get("/healthz", healthz)
+    app.router.add_get("/readyz", readyz)
+    app.router.add_get("/metrics", metrics)
+    app.on_startup.append(on_startup)
+    app.on_shutdown.append(on_shutdown)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+def main():
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Serve the zodiac guide over HTTP")
+    parser.add_argument("--host", default=API_HOST, help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=API_PORT, help="Port to listen on")
+    parser.add_argument("--max-concurrency", type=int, default=API_MAX_CONCURRENCY,
+                        help="Requests answered at once")
+    parser.add_argument("--warm", action=argparse.BooleanOptionalAction, default=WARMUP_ON_START,
+                        help="Answer the warm-up questions before reporting ready")
+    parser.add_argument("--prompt-variant", choices=sorted(SYSTEM_PROMPT_VARIANTS),
+                        help="Default system prompt (requests can override it)")
+    args = parser.parse_args()
+
+    from rag_engine import RagEngine, load_environment, MissingConfigError
+    try:
+        config = load_environment()
+    except MissingConfigError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    engine = RagEngine(config, **({"prompt_variant": args.prompt_variant} if args.prompt_variant else {}))
+
+    print(f"🔮 Zodiac API on http://{args.host}:{args.port} "
+          f"({args.max_concurrency} concurrent requests, {engine.retrieval_mode} retrieval)")
+    warmup = warmup_questions() if args.warm else None
+    app = create_app(engine, max_concurrency=args.max_concurrency, warmup=warmup)
+    web.run_app(app, host=args.host, port=args.port, shutdown_timeout=API_SHUTDOWN_TIMEOUT, print=None)
+
+
+if __name__ == "__main__":
+    main()
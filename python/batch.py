@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Batch question answering for Linda Goodman's Zodiac Guide
+Answers a JSONL file of questions concurrently and appends the results to a JSONL file
+
+Each input line is {"id": "...", "question": "..."}; "id" defaults to the line number.
+Re-running with the same output file skips every question already answered.
+"""
+
+import asyncio
+import json
+import os
+import time
+from rate_limit import RateLimiter
+
+
+def read_questions(path):
+    """Read (id, question) pairs from a JSONL file"""
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                item = {"question": item}
+            questions.append((str(item.get("id", line_number)), item["question"]))
+    return questions
+
+
+def completed_ids(path):
+    """IDs already answered successfully in an earlier run"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # A line cut short by an interrupted run
+            if not record.get("error"):
+                done.add(record["id"])
+    return done
+
+
+def _usage_dict(usage):
+    if usage is None:
+        return None
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "total_tokens": usage.total_tokens,
+    }
+
+
+async def run_batch(engine, input_path, output_path, concurrency=8, rpm=None, tpm=None, on_result=None):
+    """Answer every pending question in ``input_path``; returns (answered, failed, skipped)"""
+    questions = read_questions(input_path)
+    done = completed_ids(output_path)
+    pending = [(qid, question) for qid, question in questions if qid not in done]
+
+    semaphore = asyncio.Semaphore(concurrency)
+    limiter = RateLimiter(rpm, tpm)
+    counts = {"answered": 0, "failed": 0}
+
+    with open(output_path, "a", encoding="utf-8") as out:
+        async def answer(qid, question):
+            async with semaphore:
+                estimate = engine.estimate_tokens(question)
+                await limiter.aacquire(estimate)
+                started = time.perf_counter()
+                record = {"id": qid, "question": question}
+                try:
+                    result = await engine.aask(question)
+                    usage = _usage_dict(result.usage)
+                    # Cache hits and local answers use no tokens at all
+                    limiter.refund(estimate - usage["total_tokens"] if usage else estimate)
+                    record.update({
+                        "answer": result.text,
+                        "citations": result.citations,
+                        "cached": result.cached,
+                        "usage": usage,
+                        "metrics": result.metrics.to_dict() if result.metrics else None,
+                    })
+                    counts["answered"] += 1
+                except Exception as e:
+                    record["error"] = f"{type(e).__name__}: {e}"
+                    counts["failed"] += 1
+                record["latency_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+                # Each record is flushed as soon as it completes, so an interrupted run can resume
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                if on_result:
+                    on_result(record)
+
+        await asyncio.gather(*(answer(qid, question) for qid, question in pending))
+
+    return counts["answered"], counts["failed"], len(questions) - len(pending)
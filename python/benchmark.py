@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for Linda Goodman's Zodiac Guide
+Runs N concurrent simulated users against mock Azure endpoints and reports latency as JSON
+
+    python benchmark.py --path cli --users 20 --turns 5 --out bench.json
+    python benchmark.py --path streamlit --mode client --error-rate 0.05
+
+"cli" drives the rag-app.py conversation turn (streamed); "streamlit" drives
+get_zodiac_response from streamlit_app.py. Compare the JSON across commits.
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import json
+import math
+import os
+import pickle
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from mock_azure import MockAzureServer, add_settings_arguments, settings_from_args
+from prompt_registry import SYSTEM_PROMPT_VARIANTS
+
+BENCHMARK_QUESTIONS = [
+    "What are the personality traits of a Leo?",
+    "How compatible are Aries and Libra?",
+    "Tell me about Taurus characteristics",
+    "What are the best matches for a Gemini?",
+    "How do fire signs and water signs interact?",
+    "What does Linda Goodman say about Virgo?",
+    "What is a Scorpio like as a child?",
+    "How does a Capricorn behave at work?",
+]
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def summarize_ms(seconds):
+    """p50/p95/p99/mean/max of a list of durations, in milliseconds"""
+    if not seconds:
+        return None
+    return {
+        "p50": round(percentile(seconds, 50) * 1000, 1),
+        "p95": round(percentile(seconds, 95) * 1000, 1),
+        "p99": round(percentile(seconds, 99) * 1000, 1),
+        "mean": round(sum(seconds) / len(seconds) * 1000, 1),
+        "max": round(max(seconds) * 1000, 1),
+    }
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None  # Not available on Windows
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def _load_rag_app():
+    """Import rag-app.py, whose file name is not a valid module name"""
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rag-app.py")
+    spec = importlib.util.spec_from_file_location("rag_app", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_request_path(path):
+    """Return ``ask(engine, conversation, question) -> (answer text, time to first token)``"""
+    if path == "cli":
+        rag_app = _load_rag_app()
+
+        def ask(engine, conversation, question):
+            started = time.perf_counter()
+            response = rag_app.answer_turn(engine, conversation, question)
+            ttft = (response.first_token_at or time.perf_counter()) - started
+            return response.text, ttft
+        return ask
+
+    if path == "streamlit":
+        import streamlit_app
+
+        def ask(engine, conversation, question):
+            started = time.perf_counter()
+            text = streamlit_app.get_zodiac_response(engine, question, conversation)
+            if text is None:
+                raise RuntimeError("get_zodiac_response returned no answer")
+            ttft = time.perf_counter() - started  # Not streamed: the whole answer arrives at once
+            # Same bookkeeping as the Streamlit chat loop
+            conversation.add_turn(question, text)
+            engine.compact_history(conversation)
+            return text, ttft
+        return ask
+
+    raise ValueError(f"Unknown request path: {path}")
+
+
+def run_benchmark(engine, ask, users=10, turns=5, think_ms=0, questions=BENCHMARK_QUESTIONS):
+    """Run ``users`` concurrent conversations of ``turns`` questions; returns the report dict"""
+    from history import ConversationHistory
+
+    latencies, ttfts, errors = [], [], []
+    conversations = []
+    lock = threading.Lock()
+
+    def simulate_user(user):
+        conversation = ConversationHistory()
+        for turn in range(turns):
+            question = questions[(user + turn) % len(questions)]
+            started = time.perf_counter()
+            try:
+                _, ttft = ask(engine, conversation, question)
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+                    ttfts.append(ttft)
+            except Exception as e:
+                with lock:
+                    errors.append(f"{type(e).__name__}: {e}")
+            if think_ms:
+                time.sleep(think_ms / 1000)
+        with lock:
+            conversations.append(conversation)
+
+    started = time.perf_counter()
+    # The CLI path prints every delta; send it to devnull so the report stays readable
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        with ThreadPoolExecutor(max_workers=users) as pool:
+            list(pool.map(simulate_user, range(users)))
+    duration = time.perf_counter() - started
+
+    session_bytes = [len(pickle.dumps(c)) for c in conversations]
+    return {
+        "users": users,
+        "turns": turns,
+        "requests": len(latencies) + len(errors),
+        "errors": len(errors),
+        "error_samples": sorted(set(errors))[:5],
+        "duration_s": round(duration, 2),
+        "requests_per_s": round(len(latencies) / duration, 2) if duration else None,
+        "latency_ms": summarize_ms(latencies),
+        "ttft_ms": summarize_ms(ttfts),
+        "session_bytes": round(sum(session_bytes) / len(session_bytes)) if session_bytes else None,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def main():
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Benchmark the zodiac guide against mock Azure endpoints")
+    parser.add_argument("--path", choices=["cli", "streamlit"], default="cli", help="Request path to drive")
+    parser.add_argument("--mode", choices=["extension", "client"], default="extension", help="Retrieval mode")
+    parser.add_argument("--users", type=int, default=10, help="Concurrent simulated users")
+    parser.add_argument("--turns", type=int, default=5, help="Questions per user")
+    parser.add_argument("--think-ms", type=float, default=0, help="Pause between a user's questions")
+    parser.add_argument("--prompt-variant", choices=sorted(SYSTEM_PROMPT_VARIANTS), default="full",
+                        help="System prompt variant")
+    parser.add_argument("--cache", action="store_true", help="Keep the response cache on (off by default)")
+    parser.add_argument("--no-tiering", action="store_true", help="Use one model and answer length for every question")
+    parser.add_argument("--out", help="Write the JSON report here as well as to stdout")
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+
+    from embedding_cache import EmbeddingCache
+    from rag_engine import RagEngine
+
+    server = MockAzureServer(settings=settings_from_args(args)).start()
+    print(f"🧪 Mock Azure endpoints on {server.url}", file=sys.stderr)
+    try:
+        engine = RagEngine(
+            server.config(),
+            cache=None if args.cache else False,
+            retrieval_mode=args.mode,
+            prompt_variant=args.prompt_variant,
+            compatibility=False,  # A matrix built against Azure does not apply to the mock
+            warm=False,  # Nor do warmed answers
+            tiering=False if args.no_tiering else None,
+            embedding_cache=EmbeddingCache(path="")  # Keep benchmark runs off the shared disk cache
+        )
+        ask = make_request_path(args.path)
+        print(f"🏃 {args.users} users x {args.turns} turns on the {args.path} path ({args.mode} mode)...",
+              file=sys.stderr)
+        report = run_benchmark(engine, ask, args.users, args.turns, args.think_ms)
+    finally:
+        server.stop()
+
+    report = {
+        "commit": _git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "path": args.path,
+        "mode": args.mode,
+        "prompt": engine.prompt().id,
+        "cache": args.cache,
+        "tiering": not args.no_tiering,
+        "mock": {k: v for k, v in vars(server.settings).items() if k != "random"},
+        "mock_calls": server.stats(),
+        **report,
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+        print(f"💾 Report written to {args.out}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Shared Azure OpenAI client pool for Linda Goodman's Zodiac Guide
+Builds one client per endpoint for the whole process and health-checks it in the background
+"""
+
+import asyncio
+import os
+import threading
+import time
+import weakref
+from openai import AzureOpenAI, AsyncAzureOpenAI
+from rate_limit import AZURE_OPENAI_RPM, AZURE_OPENAI_TPM, RateLimiter
+
+API_VERSION = "2023-12-01-preview"
+
+# How often the background monitor pings the endpoint (seconds)
+HEALTH_CHECK_INTERVAL = int(os.getenv("HEALTH_CHECK_INTERVAL", "300"))
+
+_lock = threading.Lock()
+_clients = {}
+_monitors = {}
+_limiters = {}
+# Async clients hold connections bound to one event loop, so they are pooled per loop
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _client_key(config):
+    """Key clients by endpoint and credentials so different configs never share a client"""
+    return (str(config["openai_endpoint"]), str(config["openai_api_key"]))
+
+
+def get_openai_client(config):
+    """Return the process-wide Azure OpenAI client for this config, creating it on first use"""
+    key = _client_key(config)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            # The client keeps its own HTTP connection pool, so reusing it keeps connections warm
+            client = AzureOpenAI(
+                api_version=API_VERSION,
+                azure_endpoint=str(config["openai_endpoint"]),
+                api_key=str(config["openai_api_key"]),
+                max_retries=0  # Retries go through rate_limit.call_with_retry and the shared limiter
+            )
+            _clients[key] = client
+        return client
+
+
+def get_async_openai_client(config):
+    """Return the async Azure OpenAI client for this config on the running event loop"""
+    loop = asyncio.get_running_loop()
+    key = _client_key(config)
+    with _lock:
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(key)
+        if client is None:
+            client = AsyncAzureOpenAI(
+                api_version=API_VERSION,
+                azure_endpoint=str(config["openai_endpoint"]),
+                api_key=str(config["openai_api_key"]),
+                max_retries=0
+            )
+            clients[key] = client
+        return client
+
+
+async def close_async_clients():
+    """Close the running event loop's async clients and their keep-alive connections"""
+    with _lock:
+        clients = list(_async_clients.pop(asyncio.get_running_loop(), {}).values())
+    for client in clients:
+        await client.close()
+
+
+def get_rate_limiter(config):
+    """Return the rate limiter shared by every caller of this endpoint in the process"""
+    key = _client_key(config)
+    with _lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = RateLimiter(AZURE_OPENAI_RPM, AZURE_OPENAI_TPM)
+            _limiters[key] = limiter
+        return limiter
+
+
+class HealthMonitor:
+    """Periodically checks that the Azure OpenAI endpoint is reachable on a daemon thread"""
+
+    def __init__(self, client, interval=HEALTH_CHECK_INTERVAL):
+        self.client = client
+        self.interval = interval
+        self.healthy = None  # Unknown until the first check completes
+        self.last_checked = None
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="openai-health-monitor", daemon=True)
+
+    def start(self):
+        """Start the background check loop"""
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the background check loop"""
+        self._stop.set()
+
+    def check(self):
+        """Run one health check; listing models is free, unlike a chat completion"""
+        try:
+            self.client.models.list()
+            self.healthy = True
+            self.last_error = None
+        except Exception as e:
+            self.healthy = False
+            self.last_error = str(e)
+        self.last_checked = time.time()
+        return self.healthy
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.check()
+            self._stop.wait(self.interval)
+
+    def status(self):
+        """Return a snapshot of the latest health check"""
+        return {
+            "healthy": self.healthy,
+            "last_checked": self.last_checked,
+            "last_error": self.last_error,
+        }
+
+
+def get_health_monitor(config, interval=HEALTH_CHECK_INTERVAL):
+    """Return the running health monitor for this config's client, starting it on first use"""
+    key = _client_key(config)
+    client = get_openai_client(config)
+    with _lock:
+        monitor = _monitors.get(key)
+        if monitor is None:
+            monitor = HealthMonitor(client, interval).start()
+            _monitors[key] = monitor
+        return monitor
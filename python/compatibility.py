@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Precomputed compatibility matrix for Linda Goodman's Zodiac Guide
+Generates a grounded analysis for each of the 78 sign pairs once and serves pair questions from disk
+
+Build (or refresh) the matrix after changing the index or the prompts:
+    python compatibility.py build [--concurrency 4] [--force]
+    python compatibility.py status
+"""
+
+import argparse
+import asyncio
+import hashlib
+import itertools
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from intent_router import SIGNS
+
+COMPATIBILITY_DB = os.getenv("COMPATIBILITY_DB", "compatibility.db")
+# Bump when the index content changes in a way its statistics do not show
+INDEX_VERSION = os.getenv("INDEX_VERSION", "")
+
+PAIR_QUESTION = ("How compatible are {a} and {b}? Cover love and romance, friendship and working together, "
+                 "with the strengths and challenges of the pairing and advice for making it work.")
+
+PERSONALIZE_PROMPT = """Here is a grounded compatibility analysis of {a} and {b} from the zodiac library. Base your answer on it and tailor it to the question."""
+
+_SIGN_ORDER = {sign.name: i for i, sign in enumerate(SIGNS)}
+
+
+def pair_key(a, b):
+    """Canonical (first, second) order of a pair, so Libra/Aries and Aries/Libra share an entry"""
+    return tuple(sorted((a, b), key=_SIGN_ORDER.__getitem__))
+
+
+def all_pairs():
+    """The 78 unordered sign pairs, including each sign with itself"""
+    return [(a.name, b.name) for a, b in itertools.combinations_with_replacement(SIGNS, 2)]
+
+
+def index_stamp(engine):
+    """Something that changes when the searchable content changes"""
+    if INDEX_VERSION:
+        return INDEX_VERSION
+    if engine.retrieval_mode == "local":
+        try:
+            from local_index import LOCAL_INDEX_PATH
+            stat = os.stat(os.path.join(LOCAL_INDEX_PATH, "vectors.npy"))
+            return f"local:{stat.st_size}:{int(stat.st_mtime)}"
+        except OSError:
+            return "local:missing"
+    try:
+        from azure.core.credentials import AzureKeyCredential
+        from azure.search.documents.indexes import SearchIndexClient
+        client = SearchIndexClient(str(engine.config["search_endpoint"]),
+                                   AzureKeyCredential(str(engine.config["search_api_key"])))
+        stats = client.get_index_statistics(str(engine.config["index_name"]))
+        return f"azure:{stats['document_count']}:{stats['storage_size']}"
+    except Exception:
+        return "azure:unknown"
+
+
+def matrix_version(engine):
+    """Version stamp of the matrix an engine would build: prompt, model, question and index"""
+    prompt = engine.prompt()
+    payload = json.dumps({
+        "prompt": prompt.id,
+        "prompt_sha": prompt.sha,
+        "question": PAIR_QUESTION,
+        "model": engine.config["chat_model"],
+        "mode": engine.retrieval_mode,
+        "index": engine.config["index_name"],
+        "index_stamp": index_stamp(engine),
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class CompatibilityMatrix:
+    """The pair analyses in a SQLite file, loaded into memory (about 78 compressed entries).
+
+    Texts are zlib-compressed; a ``meta`` table records the version stamp
+    the entries were generated under, and ``load`` refuses a stale file.
+    """
+
+    def __init__(self, path=COMPATIBILITY_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS pairs ("
+                "sign_a TEXT NOT NULL, sign_b TEXT NOT NULL, text BLOB NOT NULL, citations TEXT NOT NULL, "
+                "created REAL NOT NULL, PRIMARY KEY (sign_a, sign_b))"
+            )
+            self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._entries = {}
+        for a, b, text, citations in self._db.execute("SELECT sign_a, sign_b, text, citations FROM pairs"):
+            self._entries[(a, b)] = {"text": zlib.decompress(text).decode("utf-8"), "citations": json.loads(citations)}
+
+    @classmethod
+    def load(cls, engine, path=COMPATIBILITY_DB):
+        """Open the matrix for serving, or return None if it is missing or was built for another version"""
+        if not path or not os.path.exists(path):
+            return None
+        matrix = cls(path)
+        if matrix.version != matrix_version(engine):
+            print(f"⚠️ {path} is out of date; rebuild it with: python compatibility.py build", file=sys.stderr)
+            return None
+        return matrix
+
+    @property
+    def version(self):
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return row[0] if row else None
+
+    def reset(self, version):
+        """Drop every entry and start a matrix for a new version"""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM pairs")
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (version,))
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, a, b):
+        """The entry for a pair of sign names, or None"""
+        return self._entries.get(pair_key(a, b))
+
+    def put(self, a, b, text, citations=None):
+        key = pair_key(a, b)
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO pairs (sign_a, sign_b, text, citations, created) VALUES (?, ?, ?, ?, ?)",
+                key + (zlib.compress(text.encode("utf-8")), json.dumps(citations or []), time.time())
+            )
+            self._entries[key] = {"text": text, "citations": citations or []}
+
+    def context_message(self, a, b):
+        """Grounding message that lets the model personalize a stored analysis"""
+        entry = self.get(a, b)
+        intro = PERSONALIZE_PROMPT.format(a=a, b=b)
+        return {"role": "system", "content": f"{intro}\n\n{entry['text']}"}
+
+
+async def build_matrix(engine, path=COMPATIBILITY_DB, concurrency=4, force=False, on_pair=None):
+    """Generate every missing pair through the RAG engine; returns (generated, failed, kept)"""
+    matrix = CompatibilityMatrix(path)
+    version = matrix_version(engine)
+    if force or matrix.version != version:
+        matrix.reset(version)
+
+    pending = [pair for pair in all_pairs() if matrix.get(*pair) is None]
+    semaphore = asyncio.Semaphore(concurrency)
+    counts = {"generated": 0, "failed": 0}
+
+    async def generate(a, b):
+        async with semaphore:
+            try:
+                answer = await engine.aask(PAIR_QUESTION.format(a=a, b=b))
+                if answer.finish_reason != "stop":
+                    raise RuntimeError(f"answer cut short ({answer.finish_reason})")
+                matrix.put(a, b, answer.text, answer.citations)
+                counts["generated"] += 1
+                error = None
+            except Exception as e:
+                counts["failed"] += 1
+                error = f"{type(e).__name__}: {e}"
+            if on_pair:
+                on_pair(a, b, error)
+
+    await asyncio.gather(*(generate(a, b) for a, b in pending))
+    return counts["generated"], counts["failed"], len(all_pairs()) - len(pending)
+
+
+def main():
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Manage the precomputed compatibility matrix")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Generate the missing pairs (all of them after a version change)")
+    build.add_argument("--concurrency", type=int, default=4, help="Pairs generated at once")
+    build.add_argument("--force", action="store_true", help="Regenerate every pair")
+    build.add_argument("--db", default=COMPATIBILITY_DB, help="Matrix file")
+    status = commands.add_parser("status", help="Show whether the matrix is complete and current")
+    status.add_argument("--db", default=COMPATIBILITY_DB, help="Matrix file")
+    args = parser.parse_args()
+
+    from rag_engine import RagEngine, load_environment, MissingConfigError
+    try:
+        config = load_environment()
+    except MissingConfigError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    # Pairs are generated through the plain RAG path, never from the cache or an older matrix
+    engine = RagEngine(config, cache=False, compatibility=False, warm=False)
+
+    if args.command == "status":
+        matrix = CompatibilityMatrix(args.db)
+        current = matrix.version == matrix_version(engine)
+        print(f"📊 {args.db}: {len(matrix)}/{len(all_pairs())} pairs, "
+              f"{'✅ current' if current else '⚠️ out of date'}")
+        return
+
+    print(f"🔮 Building the compatibility matrix in {args.db}...")
+
+    def report(a, b, error):
+        print(f"{'❌' if error else '✅'} {a} + {b}" + (f": {error}" if error else ""))
+
+    generated, failed, kept = asyncio.run(build_matrix(engine, args.db, args.concurrency, args.force, report))
+    print(f"\n🎉 Generated {generated}, failed {failed}, kept {kept} up-to-date pairs")
+    if failed:
+        print("🔁 Run the same command again to retry the failed pairs.")
+
+
+if __name__ == "__main__":
+    main()
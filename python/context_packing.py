@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Context packing for Linda Goodman's Zodiac Guide
+Deduplicates, trims and token-budgets the retrieved passages before they go into the prompt
+"""
+
+import hashlib
+import os
+import re
+import numpy as np
+from history import count_tokens
+from rerank import content_terms
+from retrieval import Passage
+
+CONTEXT_PACKING = os.getenv("CONTEXT_PACKING", "on").lower() not in ("off", "0", "false", "no")
+# Tokens the retrieved excerpts may take up in the prompt
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+# Estimated shingle overlap (Jaccard) above which a passage repeats an earlier one
+CONTEXT_DEDUPE_THRESHOLD = float(os.getenv("CONTEXT_DEDUPE_THRESHOLD", "0.8"))
+# Passages scoring below this fraction of the best passage's score are dropped (0 keeps all)
+CONTEXT_MIN_SCORE_RATIO = float(os.getenv("CONTEXT_MIN_SCORE_RATIO", "0.5"))
+# Keep only the sentences of each passage that share words with the question
+CONTEXT_SENTENCES = os.getenv("CONTEXT_SENTENCES", "off").lower() in ("on", "1", "true", "yes")
+
+SHINGLE_WORDS = 5
+MINHASH_PERMUTATIONS = 64
+# Smallest remainder of the budget worth filling with part of a passage
+MIN_EXCERPT_TOKENS = 40
+
+_MERSENNE_PRIME = (1 << 31) - 1
+_WORD_PATTERN = re.compile(r"\w+")
+_SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+")
+
+
+def split_sentences(text):
+    return [s for s in _SENTENCE_PATTERN.split(text.strip()) if s]
+
+
+def _sentence_key(sentence):
+    return " ".join(_WORD_PATTERN.findall(sentence.lower()))
+
+
+def _excerpt_tokens(passage):
+    """Tokens a passage takes up in the grounding message, header included"""
+    return count_tokens(f"[doc0] ({passage.title or ''})\n{passage.content}")
+
+
+class MinHasher:
+    """MinHash signatures of word shingles, for estimating how much two texts overlap"""
+
+    def __init__(self, permutations=MINHASH_PERMUTATIONS, shingle_words=SHINGLE_WORDS, seed=0):
+        rng = np.random.default_rng(seed)
+        self.a = rng.integers(1, _MERSENNE_PRIME, permutations, dtype=np.uint64)
+        self.b = rng.integers(0, _MERSENNE_PRIME, permutations, dtype=np.uint64)
+        self.shingle_words = shingle_words
+
+    def shingles(self, text):
+        """31-bit hashes of the text's overlapping word n-grams"""
+        words = _WORD_PATTERN.findall(text.lower())
+        size = self.shingle_words
+        grams = {" ".join(words[i:i + size]) for i in range(max(len(words) - size + 1, 1))}
+        return np.array([int.from_bytes(hashlib.blake2b(gram.encode("utf-8"), digest_size=4).digest(), "little")
+                         & _MERSENNE_PRIME for gram in grams], dtype=np.uint64)
+
+    def signature(self, text):
+        hashes = self.shingles(text)
+        return ((np.outer(hashes, self.a) + self.b) % _MERSENNE_PRIME).min(axis=0)
+
+    @staticmethod
+    def similarity(first, second):
+        """Estimated Jaccard similarity of the texts behind two signatures"""
+        return float(np.mean(first == second))
+
+
+class ContextPacker:
+    """Turns ranked passages into the excerpts that fit the prompt.
+
+    In rank order: drops the tail scoring well below the best retrieval
+    score (passages without one, like hybrid search results, are kept),
+    passages that repeat an earlier one (MinHash over word shingles) and
+    sentences already sent in an earlier passage, which is how overlapping
+    chunks of the same pages show up.
+    ``sentences`` further keeps only the sentences sharing words with the
+    question. What is left is packed into ``token_budget`` tokens, cutting
+    the last passage at a sentence boundary. ``pack`` reports the tokens
+    saved along with the passages.
+    """
+
+    def __init__(self, token_budget=CONTEXT_TOKEN_BUDGET, dedupe_threshold=CONTEXT_DEDUPE_THRESHOLD,
+                 min_score_ratio=CONTEXT_MIN_SCORE_RATIO, sentences=CONTEXT_SENTENCES):
+        self.token_budget = token_budget
+        self.dedupe_threshold = dedupe_threshold
+        self.min_score_ratio = min_score_ratio
+        self.sentences = sentences
+        self.hasher = MinHasher()
+
+    def _above_tail(self, passages):
+        # Retrieval scores only: fused rank scores halve for a passage found by one ranking of two
+        scores = [p.score for p in passages if p.score is not None]
+        if not scores or not self.min_score_ratio or max(scores) <= 0:
+            return passages
+        cutoff = max(scores) * self.min_score_ratio
+        return [p for i, p in enumerate(passages) if i == 0 or p.score is None or p.score >= cutoff]
+
+    def _relevant_sentences(self, question, sentences):
+        query = set(content_terms(question))
+        relevant = [s for s in sentences if query.intersection(content_terms(s))]
+        return relevant or sentences  # Retrieved for its meaning, not its words; keep it whole
+
+    def pack(self, question, passages):
+        """Return (packed passages, report) for passages in rank order"""
+        report = {
+            "passages_in": len(passages),
+            "tokens_in": sum(_excerpt_tokens(p) for p in passages),
+            "low_score": 0,
+            "duplicates": 0,
+            "over_budget": 0,
+        }
+        candidates = self._above_tail(passages)
+        report["low_score"] = len(passages) - len(candidates)
+
+        packed, signatures, seen, used = [], [], set(), 0
+        for passage in candidates:
+            signature = self.hasher.signature(passage.content)
+            if any(self.hasher.similarity(signature, other) >= self.dedupe_threshold for other in signatures):
+                report["duplicates"] += 1
+                continue
+            signatures.append(signature)
+
+            sentences = [s for s in split_sentences(passage.content) if _sentence_key(s) not in seen]
+            if not sentences:
+                report["duplicates"] += 1
+                continue
+            if self.sentences:
+                sentences = self._relevant_sentences(question, sentences)
+
+            excerpt = Passage(" ".join(sentences), passage.title, passage.score, passage.id, passage.url,
+                              passage.filepath, passage.metadata)
+            excerpt.fused_score = passage.fused_score
+            tokens = _excerpt_tokens(excerpt)
+            cut = False
+            while used + tokens > self.token_budget and len(sentences) > 1:
+                sentences, cut = sentences[:-1], True
+                excerpt.content = " ".join(sentences)
+                tokens = _excerpt_tokens(excerpt)
+            if used + tokens > self.token_budget or (cut and tokens < MIN_EXCERPT_TOKENS):
+                report["over_budget"] += 1
+                continue
+            seen.update(_sentence_key(s) for s in sentences)
+            packed.append(excerpt)
+            used += tokens
+
+        report.update(passages_out=len(packed), tokens_out=used, tokens_saved=report["tokens_in"] - used)
+        return packed, report
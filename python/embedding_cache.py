@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Query embedding cache for Linda Goodman's Zodiac Guide
+Keeps recent embeddings in an in-memory LRU in front of an optional SQLite store that survives restarts
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from response_cache import normalize_question
+
+# SQLite file shared by every process on the host; empty (the default) keeps embeddings in memory only
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "")
+# Embeddings kept in each process's memory
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+
+
+def embedding_key(text, model):
+    """Key an embedding on the model and the normalized text"""
+    payload = f"{model}\x1f{normalize_question(text)}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Two-level embedding cache: a per-process LRU and an optional on-disk store.
+
+    Vectors are stored on disk as packed float32, about 6 KB for a
+    1536-dimension embedding. The SQLite file runs in WAL mode so several
+    Streamlit or API worker processes can read and write it concurrently.
+    """
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH, max_entries=EMBEDDING_CACHE_SIZE):
+        self.path = path
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        if path:
+            with self._connect() as db:
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings ("
+                    "key TEXT PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL)"
+                )
+
+    def _connect(self):
+        # sqlite3 connections cannot be shared across threads, so keep one per thread
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+
+    def _remember(self, key, vector):
+        with self._lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, text, model):
+        """Return the cached embedding, or None"""
+        key = embedding_key(text, model)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                return vector
+
+        if not self.path:
+            return None
+        row = self._connect().execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        vector = array("f", row[0]).tolist()
+        self._remember(key, vector)
+        return vector
+
+    def put(self, text, model, vector):
+        """Cache an embedding in memory and on disk"""
+        key = embedding_key(text, model)
+        vector = list(vector)
+        self._remember(key, vector)
+        if self.path:
+            with self._connect() as db:
+                db.execute(
+                    "INSERT OR REPLACE INTO embeddings (key, model, vector) VALUES (?, ?, ?)",
+                    (key, model, array("f", vector).tobytes())
+                )
+
+
+def create_embedding_cache():
+    """Build the embedding cache described by the EMBEDDING_CACHE_* environment variables"""
+    return EmbeddingCache(os.getenv("EMBEDDING_CACHE_PATH", EMBEDDING_CACHE_PATH),
+                          int(os.getenv("EMBEDDING_CACHE_SIZE", str(EMBEDDING_CACHE_SIZE))))
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Facets for Linda Goodman's Zodiac Guide
+Tags chunks with the signs, elements, modalities and life stages they cover, and turns the
+ones a question asks about into a search filter
+"""
+
+import os
+import re
+from intent_router import SIGNS, find_signs
+
+# Restrict retrieval to the chunks tagged with the facets a question names
+FACET_FILTER = os.getenv("FACET_FILTER", "on").lower() not in ("off", "0", "false", "no")
+# Filtered searches returning fewer passages than this are repeated without the filter
+FACET_MIN_RESULTS = int(os.getenv("FACET_MIN_RESULTS", "3"))
+
+# Index fields (collections of strings) holding the facets of a chunk
+FACET_FIELDS = ("signs", "elements", "modalities", "life_stages")
+# Facets that name what a chunk is about; a chunk matches a question if it shares any of them
+SUBJECT_FACETS = ("signs", "elements", "modalities")
+
+LIFE_STAGES = {
+    "child": {"child", "children", "kid", "kids", "baby", "babies", "son", "daughter", "toddler", "teen",
+              "teens", "teenager", "teenagers", "youngster"},
+    "woman": {"woman", "women", "wife", "girlfriend", "girl", "lady", "female"},
+    "man": {"man", "men", "husband", "boyfriend", "guy", "male"},
+    "employee": {"employee", "employees", "worker", "workers", "coworker", "colleague", "colleagues", "staff",
+                 "subordinate"},
+    "boss": {"boss", "bosses", "employer", "employers", "manager", "managers", "supervisor", "executive"},
+}
+_ELEMENTS = sorted({sign.element for sign in SIGNS})
+_MODALITIES = sorted({sign.modality for sign in SIGNS})
+_GROUP_MARKERS = {"sign", "signs", "element", "elements", "triplicity", "quality", "modality"}
+_WORD_PATTERN = re.compile(r"[a-z]+")
+# Mentions of a life stage in a chunk's text, beyond its title, that make it about that stage
+_LIFE_STAGE_MIN_MENTIONS = 2
+
+
+def _life_stages(words, min_mentions=1):
+    return [stage for stage, stage_words in LIFE_STAGES.items()
+            if sum(word in stage_words for word in words) >= min_mentions]
+
+
+def _groups(words):
+    """Elements and modalities named as groups ("fire signs", "the fixed quality")"""
+    if not _GROUP_MARKERS.intersection(words):
+        return [], []
+    return ([e for e in _ELEMENTS if e.lower() in words], [m for m in _MODALITIES if m.lower() in words])
+
+
+def tag_chunk(title, content):
+    """The facets of a chunk: the signs it mentions with their elements and modalities, the groups it
+    names and the life stages its title names (or, failing that, its text keeps returning to)"""
+    text = f"{title or ''}\n{content}"
+    words = _WORD_PATTERN.findall(text.lower())
+    signs = find_signs(text)
+    elements, modalities = _groups(words)
+    stages = _life_stages(_WORD_PATTERN.findall((title or "").lower()))
+    return {
+        "signs": [sign.name for sign in signs],
+        "elements": sorted(set(elements) | {sign.element for sign in signs}),
+        "modalities": sorted(set(modalities) | {sign.modality for sign in signs}),
+        "life_stages": stages or _life_stages(words, _LIFE_STAGE_MIN_MENTIONS),
+    }
+
+
+class QueryFacets:
+    """The facets a question asks about.
+
+    A chunk matches when it shares a subject (sign, element or modality)
+    with the question, and a life stage too if the question names one.
+    """
+
+    def __init__(self, signs=(), elements=(), modalities=(), life_stages=()):
+        self.values = {"signs": list(signs), "elements": list(elements), "modalities": list(modalities),
+                       "life_stages": list(life_stages)}
+
+    @classmethod
+    def from_question(cls, question):
+        words = _WORD_PATTERN.findall(question.lower())
+        elements, modalities = _groups(words)
+        return cls([sign.name for sign in find_signs(question)], elements, modalities, _life_stages(words))
+
+    def __bool__(self):
+        return any(self.values.values())
+
+    def odata(self, fields=FACET_FIELDS):
+        """The Azure Search filter expression, over the facet ``fields`` the index has"""
+        subjects = [f"{name}/any(v: search.in(v, '{','.join(self.values[name])}', ','))"
+                    for name in SUBJECT_FACETS if self.values[name] and name in fields]
+        clauses = [f"({' or '.join(subjects)})"] if subjects else []
+        if self.values["life_stages"] and "life_stages" in fields:
+            clauses.append(f"life_stages/any(v: search.in(v, '{','.join(self.values['life_stages'])}', ','))")
+        return " and ".join(clauses) or None
+
+    def matches(self, facets):
+        """Whether a chunk with these facets (a tag_chunk dict) passes the filter"""
+        subjects = [name for name in SUBJECT_FACETS if self.values[name]]
+        if subjects and not any(set(self.values[name]) & set(facets.get(name) or ()) for name in subjects):
+            return False
+        stages = self.values["life_stages"]
+        return not stages or bool(set(stages) & set(facets.get("life_stages") or ()))
+
+    def to_dict(self):
+        return {name: values for name, values in self.values.items() if values}
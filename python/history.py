@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Conversation history for Linda Goodman's Zodiac Guide
+Keeps recent turns verbatim within a token budget and folds older turns into a rolling summary
+"""
+
+import os
+
+# Token budget for the verbatim part of the history sent with each request
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "3000"))
+# Maximum number of user/assistant turns kept verbatim
+HISTORY_MAX_TURNS = int(os.getenv("HISTORY_MAX_TURNS", "6"))
+
+# Per-message overhead of the chat format (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_encoding = None
+
+
+def _get_encoding():
+    """Load the local tokenizer once; returns None when tiktoken is unavailable"""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _encoding = False
+    return _encoding or None
+
+
+def count_tokens(text):
+    """Count tokens with tiktoken, falling back to a 4-characters-per-token estimate"""
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text))
+    return len(text) // 4 + 1
+
+
+def count_message_tokens(messages):
+    """Count the tokens a list of chat messages adds to a request"""
+    return sum(count_tokens(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+class ConversationHistory:
+    """The transcript of one conversation plus the window that is sent to the model.
+
+    ``messages`` holds every user/assistant message for display. Requests only
+    carry the most recent turns that fit in ``token_budget``, preceded by a
+    summary of everything older. ``compact`` folds newly evicted turns into that
+    summary incrementally, so each turn is summarized exactly once.
+
+    A history loaded from a ConversationStore holds only the messages not yet
+    in the summary; ``offset`` counts the earlier ones left in the store.
+    """
+
+    def __init__(self, token_budget=HISTORY_TOKEN_BUDGET, max_turns=HISTORY_MAX_TURNS):
+        self.token_budget = token_budget
+        self.max_turns = max_turns
+        self.messages = []
+        self.summary = ""
+        self.summarized_upto = 0  # Messages before this index are covered by the summary
+        self.offset = 0  # Earlier messages of the conversation that are not loaded
+
+    def add_turn(self, user_message, assistant_message):
+        """Record a completed question and answer"""
+        self.messages.append({"role": "user", "content": user_message})
+        self.messages.append({"role": "assistant", "content": assistant_message})
+
+    def clear(self):
+        self.messages = []
+        self.summary = ""
+        self.summarized_upto = 0
+        self.offset = 0
+
+    def _window_start(self):
+        """Index of the oldest message that is still sent verbatim"""
+        start = max(len(self.messages) - self.max_turns * 2, self.summarized_upto)
+        # Drop whole turns from the front until the window fits, but always keep the last turn
+        while start < len(self.messages) - 2 and count_message_tokens(self.messages[start:]) > self.token_budget:
+            start += 2
+        return start
+
+    def request_messages(self):
+        """Messages to send before the new question: the summary, then the verbatim window"""
+        messages = []
+        if self.summary:
+            messages.append({
+                "role": "system",
+                "content": f"Summary of the earlier conversation:\n{self.summary}"
+            })
+        messages.extend(self.messages[self._window_start():])
+        return messages
+
+    def pending_messages(self):
+        """Messages that have left the window but are not yet in the summary"""
+        return self.messages[self.summarized_upto:self._window_start()]
+
+    def compact(self, summarize):
+        """Fold evicted turns into the summary with ``summarize(summary, messages) -> str``"""
+        start = self._window_start()
+        pending = self.messages[self.summarized_upto:start]
+        if pending:
+            self.summary = summarize(self.summary, pending)
+            self.summarized_upto = start
+
+    async def acompact(self, summarize):
+        """Async ``compact`` for an awaitable ``summarize``"""
+        start = self._window_start()
+        pending = self.messages[self.summarized_upto:start]
+        if pending:
+            self.summary = await summarize(self.summary, pending)
+            self.summarized_upto = start
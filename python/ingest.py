@@ -0,0 +1,486 @@
+#!/usr/bin/env python3
+"""
+Corpus ingestion for Linda Goodman's Zodiac Guide
+Chunks, embeds and uploads source documents (PDF, text, markdown) to the search index
+
+    python ingest.py run --source books/ [--target azure|local] [--concurrency 4] [--force]
+    python ingest.py status --source books/
+
+A manifest records every file's content hash and the chunks it produced, so
+re-runs only embed and upload the files that changed and delete the chunks
+of files that were removed. Every chunk is tagged with its facets (signs,
+elements, modalities, life stages) for filtered retrieval. PDFs need
+``pip install pypdf``.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from context_packing import split_sentences
+from facets import FACET_FIELDS, tag_chunk
+from history import count_tokens
+
+INGEST_MANIFEST = os.getenv("INGEST_MANIFEST", "ingest_manifest.json")
+INGEST_CHUNK_TOKENS = int(os.getenv("INGEST_CHUNK_TOKENS", "400"))
+# Tokens of the end of each chunk repeated at the start of the next, so no passage loses its context
+INGEST_CHUNK_OVERLAP = int(os.getenv("INGEST_CHUNK_OVERLAP", "50"))
+# Chunks per embeddings request, and embeddings requests in flight
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "16"))
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "4"))
+
+SOURCE_EXTENSIONS = (".pdf", ".txt", ".md", ".markdown")
+# Documents per Azure Search upload request
+UPLOAD_BATCH_SIZE = 500
+VECTOR_PROFILE = "zodiac-vector-profile"
+
+_HEADING_PATTERN = re.compile(r"^#{1,6}\s+(.+?)\s*#*\s*$")
+_PARAGRAPH_PATTERN = re.compile(r"\n\s*\n")
+
+
+def source_files(root):
+    """Supported documents under a file or directory, as (path, path relative to the root)"""
+    if os.path.isfile(root):
+        return [(root, os.path.basename(root))]
+    files = []
+    for folder, _, names in os.walk(root):
+        for name in sorted(names):
+            if name.lower().endswith(SOURCE_EXTENSIONS):
+                path = os.path.join(folder, name)
+                files.append((path, os.path.relpath(path, root).replace(os.sep, "/")))
+    return sorted(files, key=lambda item: item[1])
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_document(path):
+    """The text of a document; PDF pages are separated like paragraphs"""
+    if path.lower().endswith(".pdf"):
+        try:
+            from pypdf import PdfReader
+        except ImportError:
+            raise RuntimeError("reading PDFs needs pypdf: pip install pypdf")
+        return "\n\n".join(page.extract_text() or "" for page in PdfReader(path).pages)
+    with open(path, encoding="utf-8", errors="replace") as f:
+        return f.read()
+
+
+def _document_title(rel_path):
+    stem = os.path.splitext(os.path.basename(rel_path))[0]
+    return re.sub(r"[_-]+", " ", stem).strip().title()
+
+
+def _sections(text, rel_path):
+    """(title, paragraphs) per markdown section; other documents are one section"""
+    title, paragraphs = _document_title(rel_path), []
+    markdown = rel_path.lower().endswith((".md", ".markdown"))
+    for block in _PARAGRAPH_PATTERN.split(text):
+        lines = [line for line in block.strip().splitlines() if line.strip()]
+        if not lines:
+            continue
+        heading = _HEADING_PATTERN.match(lines[0]) if markdown else None
+        if heading:
+            if paragraphs:
+                yield title, paragraphs
+            title, paragraphs = heading.group(1), []
+            lines = lines[1:]
+        if lines:
+            paragraphs.append(" ".join(line.strip() for line in lines))
+    if paragraphs:
+        yield title, paragraphs
+
+
+def chunk_document(text, rel_path, chunk_tokens=INGEST_CHUNK_TOKENS, overlap=INGEST_CHUNK_OVERLAP):
+    """Split a document into chunks of about ``chunk_tokens`` tokens along paragraphs and sentences.
+
+    Markdown headings start a new chunk and become its title. Each chunk
+    repeats up to ``overlap`` tokens of the end of the one before.
+    """
+    chunks = []
+    for title, paragraphs in _sections(text, rel_path):
+        units = []
+        for paragraph in paragraphs:
+            if count_tokens(paragraph) <= chunk_tokens:
+                units.append(paragraph)
+            else:
+                units.extend(split_sentences(paragraph))
+        current, size = [], 0
+        for unit in units:
+            tokens = count_tokens(unit)
+            if current and size + tokens > chunk_tokens:
+                chunks.append({"title": title, "content": "\n\n".join(current)})
+                carried, carried_size = [], 0
+                for previous in reversed(current):
+                    previous_size = count_tokens(previous)
+                    if carried_size + previous_size > overlap:
+                        break
+                    carried.insert(0, previous)
+                    carried_size += previous_size
+                current, size = carried, carried_size
+            current.append(unit)
+            size += tokens
+        if current:
+            chunks.append({"title": title, "content": "\n\n".join(current)})
+    return chunks
+
+
+def chunk_id(rel_path, chunk):
+    """Key derived from a chunk's file and content, so unchanged chunks keep theirs across runs"""
+    payload = "\n".join((rel_path, chunk["title"] or "", chunk["content"]))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+class Manifest:
+    """What has been ingested into one target: per file, its size, mtime, content hash and chunk ids"""
+
+    def __init__(self, path=INGEST_MANIFEST):
+        self.path = path
+        self.target = None
+        self.embedding_model = None
+        self.files = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            self.target = data.get("target")
+            self.embedding_model = data.get("embedding_model")
+            self.files = data.get("files", {})
+
+    def matches(self, target, embedding_model):
+        return self.target == target and self.embedding_model == embedding_model
+
+    def reset(self, target, embedding_model):
+        """Forget everything, for a new target or embedding model"""
+        self.target, self.embedding_model, self.files = target, embedding_model, {}
+
+    def unchanged(self, path, rel_path):
+        """Whether a file is as ingested: same size and mtime, or failing that the same content"""
+        entry = self.files.get(rel_path)
+        if entry is None:
+            return False
+        stat = os.stat(path)
+        if entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+            return True
+        if entry["size"] == stat.st_size and entry["sha256"] == file_hash(path):
+            entry["mtime"] = stat.st_mtime  # Touched but not edited
+            return True
+        return False
+
+    def record(self, path, rel_path, sha256, ids):
+        stat = os.stat(path)
+        self.files[rel_path] = {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": sha256, "chunks": ids}
+
+    def save(self):
+        """Write the manifest atomically, so an interrupted run never leaves it half written"""
+        temp = self.path + ".tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump({"target": self.target, "embedding_model": self.embedding_model, "files": self.files}, f,
+                      indent=1, sort_keys=True)
+        os.replace(temp, self.path)
+
+    def chunk_count(self):
+        return sum(len(entry["chunks"]) for entry in self.files.values())
+
+
+def plan(manifest, files):
+    """(changed files, removed file paths) of a source tree against the manifest"""
+    changed = [(path, rel) for path, rel in files if not manifest.unchanged(path, rel)]
+    present = {rel for _, rel in files}
+    return changed, sorted(rel for rel in manifest.files if rel not in present)
+
+
+class AzureSearchTarget:
+    """Uploads chunks to the Azure Search index, creating it on first use.
+    Facets are uploaded to the facet fields the index has."""
+
+    def __init__(self, config):
+        from azure.core.credentials import AzureKeyCredential
+        from azure.search.documents import SearchClient
+
+        self.config = config
+        self.credential = AzureKeyCredential(str(config["search_api_key"]))
+        self.client = SearchClient(str(config["search_endpoint"]), str(config["index_name"]), self.credential)
+        self.name = f"azure:{config['search_endpoint']}/{config['index_name']}"
+        self.facet_fields = set()
+
+    def ensure_index(self, dimensions):
+        """Create the index with a vector field of ``dimensions`` if it does not exist yet"""
+        from azure.core.exceptions import ResourceNotFoundError
+        from azure.search.documents.indexes import SearchIndexClient
+        from azure.search.documents.indexes.models import (
+            HnswAlgorithmConfiguration, SearchableField, SearchField, SearchFieldDataType, SearchIndex,
+            SimpleField, VectorSearch, VectorSearchProfile
+        )
+        from retrieval import (SEARCH_CONTENT_FIELD, SEARCH_FILEPATH_FIELD, SEARCH_KEY_FIELD, SEARCH_TITLE_FIELD,
+                               SEARCH_VECTOR_FIELD)
+
+        indexes = SearchIndexClient(str(self.config["search_endpoint"]), self.credential)
+        try:
+            index = indexes.get_index(str(self.config["index_name"]))
+            self.facet_fields = set(FACET_FIELDS) & {field.name for field in index.fields}
+            return False
+        except ResourceNotFoundError:
+            pass
+        fields = [
+            SimpleField(name=SEARCH_KEY_FIELD, type=SearchFieldDataType.String, key=True, filterable=True),
+            SearchableField(name=SEARCH_CONTENT_FIELD),
+            SearchableField(name=SEARCH_TITLE_FIELD),
+            SearchField(name=SEARCH_VECTOR_FIELD, type=SearchFieldDataType.Collection(SearchFieldDataType.Single),
+                        searchable=True, vector_search_dimensions=dimensions,
+                        vector_search_profile_name=VECTOR_PROFILE),
+        ]
+        if SEARCH_FILEPATH_FIELD:
+            fields.append(SimpleField(name=SEARCH_FILEPATH_FIELD, type=SearchFieldDataType.String, filterable=True))
+        fields += [SimpleField(name=name, type=SearchFieldDataType.Collection(SearchFieldDataType.String),
+                               filterable=True, facetable=True) for name in FACET_FIELDS]
+        indexes.create_index(SearchIndex(
+            name=str(self.config["index_name"]),
+            fields=fields,
+            vector_search=VectorSearch(
+                algorithms=[HnswAlgorithmConfiguration(name="zodiac-hnsw")],
+                profiles=[VectorSearchProfile(name=VECTOR_PROFILE, algorithm_configuration_name="zodiac-hnsw")],
+            ),
+        ))
+        self.facet_fields = set(FACET_FIELDS)
+        return True
+
+    def _document(self, chunk):
+        from retrieval import (SEARCH_CONTENT_FIELD, SEARCH_FILEPATH_FIELD, SEARCH_KEY_FIELD, SEARCH_TITLE_FIELD,
+                               SEARCH_VECTOR_FIELD)
+
+        document = {
+            SEARCH_KEY_FIELD: chunk["id"],
+            SEARCH_CONTENT_FIELD: chunk["content"],
+            SEARCH_TITLE_FIELD: chunk["title"],
+            SEARCH_VECTOR_FIELD: chunk["vector"],
+        }
+        if SEARCH_FILEPATH_FIELD:
+            document[SEARCH_FILEPATH_FIELD] = chunk["filepath"]
+        for name in self.facet_fields:
+            document[name] = chunk["facets"][name]
+        return document
+
+    def upload(self, chunks):
+        """Add or replace chunks, in bulk requests"""
+        for start in range(0, len(chunks), UPLOAD_BATCH_SIZE):
+            batch = [self._document(chunk) for chunk in chunks[start:start + UPLOAD_BATCH_SIZE]]
+            failed = [r.key for r in self.client.merge_or_upload_documents(documents=batch) if not r.succeeded]
+            if failed:
+                raise RuntimeError(f"{len(failed)} chunks were not indexed, e.g. {failed[0]}")
+
+    def delete(self, ids):
+        from retrieval import SEARCH_KEY_FIELD
+
+        for start in range(0, len(ids), UPLOAD_BATCH_SIZE):
+            batch = [{SEARCH_KEY_FIELD: i} for i in ids[start:start + UPLOAD_BATCH_SIZE]]
+            self.client.delete_documents(documents=batch)
+
+    def finish(self):
+        pass
+
+
+class LocalIndexTarget:
+    """Collects the changes to a local index directory and rewrites it once at the end"""
+
+    def __init__(self, path, dtype=None, ivf_lists=0):
+        self.path = path
+        self.dtype = dtype
+        self.ivf_lists = ivf_lists
+        self.name = f"local:{os.path.abspath(path)}"
+        self._added = []
+        self._deleted = set()
+
+    def exists(self):
+        return os.path.exists(os.path.join(self.path, "chunks.jsonl"))
+
+    def ensure_index(self, dimensions):
+        return False
+
+    def upload(self, chunks):
+        self._added.extend(chunks)
+
+    def delete(self, ids):
+        self._deleted.update(ids)
+
+    def finish(self):
+        """Write the index with the deleted and replaced rows dropped and the new ones appended"""
+        import numpy as np
+        from local_index import LocalVectorIndex
+
+        if not self._added and not self._deleted:
+            return
+        replaced = self._deleted | {chunk["id"] for chunk in self._added}
+        vectors, chunks, ivf_lists = [], [], self.ivf_lists
+        if self.exists():
+            index = LocalVectorIndex.load(self.path)
+            keep = [row for row, chunk in enumerate(index.chunks) if chunk.get("id") not in replaced]
+            vectors.append(np.array(index.vectors[keep], dtype=np.float32))
+            chunks = [index.chunks[row] for row in keep]
+            self.dtype = self.dtype or str(index.vectors.dtype)
+            ivf_lists = ivf_lists or (len(index.centroids) if index.centroids is not None else 0)
+        if self._added:
+            vectors.append(np.array([chunk["vector"] for chunk in self._added], dtype=np.float32))
+            chunks += [{key: chunk[key] for key in ("id", "title", "content", "filepath", "facets")}
+                       for chunk in self._added]
+        matrix = np.concatenate(vectors) if vectors else np.empty((0, 0), dtype=np.float32)
+        LocalVectorIndex.save(self.path, matrix, chunks, self.dtype or "float32", min(ivf_lists, len(chunks)))
+
+
+async def ingest(engine, target, manifest, files, batch_size=INGEST_BATCH_SIZE, concurrency=INGEST_CONCURRENCY,
+                 force=False, on_file=None):
+    """Embed and upload the chunks of every changed file and delete those of removed files.
+
+    Returns a report with the counts and how long ingestion took. Files are
+    recorded in the manifest only once their chunks are uploaded, so a
+    failed run is retried from where it stopped.
+    """
+    started = time.perf_counter()
+    model = engine.config["embedding_model"]
+    if force or not manifest.matches(target.name, model):
+        manifest.reset(target.name, model)
+    changed, removed = plan(manifest, files)
+    report = {"files": len(files), "changed": len(changed), "removed": len(removed), "unchanged": 0,
+              "chunks_embedded": 0, "chunks_kept": 0, "chunks_deleted": 0, "failed": 0}
+    report["unchanged"] = len(files) - len(changed)
+
+    requests = asyncio.Semaphore(concurrency)
+    files_at_once = asyncio.Semaphore(concurrency)
+    index_ready = asyncio.Lock()
+    index_checked = []
+
+    async def embed(batch):
+        async with requests:
+            vectors = await engine.aembed_many([chunk["content"] for chunk in batch], cache=False)
+        for chunk, vector in zip(batch, vectors):
+            chunk["vector"] = vector
+
+    async def ingest_file(path, rel):
+        async with files_at_once:
+            try:
+                sha256 = await asyncio.to_thread(file_hash, path)
+                text = await asyncio.to_thread(read_document, path)
+                chunks = {}
+                for chunk in chunk_document(text, rel):
+                    chunk["id"], chunk["filepath"] = chunk_id(rel, chunk), rel
+                    chunk["facets"] = tag_chunk(chunk["title"], chunk["content"])
+                    chunks.setdefault(chunk["id"], chunk)
+                old = set(manifest.files.get(rel, {}).get("chunks", []))
+                new = [chunk for chunk in chunks.values() if chunk["id"] not in old]
+                await asyncio.gather(*(embed(new[i:i + batch_size]) for i in range(0, len(new), batch_size)))
+                if new:
+                    async with index_ready:
+                        if not index_checked:
+                            index_checked.append(await asyncio.to_thread(target.ensure_index, len(new[0]["vector"])))
+                    await asyncio.to_thread(target.upload, new)
+                stale = sorted(old - set(chunks))
+                if stale:
+                    await asyncio.to_thread(target.delete, stale)
+                manifest.record(path, rel, sha256, list(chunks))
+                report["chunks_embedded"] += len(new)
+                report["chunks_kept"] += len(chunks) - len(new)
+                report["chunks_deleted"] += len(stale)
+                error = None
+            except Exception as e:
+                report["failed"] += 1
+                error = f"{type(e).__name__}: {e}"
+            if on_file:
+                on_file(rel, len(chunks) if error is None else 0, error)
+
+    await asyncio.gather(*(ingest_file(path, rel) for path, rel in changed))
+    for rel in removed:
+        ids = manifest.files[rel]["chunks"]
+        try:
+            await asyncio.to_thread(target.delete, ids)
+        except Exception as e:
+            report["failed"] += 1
+            if on_file:
+                on_file(rel, 0, f"{type(e).__name__}: {e}")
+            continue
+        del manifest.files[rel]
+        report["chunks_deleted"] += len(ids)
+    await asyncio.to_thread(target.finish)
+    manifest.save()
+    report["created_index"] = bool(index_checked and index_checked[0])
+    report["seconds"] = round(time.perf_counter() - started, 2)
+    return report
+
+
+def main():
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Chunk, embed and upload zodiac source documents")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="Ingest the files that changed since the last run")
+    status = commands.add_parser("status", help="Show which files would be ingested or removed")
+    for command in (run, status):
+        command.add_argument("--source", required=True, help="Document file or directory (PDF, text, markdown)")
+        command.add_argument("--target", choices=["azure", "local"], default="azure",
+                             help="Azure Search index (INDEX_NAME) or a local index directory")
+        command.add_argument("--out", default=None, help="Local index directory (default: LOCAL_INDEX_PATH)")
+        command.add_argument("--manifest", default=INGEST_MANIFEST, help="Manifest file")
+    run.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE, help="Chunks per embeddings request")
+    run.add_argument("--concurrency", type=int, default=INGEST_CONCURRENCY, help="Embeddings requests at once")
+    run.add_argument("--dtype", choices=["float32", "float16"],
+                     help="Local vector storage type (default: the existing index's, or float32)")
+    run.add_argument("--ivf-lists", type=int, default=0, help="Build a local IVF layer with this many lists")
+    run.add_argument("--force", action="store_true", help="Embed and upload every file again")
+    args = parser.parse_args()
+
+    from rag_engine import RagEngine, load_environment, MissingConfigError
+    try:
+        config = load_environment()
+    except MissingConfigError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+    if args.target == "local":
+        from local_index import LOCAL_INDEX_PATH
+        target = LocalIndexTarget(args.out or LOCAL_INDEX_PATH, getattr(args, "dtype", None),
+                                  getattr(args, "ivf_lists", 0))
+    else:
+        target = AzureSearchTarget(config)
+    manifest = Manifest(args.manifest)
+    if args.target == "local" and manifest.files and not target.exists():
+        manifest.reset(target.name, config["embedding_model"])  # The index was deleted; start over
+    files = source_files(args.source)
+
+    if args.command == "status":
+        current = manifest.matches(target.name, config["embedding_model"])
+        changed, removed = plan(manifest, files) if current else (files, [])
+        print(f"📊 {args.manifest}: {len(manifest.files)} files, {manifest.chunk_count()} chunks"
+              + ("" if current or manifest.target is None else " (⚠️ built for another target or embedding model)"))
+        for _, rel in changed:
+            print(f"  ✏️ {rel}")
+        for rel in removed:
+            print(f"  🗑️ {rel}")
+        print(f"{len(changed)} to ingest, {len(removed)} to remove, {len(files) - len(changed)} unchanged")
+        return
+
+    # Ingestion only embeds; the configured retrieval mode may need the very index being built
+    engine = RagEngine(config, cache=False, retrieval_mode="extension", warm=False, compatibility=False)
+    print(f"📚 Ingesting {len(files)} files from {args.source} into {target.name}...")
+
+    def report_file(rel, chunks, error):
+        print(f"{'❌' if error else '✅'} {rel}" + (f": {error}" if error else f" ({chunks} chunks)"))
+
+    result = asyncio.run(ingest(engine, target, manifest, files, args.batch_size, args.concurrency, args.force,
+                                report_file))
+    if result["created_index"]:
+        print(f"🆕 Created index '{config['index_name']}'")
+    print(f"\n🎉 {result['changed']} files ingested, {result['unchanged']} unchanged, {result['removed']} removed; "
+          f"{result['chunks_embedded']} chunks embedded, {result['chunks_kept']} kept, "
+          f"{result['chunks_deleted']} deleted in {result['seconds']}s")
+    if result["failed"]:
+        print(f"🔁 {result['failed']} files failed; run the same command again to retry them.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Intent router for Linda Goodman's Zodiac Guide
+Answers fixed zodiac facts (element, modality, dates, ruler, symbol) from a local table
+and hands every open-ended question to the RAG pipeline with those facts as compact context
+"""
+
+import os
+import re
+
+# "on" answers pure fact questions locally; "off" sends everything through RAG
+INTENT_ROUTER = os.getenv("INTENT_ROUTER", "on").lower() not in ("off", "0", "false", "no")
+# Add the facts of the signs a question mentions to RAG requests
+INTENT_FACT_CONTEXT = os.getenv("INTENT_FACT_CONTEXT", "on").lower() not in ("off", "0", "false", "no")
+
+
+class Sign:
+    """Fixed facts about one zodiac sign"""
+
+    def __init__(self, name, glyph, symbol, element, modality, ruler, start, end, aliases=()):
+        self.name = name
+        self.glyph = glyph
+        self.symbol = symbol
+        self.element = element
+        self.modality = modality
+        self.ruler = ruler
+        self.start = start  # (month, day) of the first day of the sign
+        self.end = end  # (month, day) of the last day
+        self.aliases = aliases
+
+    @property
+    def dates(self):
+        return f"{_MONTHS[self.start[0] - 1]} {self.start[1]} – {_MONTHS[self.end[0] - 1]} {self.end[1]}"
+
+    def contains(self, month, day):
+        """Whether a birthday falls in this sign (dates vary by a day from year to year)"""
+        if self.start <= self.end:
+            return self.start <= (month, day) <= self.end
+        return (month, day) >= self.start or (month, day) <= self.end  # Capricorn wraps the new year
+
+    def fact_line(self):
+        return (f"{self.name} ({self.glyph}, {self.symbol}): {self.element} sign, {self.modality}, "
+                f"ruled by {self.ruler}, {self.dates}")
+
+
+_MONTHS = ["January", "February", "March", "April", "May", "June", "July", "August", "September",
+           "October", "November", "December"]
+
+SIGNS = [
+    Sign("Aries", "♈", "the Ram", "Fire", "Cardinal", "Mars", (3, 21), (4, 19), ("arian", "arians", "ariens")),
+    Sign("Taurus", "♉", "the Bull", "Earth", "Fixed", "Venus", (4, 20), (5, 20), ("taurean", "taureans")),
+    Sign("Gemini", "♊", "the Twins", "Air", "Mutable", "Mercury", (5, 21), (6, 20), ("geminis", "geminian", "geminians")),
+    Sign("Cancer", "♋", "the Crab", "Water", "Cardinal", "the Moon", (6, 21), (7, 22), ("cancers", "cancerian", "cancerians")),
+    Sign("Leo", "♌", "the Lion", "Fire", "Fixed", "the Sun", (7, 23), (8, 22), ("leos",)),
+    Sign("Virgo", "♍", "the Virgin", "Earth", "Mutable", "Mercury", (8, 23), (9, 22), ("virgos", "virgoan", "virgoans")),
+    Sign("Libra", "♎", "the Scales", "Air", "Cardinal", "Venus", (9, 23), (10, 22), ("libras", "libran", "librans")),
+    Sign("Scorpio", "♏", "the Scorpion", "Water", "Fixed", "Pluto", (10, 23), (11, 21), ("scorpios", "scorpian", "scorpians")),
+    Sign("Sagittarius", "♐", "the Archer", "Fire", "Mutable", "Jupiter", (11, 22), (12, 21), ("sagittarian", "sagittarians")),
+    Sign("Capricorn", "♑", "the Goat", "Earth", "Cardinal", "Saturn", (12, 22), (1, 19), ("capricorns", "capricornian", "capricornians")),
+    Sign("Aquarius", "♒", "the Water Bearer", "Air", "Fixed", "Uranus", (1, 20), (2, 18), ("aquarian", "aquarians")),
+    Sign("Pisces", "♓", "the Fish", "Water", "Mutable", "Neptune", (2, 19), (3, 20), ("piscean", "pisceans")),
+]
+
+_SIGN_WORDS = {}
+for _sign in SIGNS:
+    for _word in (_sign.name.lower(),) + _sign.aliases:
+        _SIGN_WORDS[_word] = _sign
+
+_ELEMENTS = {"fire": "Fire", "earth": "Earth", "air": "Air", "water": "Water"}
+_MODALITIES = {"cardinal": "Cardinal", "fixed": "Fixed", "mutable": "Mutable"}
+_PLANETS = {"mars": "Mars", "venus": "Venus", "mercury": "Mercury", "moon": "the Moon", "sun": "the Sun",
+            "pluto": "Pluto", "jupiter": "Jupiter", "saturn": "Saturn", "uranus": "Uranus", "neptune": "Neptune"}
+_MONTH_WORDS = {m.lower(): i for i, m in enumerate(_MONTHS, 1)}
+_MONTH_WORDS.update({m[:3].lower(): i for i, m in enumerate(_MONTHS, 1)})
+_MONTH_WORDS["sept"] = 9
+
+# Words that ask for an attribute
+_ATTRIBUTE_WORDS = {
+    "element": {"element", "elements", "triplicity"},
+    "modality": {"modality", "modalities", "quality", "qualities", "mode", "quadruplicity"},
+    "dates": {"date", "dates", "when", "season", "range"},
+    "ruler": {"ruler", "rulers", "rules", "rule", "ruled", "ruling", "planet", "planets"},
+    "symbol": {"symbol", "symbols", "symbolized", "represented", "glyph"},
+}
+
+# Words that make a question about two signs a compatibility question
+_COMPATIBILITY_WORDS = {"compatible", "compatibility", "match", "matches", "along", "couple", "couples",
+                        "chemistry", "relationship", "relationships", "together", "pairing"}
+# Further words a generic compatibility question may contain; anything else asks for something specific
+_COMPATIBILITY_FILLER = {"how", "good", "well", "get", "go", "in", "love", "with", "between", "vs", "versus",
+                         "x", "two", "another", "about", "each", "other", "really", "very"}
+
+# Words that carry no meaning of their own in a fact question
+_FILLER_WORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "be", "what", "whats", "which", "who", "of", "for", "in",
+    "on", "by", "to", "and", "or", "sign", "signs", "zodiac", "star", "sun", "astrological", "astrology",
+    "my", "i", "im", "me", "someone", "somebody", "person", "people", "born", "birthday", "if", "am",
+    "do", "does", "tell", "list", "name", "all", "it", "its", "s", "th", "st", "nd", "rd", "please",
+    "considered", "belong", "belongs", "under", "falls", "fall", "there", "as", "with", "you", "can",
+    "exactly", "kind", "type", "one", "ones",
+}
+
+_WORD_PATTERN = re.compile(r"[a-z]+|\d+")
+
+
+def find_signs(text):
+    """Signs mentioned in the text, in order of first mention"""
+    found = []
+    for word in _WORD_PATTERN.findall(text.lower()):
+        sign = _SIGN_WORDS.get(word)
+        if sign and sign not in found:
+            found.append(sign)
+    return found
+
+
+def sign_for_date(month, day):
+    """The sign of a birthday"""
+    for sign in SIGNS:
+        if sign.contains(month, day):
+            return sign
+    return None
+
+
+def facts_context(signs):
+    """Compact grounding message with the fixed facts of the given signs"""
+    lines = "\n".join(f"- {sign.fact_line()}" for sign in signs)
+    return {"role": "system", "content": f"Zodiac facts:\n{lines}"}
+
+
+class Route:
+    """Where a question goes: answered locally ("fact"), about a pair of signs
+    ("compatibility") or through the RAG pipeline ("rag")"""
+
+    def __init__(self, intent, answer=None, signs=None, context=None, exact=False):
+        self.intent = intent
+        self.answer = answer  # Complete local answer, or None
+        self.signs = signs or []
+        self.context = context  # Extra grounding message for a RAG request, or None
+        self.exact = exact  # Compatibility: the question asks for nothing beyond the pair itself
+        self.citations = None  # Set when ``context`` already grounds the answer, so retrieval is skipped
+
+    def __repr__(self):
+        return f"<Route {self.intent} signs={[s.name for s in self.signs]}>"
+
+
+def _mention(values, attribute, value, unknown):
+    """Record a value the question mentions; a second, different value of the same attribute ("a fire
+    sign or a water sign?") leaves nothing to answer yes or no to, so it counts as an unknown word"""
+    if values.setdefault(attribute, value) != value:
+        unknown.append(value.lower())
+
+
+def _parse(question):
+    """Split a question into its words, signs, asked attributes, mentioned values, a date and unknown words"""
+    words = _WORD_PATTERN.findall(question.lower().replace("'", ""))
+    signs, asked, values, unknown = [], set(), {}, []
+    month = day = None
+    for i, word in enumerate(words):
+        following = words[i + 1] if i + 1 < len(words) else ""
+        if word in _SIGN_WORDS:
+            if _SIGN_WORDS[word] not in signs:
+                signs.append(_SIGN_WORDS[word])
+        elif word in _ELEMENTS:
+            _mention(values, "element", _ELEMENTS[word], unknown)
+        elif word in _MODALITIES:
+            _mention(values, "modality", _MODALITIES[word], unknown)
+        elif word in _PLANETS and following in ("sign", "signs"):
+            if word != "sun":
+                unknown.append(word)  # "Moon sign", "Venus sign": a chart placement, not a ruler
+        elif word in _PLANETS:
+            _mention(values, "ruler", _PLANETS[word], unknown)
+        elif word in _MONTH_WORDS:
+            month = _MONTH_WORDS[word]
+        elif word.isdigit():
+            if 1 <= int(word) <= 31 and day is None:
+                day = int(word)
+            elif len(word) != 4:  # A year is harmless; any other number is not a fact question
+                unknown.append(word)
+        elif any(word in attr_words for attr_words in _ATTRIBUTE_WORDS.values()):
+            asked.update(attr for attr, attr_words in _ATTRIBUTE_WORDS.items() if word in attr_words)
+        elif word not in _FILLER_WORDS:
+            unknown.append(word)
+    date = (month, day) if month and day else None
+    if (month or day) and not date:
+        unknown.append("date")
+    return words, signs, asked, values, date, unknown
+
+
+def _a(word):
+    return "an" if word[0] in "AEIOU" else "a"
+
+
+def _describe(sign, attribute):
+    if attribute in ("element", "modality"):
+        value = getattr(sign, attribute)
+        return f"{_a(value)} **{value}** sign"
+    if attribute == "ruler":
+        return f"ruled by **{sign.ruler}**"
+    if attribute == "symbol":
+        return f"symbolized by **{sign.symbol}**"
+    return f"the sign of those born **{sign.dates}**"
+
+
+_FOLLOW_UP = "\n\nAsk me about {name}'s personality, love life or career to go deeper! ✨"
+
+
+class IntentRouter:
+    """Rule-based classifier in front of the RAG call.
+
+    A question is answered locally only when every word in it is a sign, an
+    attribute (element, modality, dates, ruler, symbol), a value of one, a
+    date or filler, so "What element is Scorpio?" and "Is Gemini mutable?"
+    are answered here while "Why are Scorpios so intense?" goes to RAG.
+    """
+
+    def __init__(self, answer_locally=INTENT_ROUTER, fact_context=INTENT_FACT_CONTEXT):
+        self.answer_locally = answer_locally
+        self.fact_context = fact_context
+
+    def route(self, question):
+        """Classify a question; returns a Route"""
+        words, signs, asked, values, date, unknown = _parse(question)
+        answer = None
+        if self.answer_locally and not unknown:
+            answer = self._answer(signs, asked, values, date, "signs" in words)
+        if answer:
+            return Route("fact", answer, signs)
+        context = facts_context(signs) if self.fact_context and signs else None
+
+        pair = self._pair(words, signs)
+        if pair and _COMPATIBILITY_WORDS.intersection(words):
+            exact = not (set(unknown) - _COMPATIBILITY_WORDS - _COMPATIBILITY_FILLER) and not (asked or values or date)
+            return Route("compatibility", signs=pair, context=context, exact=exact)
+        return Route("rag", signs=signs, context=context)
+
+    @staticmethod
+    def _pair(words, signs):
+        """The two signs of a compatibility question, including a sign paired with itself"""
+        if len(signs) == 2:
+            return signs
+        if len(signs) == 1:
+            mentions = sum(1 for word in words if _SIGN_WORDS.get(word) is signs[0])
+            if mentions > 1 or "two" in words or "another" in words:
+                return [signs[0], signs[0]]
+        return None
+
+    def _answer(self, signs, asked, values, date, wants_list):
+        if date:
+            sign = sign_for_date(*date)
+            if sign is None or len(signs) > 1 or values or asked:
+                return None
+            if signs:
+                # "Am I a Leo if I was born on July 30?"
+                verdict = "Yes" if signs[0] is sign else "No"
+                return (f"{verdict} — someone born on {_MONTHS[date[0] - 1]} {date[1]} is {sign.glyph} "
+                        f"**{sign.name}** ({sign.dates})." + _FOLLOW_UP.format(name=sign.name))
+            return (f"Someone born on {_MONTHS[date[0] - 1]} {date[1]} is {sign.glyph} **{sign.name}** "
+                    f"({sign.dates}), {_describe(sign, 'element')}, {sign.modality}, ruled by {sign.ruler}. "
+                    "Birthdays within a day of a cusp can fall either side depending on the year."
+                    + _FOLLOW_UP.format(name=sign.name))
+
+        if signs and values:
+            # Yes/no: "Is Gemini mutable?", "Is Leo ruled by the Sun?"
+            lines = []
+            for sign in signs:
+                for attribute, value in values.items():
+                    actual = getattr(sign, attribute)
+                    if actual == value:
+                        lines.append(f"Yes — {sign.glyph} **{sign.name}** is {_describe(sign, attribute)}.")
+                    else:
+                        lines.append(f"No — {sign.glyph} **{sign.name}** is {_describe(sign, attribute)}, "
+                                     f"not {value}.")
+            return "\n".join(lines) + _FOLLOW_UP.format(name=signs[0].name)
+
+        if signs and asked:
+            lines = []
+            for sign in signs:
+                described = [_describe(sign, attribute) for attribute in sorted(asked)]
+                lines.append(f"{sign.glyph} **{sign.name}** is " + " and ".join(described) + ".")
+            return "\n".join(lines) + _FOLLOW_UP.format(name=signs[0].name)
+
+        if values and not signs and len(values) == 1 and wants_list:
+            # "Which signs are fire signs?", "What signs does Venus rule?"
+            attribute, value = next(iter(values.items()))
+            names = ", ".join(f"{s.glyph} {s.name}" for s in SIGNS if getattr(s, attribute) == value)
+            if attribute == "ruler":
+                return f"The signs ruled by **{value}** are {names}."
+            return f"The **{value}** signs are {names}."
+
+        return None
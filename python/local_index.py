@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Local vector index for Linda Goodman's Zodiac Guide
+Searches an exported copy of the Azure Search index in-process from a memory-mapped matrix
+
+Export the index once, then set RETRIEVAL_MODE=local:
+    python local_index.py export --out zodiac_index [--dtype float16] [--ivf-lists 128]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import numpy as np
+from retrieval import SEARCH_TOP_K, Passage
+
+LOCAL_INDEX_PATH = os.getenv("LOCAL_INDEX_PATH", "zodiac_index")
+# Number of IVF lists searched per query when the index has an ANN layer
+LOCAL_INDEX_NPROBE = int(os.getenv("LOCAL_INDEX_NPROBE", "8"))
+
+# Rows multiplied per block, bounding the scratch memory of a brute-force scan
+SCAN_BLOCK_ROWS = 65536
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _top_k(scores, k):
+    """Indices of the k highest scores in descending order"""
+    k = min(k, scores.shape[-1])
+    if k <= 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.int64)
+    idx = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    order = np.argsort(-np.take_along_axis(scores, idx, axis=-1), axis=-1)
+    return np.take_along_axis(idx, order, axis=-1)
+
+
+def kmeans(vectors, n_lists, iterations=10, sample=50000, seed=0):
+    """Spherical k-means on a sample of the vectors; returns unit-length centroids"""
+    rng = np.random.default_rng(seed)
+    if len(vectors) > sample:
+        vectors = vectors[np.sort(rng.choice(len(vectors), sample, replace=False))]
+    vectors = np.asarray(vectors, dtype=np.float32)
+    centroids = vectors[rng.choice(len(vectors), n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        for j in range(n_lists):
+            members = vectors[assignment == j]
+            if len(members):
+                centroids[j] = members.mean(axis=0)
+        centroids = _normalize(centroids)
+    return centroids
+
+
+class LocalVectorIndex:
+    """Cosine-similarity index over unit-length vectors stored as a .npy matrix.
+
+    ``vectors.npy`` is memory-mapped, so processes share the OS page cache
+    instead of each holding a copy. ``chunks.jsonl`` holds the text and
+    metadata row by row. An optional IVF layer (``ivf.npz``) restricts each
+    query to the rows of the ``nprobe`` nearest centroids. Chunks carrying
+    ``facets`` (see ingest.py) can be pre-filtered by a QueryFacets, so only
+    the matching rows are scored; untagged chunks always pass.
+    """
+
+    def __init__(self, vectors, chunks, centroids=None, lists=None, nprobe=LOCAL_INDEX_NPROBE):
+        self.vectors = vectors
+        self.chunks = chunks
+        self.centroids = centroids
+        self.lists = lists
+        self.nprobe = nprobe
+        self.top_k = SEARCH_TOP_K
+        self._facet_rows = None
+
+    @classmethod
+    def load(cls, path=LOCAL_INDEX_PATH, nprobe=LOCAL_INDEX_NPROBE):
+        """Open an exported index directory"""
+        vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        with open(os.path.join(path, "chunks.jsonl"), encoding="utf-8") as f:
+            chunks = [json.loads(line) for line in f]
+        centroids = lists = None
+        ivf_path = os.path.join(path, "ivf.npz")
+        if os.path.exists(ivf_path):
+            ivf = np.load(ivf_path)
+            centroids = ivf["centroids"]
+            offsets, rows = ivf["offsets"], ivf["rows"]
+            lists = [rows[offsets[j]:offsets[j + 1]] for j in range(len(centroids))]
+        return cls(vectors, chunks, centroids, lists, nprobe)
+
+    @staticmethod
+    def save(path, vectors, chunks, dtype="float32", ivf_lists=0):
+        """Write vectors, chunk records and an optional IVF layer to an index directory"""
+        os.makedirs(path, exist_ok=True)
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+        np.save(os.path.join(path, "vectors.npy"), vectors.astype(dtype))
+        with open(os.path.join(path, "chunks.jsonl"), "w", encoding="utf-8") as f:
+            for chunk in chunks:
+                f.write(json.dumps(chunk, ensure_ascii=False) + "\n")
+
+        ivf_path = os.path.join(path, "ivf.npz")
+        if ivf_lists:
+            centroids = kmeans(vectors, ivf_lists)
+            assignment = np.argmax(vectors @ centroids.T, axis=1)
+            rows = np.argsort(assignment, kind="stable")
+            offsets = np.searchsorted(assignment[rows], np.arange(ivf_lists + 1))
+            np.savez(ivf_path, centroids=centroids, rows=rows, offsets=offsets)
+        elif os.path.exists(ivf_path):
+            os.remove(ivf_path)
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def _scan(self, queries, rows=None):
+        """Score queries against all rows (or a subset) block by block"""
+        if rows is not None:
+            return queries @ np.asarray(self.vectors[rows], dtype=np.float32).T
+        blocks = []
+        for start in range(0, len(self.vectors), SCAN_BLOCK_ROWS):
+            block = np.asarray(self.vectors[start:start + SCAN_BLOCK_ROWS], dtype=np.float32)
+            blocks.append(queries @ block.T)
+        return np.concatenate(blocks, axis=1) if blocks else np.empty((len(queries), 0), dtype=np.float32)
+
+    def _index_facets(self):
+        """Rows per (facet, value), and the rows of untagged chunks"""
+        rows, untagged = {}, []
+        for row, chunk in enumerate(self.chunks):
+            facets = chunk.get("facets")
+            if facets is None:
+                untagged.append(row)
+                continue
+            for name, values in facets.items():
+                for value in values:
+                    rows.setdefault((name, value), []).append(row)
+        self._facet_rows = ({key: np.array(value, dtype=np.int64) for key, value in rows.items()},
+                            np.array(untagged, dtype=np.int64))
+
+    def can_filter(self):
+        """Whether any chunk is tagged with facets"""
+        if self._facet_rows is None:
+            self._index_facets()
+        return bool(self._facet_rows[0])
+
+    def filter_rows(self, facets):
+        """Sorted rows of the chunks passing a QueryFacets filter, or None for every row"""
+        if not facets:
+            return None
+        from facets import SUBJECT_FACETS
+
+        if self._facet_rows is None:
+            self._index_facets()
+        rows, untagged = self._facet_rows
+        empty = np.empty(0, dtype=np.int64)
+
+        def union(names):
+            parts = [rows.get((name, value), empty) for name in names for value in facets.values[name]]
+            return np.unique(np.concatenate(parts)) if parts else None
+
+        allowed = None
+        for part in (union(SUBJECT_FACETS), union(["life_stages"])):
+            if part is not None:
+                allowed = part if allowed is None else np.intersect1d(allowed, part, assume_unique=True)
+        return None if allowed is None else np.union1d(allowed, untagged)
+
+    def search_batch(self, vectors, top_k=None, allowed=None):
+        """Return the top-k (row, score) pairs for each query vector, among the ``allowed`` rows if given"""
+        top_k = top_k or self.top_k
+        queries = _normalize(np.atleast_2d(np.asarray(vectors, dtype=np.float32)))
+
+        if self.centroids is None:
+            scores = self._scan(queries, allowed)
+            best = _top_k(scores, top_k)
+            rows = allowed if allowed is not None else np.arange(scores.shape[1])
+            return [[(int(rows[i]), float(scores[q, i])) for i in best[q]] for q in range(len(queries))]
+
+        results = []
+        probes = _top_k(queries @ self.centroids.T, self.nprobe)
+        for q, query in enumerate(queries):
+            rows = np.sort(np.concatenate([self.lists[j] for j in probes[q]]))
+            if allowed is not None:
+                rows = np.intersect1d(rows, allowed, assume_unique=True)
+            scores = self._scan(query[None, :], rows)[0]
+            best = _top_k(scores, top_k)
+            results.append([(int(rows[i]), float(scores[i])) for i in best])
+        return results
+
+    def _to_passage(self, row, score):
+        chunk = self.chunks[row]
+        return Passage(
+            content=chunk.get("content", ""),
+            title=chunk.get("title"),
+            score=score,
+            id=chunk.get("id"),
+            url=chunk.get("url"),
+            filepath=chunk.get("filepath"),
+            metadata=chunk.get("metadata")
+        )
+
+    def search(self, vector, top_k=None):
+        """Return the passages nearest to a query embedding"""
+        return [self._to_passage(row, score) for row, score in self.search_batch([vector], top_k)[0]]
+
+    async def asearch(self, vector, top_k=None):
+        """Async ``search``; NumPy releases the GIL, so a worker thread keeps the loop free"""
+        return await asyncio.to_thread(self.search, vector, top_k)
+
+    def search_many(self, vectors, top_k=None, texts=None, facets=None):
+        """One ranking per query embedding, scored in a single matrix product over the rows ``facets`` allows.
+        The index has no keyword search, so ``texts`` is unused; the reranker matches keywords instead."""
+        hits = self.search_batch(vectors, top_k, self.filter_rows(facets))
+        return [[self._to_passage(row, score) for row, score in ranking] for ranking in hits]
+
+    async def asearch_many(self, vectors, top_k=None, texts=None, facets=None):
+        """Async ``search_many``"""
+        return await asyncio.to_thread(self.search_many, vectors, top_k, texts, facets)
+
+
+def export_from_azure(config, path, dtype="float32", ivf_lists=0):
+    """Download every chunk and its vector from the Azure Search index into a local index"""
+    from azure.core.credentials import AzureKeyCredential
+    from azure.search.documents import SearchClient
+    from facets import FACET_FIELDS
+    from retrieval import (
+        SEARCH_VECTOR_FIELD, SEARCH_CONTENT_FIELD, SEARCH_TITLE_FIELD, SEARCH_KEY_FIELD,
+        SEARCH_URL_FIELD, SEARCH_FILEPATH_FIELD, index_fields
+    )
+
+    client = SearchClient(
+        endpoint=str(config["search_endpoint"]),
+        index_name=str(config["index_name"]),
+        credential=AzureKeyCredential(str(config["search_api_key"]))
+    )
+    fields = [f for f in (SEARCH_KEY_FIELD, SEARCH_CONTENT_FIELD, SEARCH_TITLE_FIELD,
+                          SEARCH_URL_FIELD, SEARCH_FILEPATH_FIELD) if f]
+    facet_fields = [f for f in FACET_FIELDS if f in (index_fields(config) or ())]
+
+    vectors, chunks = [], []
+    for result in client.search(search_text="*", select=fields + facet_fields + [SEARCH_VECTOR_FIELD]):
+        vector = result.get(SEARCH_VECTOR_FIELD)
+        if not vector:
+            continue
+        vectors.append(vector)
+        chunk = {
+            "id": result.get(SEARCH_KEY_FIELD),
+            "content": result.get(SEARCH_CONTENT_FIELD) or "",
+            "title": result.get(SEARCH_TITLE_FIELD),
+            "url": result.get(SEARCH_URL_FIELD) if SEARCH_URL_FIELD else None,
+            "filepath": result.get(SEARCH_FILEPATH_FIELD) if SEARCH_FILEPATH_FIELD else None,
+        }
+        if facet_fields:
+            chunk["facets"] = {f: result.get(f) or [] for f in facet_fields}
+        chunks.append(chunk)
+
+    LocalVectorIndex.save(path, vectors, chunks, dtype, ivf_lists)
+    return len(chunks)
+
+
+def main():
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Manage the local zodiac vector index")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="Export the Azure Search index to a local index")
+    export.add_argument("--out", default=LOCAL_INDEX_PATH, help="Index directory")
+    export.add_argument("--dtype", choices=["float32", "float16"], default="float32", help="Vector storage type")
+    export.add_argument("--ivf-lists", type=int, default=0, help="Build an IVF layer with this many lists")
+    args = parser.parse_args()
+
+    from rag_engine import load_environment, MissingConfigError
+    try:
+        config = load_environment()
+    except MissingConfigError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+    print(f"📥 Exporting index '{config['index_name']}' to {args.out}...")
+    count = export_from_azure(config, args.out, args.dtype, args.ivf_lists)
+    print(f"✅ Exported {count} chunks")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+"""
+Request instrumentation for Linda Goodman's Zodiac Guide
+Per-stage latency and token metrics in Prometheus text format, with optional OpenTelemetry spans
+"""
+
+import atexit
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Port for the Prometheus /metrics endpoint; leave unset to disable it
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0")) or None
+
+# Optional JSONL file with one line per finished request (its to_dict), e.g. to compare tiers offline
+REQUEST_LOG = os.getenv("REQUEST_LOG", "")
+
+# Routes answered without any Azure call
+LOCAL_ROUTES = ("fact", "compatibility")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+try:
+    from opentelemetry import trace
+    _tracer = trace.get_tracer("zodiac.rag")
+except ImportError:
+    _tracer = None
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{str(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    """A monotonically increasing Prometheus counter"""
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels.get(n, "") for n in self.labels), 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """A Prometheus histogram with cumulative buckets"""
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, "") for n in self.labels)
+        with self._lock:
+            series = self._series.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    labels = _format_labels(self.labels + ("le",), key + (bound,))
+                    lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+                labels = _format_labels(self.labels + ("le",), key + ("+Inf",))
+                lines.append(f"{self.name}_bucket{labels} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds every metric and renders them in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help, labels=()):
+        metric = Counter(name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+REQUESTS = REGISTRY.counter("zodiac_requests_total", "Requests by route, retrieval mode and cache result",
+                            ("route", "mode", "cache"))
+ERRORS = REGISTRY.counter("zodiac_request_errors_total", "RAG requests that failed", ("mode",))
+RETRIES = REGISTRY.counter("zodiac_retries_total", "Retried Azure calls", ("mode",))
+PROMPT_TOKENS = REGISTRY.counter("zodiac_prompt_tokens_total", "Prompt tokens sent", ("mode",))
+COMPLETION_TOKENS = REGISTRY.counter("zodiac_completion_tokens_total", "Completion tokens received", ("mode",))
+REQUEST_SECONDS = REGISTRY.histogram("zodiac_request_seconds", "Wall time per RAG request", ("mode", "cache"))
+TTFT_SECONDS = REGISTRY.histogram("zodiac_time_to_first_token_seconds", "Time to the first answer token", ("mode",))
+STAGE_SECONDS = REGISTRY.histogram("zodiac_stage_seconds", "Time spent per request stage", ("stage",))
+RERANKS = REGISTRY.counter("zodiac_rerank_total", "Retrievals reranked, or left in search order to stay "
+                           "within the time budget", ("mode", "outcome"))
+CONTEXT_TOKENS = REGISTRY.counter("zodiac_context_tokens_total", "Retrieved-passage tokens sent in prompts, "
+                                  "and saved by context packing", ("mode", "kind"))
+FACET_FILTERS = REGISTRY.counter("zodiac_facet_filter_total", "Retrievals filtered by the facets of the question, "
+                                 "or repeated unfiltered when too few passages matched", ("mode", "outcome"))
+TIER_REQUESTS = REGISTRY.counter("zodiac_tier_requests_total", "Generated answers by tier and deployment",
+                                 ("tier", "model"))
+TIER_SECONDS = REGISTRY.histogram("zodiac_tier_request_seconds", "Wall time per request by tier", ("tier",))
+TIER_TTFT_SECONDS = REGISTRY.histogram("zodiac_tier_time_to_first_token_seconds", "Time to first token by tier",
+                                       ("tier",))
+TIER_COMPLETION_TOKENS = REGISTRY.counter("zodiac_tier_completion_tokens_total", "Completion tokens by tier",
+                                          ("tier", "model"))
+
+class RequestLogWriter:
+    """Appends request records to a JSONL file from a daemon thread, so finishing a
+    request never waits on disk I/O (it may run on an event loop)"""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def write(self, record, path):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="request-log", daemon=True)
+                self._thread.start()
+        self._queue.put((path, json.dumps(record) + "\n"))
+
+    def flush(self):
+        """Wait until every queued record is on disk"""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            path, line = self._queue.get()
+            try:
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write(line)
+            except OSError as e:
+                print(f"⚠️ Could not write the request log {path}: {e}", file=sys.stderr)
+            finally:
+                self._queue.task_done()
+
+
+_request_log = RequestLogWriter()
+atexit.register(_request_log.flush)
+
+
+def log_request(record, path=REQUEST_LOG):
+    """Queue one request record for the JSONL request log, if configured"""
+    if path:
+        _request_log.write(record, path)
+
+
+def flush_request_log():
+    """Wait for queued request records to be written, e.g. before reading the log"""
+    _request_log.flush()
+
+
+def span(name, **attributes):
+    """An OpenTelemetry span when opentelemetry is installed, otherwise a no-op"""
+    if _tracer is None:
+        return nullcontext()
+    return _tracer.start_as_current_span(name, attributes=attributes)
+
+
+class RequestMetrics:
+    """Timings and counts for one RAG request, published to the registry by ``finish``"""
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.wall_seconds = None
+        self.ttft_seconds = None
+        self.prompt_tokens = None
+        self.completion_tokens = None
+        self.cache = "off"
+        self.route = "rag"  # Or "fact"/"compatibility" (answered locally) or "personalized" (from the matrix)
+        self.tier = None  # The TierDecision, as a dict, for requests that reached the tiering policy
+        self.rerank = None  # "applied", or "skipped" when the time budget ruled it out
+        self.context = None  # The ContextPacker report: passages and tokens before and after packing
+        self.facets = None  # The facets retrieval was filtered by, and whether it fell back to no filter
+        self.retries = 0
+        self.error = None
+
+    @contextmanager
+    def stage(self, name):
+        """Time a stage of the request (cache, embedding, retrieval, generation, ...)"""
+        started = time.perf_counter()
+        with span(f"rag.{name}"):
+            try:
+                yield
+            finally:
+                self.record_stage(name, time.perf_counter() - started)
+
+    def record_stage(self, name, seconds):
+        """Add time to a stage measured outside ``stage``, e.g. a stream consumed later"""
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+        STAGE_SECONDS.observe(seconds, stage=name)
+
+    def retried(self, attempt, error):
+        """``on_retry`` hook for rate_limit.call_with_retry"""
+        self.retries += 1
+        RETRIES.inc(mode=self.mode)
+
+    def reranked(self, outcome):
+        """Record whether retrieved passages were reranked ("applied") or not, to save time ("skipped")"""
+        self.rerank = outcome
+        RERANKS.inc(mode=self.mode, outcome=outcome)
+
+    def filtered(self, facets, fallback=False):
+        """Record the facet filter of a retrieval, and whether too few matches made it search unfiltered"""
+        self.facets = {**facets.to_dict(), "fallback": fallback}
+        FACET_FILTERS.inc(mode=self.mode, outcome="fallback" if fallback else "filtered")
+
+    def packed(self, report):
+        """Record what context packing kept of the retrieved passages"""
+        self.context = report
+        CONTEXT_TOKENS.inc(report["tokens_out"], mode=self.mode, kind="sent")
+        CONTEXT_TOKENS.inc(report["tokens_saved"], mode=self.mode, kind="saved")
+
+    def first_token(self, at=None):
+        """Record when the first answer token arrived (``at`` is a perf_counter value)"""
+        if self.ttft_seconds is None:
+            self.ttft_seconds = (at or time.perf_counter()) - self.started
+
+    def finish(self, prompt_tokens=None, completion_tokens=None, error=None):
+        """Record the end of the request"""
+        self.wall_seconds = time.perf_counter() - self.started
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.error = error
+        if error is not None:
+            ERRORS.inc(mode=self.mode)
+            log_request(self.to_dict())
+            return self
+        if self.ttft_seconds is None:
+            self.ttft_seconds = self.wall_seconds
+        REQUESTS.inc(route=self.route, mode=self.mode, cache=self.cache)
+        REQUEST_SECONDS.observe(self.wall_seconds, mode=self.mode, cache=self.cache)
+        TTFT_SECONDS.observe(self.ttft_seconds, mode=self.mode)
+        if prompt_tokens:
+            PROMPT_TOKENS.inc(prompt_tokens, mode=self.mode)
+        if completion_tokens:
+            COMPLETION_TOKENS.inc(completion_tokens, mode=self.mode)
+        if self.tier and self.cache in ("off", "miss"):
+            # Only answers the tier's deployment actually generated say anything about the tier
+            tier, model = self.tier["tier"], self.tier["model"]
+            TIER_REQUESTS.inc(tier=tier, model=model)
+            TIER_SECONDS.observe(self.wall_seconds, tier=tier)
+            TIER_TTFT_SECONDS.observe(self.ttft_seconds, tier=tier)
+            if completion_tokens:
+                TIER_COMPLETION_TOKENS.inc(completion_tokens, tier=tier, model=model)
+        log_request(self.to_dict())
+        return self
+
+    def to_dict(self):
+        return {
+            "mode": self.mode,
+            "wall_ms": round((self.wall_seconds or 0) * 1000, 1),
+            "ttft_ms": round((self.ttft_seconds or 0) * 1000, 1),
+            "stages_ms": {name: round(seconds * 1000, 1) for name, seconds in self.stages.items()},
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cache": self.cache,
+            "route": self.route,
+            "tier": self.tier,
+            "rerank": self.rerank,
+            "context": self.context,
+            "facets": self.facets,
+            "retries": self.retries,
+            "error": self.error,
+        }
+
+
+class SessionStats:
+    """Running totals for one user session, shown in the UI"""
+
+    def __init__(self):
+        self.requests = 0
+        self.cache_hits = 0
+        self.local_answers = 0
+        self.retries = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.total_wall = 0.0
+        self.total_ttft = 0.0
+
+    def add(self, metrics):
+        if metrics is None or metrics.wall_seconds is None:
+            return
+        self.requests += 1
+        self.cache_hits += metrics.cache.startswith("hit")
+        self.local_answers += metrics.route in LOCAL_ROUTES
+        self.retries += metrics.retries
+        self.prompt_tokens += metrics.prompt_tokens or 0
+        self.completion_tokens += metrics.completion_tokens or 0
+        self.total_wall += metrics.wall_seconds
+        self.total_ttft += metrics.ttft_seconds or 0.0
+
+    def summary_lines(self):
+        if not self.requests:
+            return ["No questions asked yet"]
+        return [
+            f"Requests: {self.requests} ({self.cache_hits} from cache, {self.local_answers} answered locally)",
+            f"Avg latency: {self.total_wall / self.requests:.2f}s, first token {self.total_ttft / self.requests:.2f}s",
+            f"Tokens: {self.prompt_tokens} prompt / {self.completion_tokens} completion",
+            f"Retries: {self.retries}",
+        ]
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Keep scrapes out of the console
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=METRICS_PORT):
+    """Serve /metrics on a daemon thread; safe to call more than once per process"""
+    global _server
+    with _server_lock:
+        if _server is None and port:
+            _server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+        return _server
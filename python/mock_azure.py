@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+Mock Azure OpenAI and Azure AI Search endpoints for Linda Goodman's Zodiac Guide
+Serves chat (plain, streamed and "on your data"), embeddings and index search locally
+with configurable latency, token rate and error injection, for offline benchmarks
+
+Run it on its own and point OPENAI_ENDPOINT and SEARCH_ENDPOINT at it:
+    python mock_azure.py --port 8089 --latency-ms 300 --tokens-per-second 60
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MOCK_PASSAGES = [
+    ("Aries", "Aries, the Ram, rushes in where angels fear to tread, full of courage and impatience."),
+    ("Taurus", "Taurus, the Bull, is patient and steady, slow to anger and fond of comfort and beauty."),
+    ("Gemini", "Gemini, the Twins, is quick, curious and restless, forever chasing a new idea."),
+    ("Cancer", "Cancer, the Crab, hides a tender heart under a hard shell and clings to home and family."),
+    ("Leo", "Leo, the Lion, is proud, generous and warm, and cannot resist an appreciative audience."),
+    ("Virgo", "Virgo, the Virgin, is modest and precise, with a sharp eye for every detail."),
+    ("Libra", "Libra, the Scales, seeks harmony and fairness and weighs every choice with care."),
+    ("Scorpio", "Scorpio, the Scorpion, is intense and private, with a will of iron."),
+    ("Sagittarius", "Sagittarius, the Archer, is frank, optimistic and always ready for the next adventure."),
+    ("Capricorn", "Capricorn, the Goat, climbs steadily toward its goals with quiet ambition."),
+    ("Aquarius", "Aquarius, the Water Bearer, is an original, friendly to all and bound to none."),
+    ("Pisces", "Pisces, the Fishes, is gentle and intuitive, swimming between dreams and reality."),
+]
+
+ANSWER_WORDS = ("the stars suggest that this sign is warm curious loyal proud gentle bold and "
+                "full of surprises as Linda Goodman explains in Sun Signs").split()
+
+
+class MockSettings:
+    """Behaviour of the mock endpoints; every field can be changed while the server runs"""
+
+    def __init__(self, latency_ms=200, jitter_ms=50, tokens_per_second=50, answer_tokens=120,
+                 embedding_latency_ms=20, search_latency_ms=30, embedding_dimensions=1536,
+                 error_rate=0.0, error_status=429, retry_after_ms=200, seed=None):
+        self.latency_ms = latency_ms  # Time to first byte of a chat completion
+        self.jitter_ms = jitter_ms
+        self.tokens_per_second = tokens_per_second  # Generation speed; 0 streams instantly
+        self.answer_tokens = answer_tokens
+        self.embedding_latency_ms = embedding_latency_ms
+        self.search_latency_ms = search_latency_ms
+        self.embedding_dimensions = embedding_dimensions
+        self.error_rate = error_rate  # Fraction of requests rejected with error_status
+        self.error_status = error_status
+        self.retry_after_ms = retry_after_ms
+        self.random = random.Random(seed)
+
+    def sleep(self, base_ms):
+        jitter = self.random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0
+        time.sleep(max(0.0, base_ms + jitter) / 1000)
+
+
+def mock_embedding(text, dimensions):
+    """A deterministic unit vector derived from the text"""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+    rng = random.Random(seed)
+    vector = [rng.gauss(0, 1) for _ in range(dimensions)]
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+def _estimate_tokens(text):
+    return len(text) // 4 + 1
+
+
+def _search_hits(query, top_k):
+    """Rank the mock passages by how often their sign is mentioned in the query"""
+    query = (query or "").lower()
+    ranked = sorted(enumerate(MOCK_PASSAGES), key=lambda item: -query.count(item[1][0].lower()))
+    return [
+        {"id": str(i), "title": title, "content": content, "@search.score": 1.0 / (rank + 1)}
+        for rank, (i, (title, content)) in enumerate(ranked[:top_k])
+    ]
+
+
+class MockAzureHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, so clients reuse connections as they would against Azure
+
+    @property
+    def settings(self):
+        return self.server.settings
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        return json.loads(body) if body else {}
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _inject_error(self):
+        """Reject the request when error injection says so; returns True if it did"""
+        settings = self.settings
+        if settings.error_rate and settings.random.random() < settings.error_rate:
+            self.server.count("errors")
+            headers = {}
+            if settings.error_status == 429:
+                headers = {"retry-after-ms": str(settings.retry_after_ms)}
+            self._send_json(settings.error_status, {
+                "error": {"code": str(settings.error_status), "message": "Injected by mock_azure"}
+            }, headers)
+            return True
+        return False
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path.endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "mock", "object": "model"}]})
+        elif path == "/stats":
+            self._send_json(200, self.server.stats())
+        else:
+            self._send_json(404, {"error": {"code": "404", "message": f"No mock for {path}"}})
+
+    def do_POST(self):
+        path = self.path.split("?")[0]
+        request = self._read_json()
+        if self._inject_error():
+            return
+        if path.endswith("/chat/completions"):
+            self.server.count("chat")
+            self._chat(request)
+        elif path.endswith("/embeddings"):
+            self.server.count("embeddings")
+            self._embeddings(request)
+        elif "/docs/search" in path:
+            self.server.count("search")
+            self._search(request)
+        else:
+            self._send_json(404, {"error": {"code": "404", "message": f"No mock for {path}"}})
+
+    def _embeddings(self, request):
+        self.settings.sleep(self.settings.embedding_latency_ms)
+        inputs = request.get("input")
+        inputs = [inputs] if isinstance(inputs, str) else inputs
+        tokens = sum(_estimate_tokens(text) for text in inputs)
+        self._send_json(200, {
+            "object": "list",
+            "model": "mock-embedding",
+            "data": [
+                {"object": "embedding", "index": i, "embedding": mock_embedding(text, self.settings.embedding_dimensions)}
+                for i, text in enumerate(inputs)
+            ],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        })
+
+    def _search(self, request):
+        self.settings.sleep(self.settings.search_latency_ms)
+        top_k = request.get("top") or 5
+        self._send_json(200, {"value": _search_hits(request.get("search"), top_k)})
+
+    def _chat(self, request):
+        messages = request.get("messages", [])
+        question = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+        prompt_tokens = sum(_estimate_tokens(str(m.get("content", ""))) + 4 for m in messages)
+        max_tokens = request.get("max_tokens") or self.settings.answer_tokens
+        words = [ANSWER_WORDS[i % len(ANSWER_WORDS)] for i in range(min(self.settings.answer_tokens, max_tokens))]
+        finish_reason = "stop" if len(words) == self.settings.answer_tokens else "length"
+
+        # The "on your data" extension returns the passages it searched as citations
+        context = None
+        if request.get("data_sources"):
+            self.settings.sleep(self.settings.search_latency_ms)
+            context = {"citations": [
+                {"title": hit["title"], "content": hit["content"], "url": None, "filepath": None}
+                for hit in _search_hits(question, 5)
+            ]}
+
+        self.settings.sleep(self.settings.latency_ms)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        if request.get("stream"):
+            self._stream_chat(completion_id, words, context, finish_reason)
+            return
+
+        if self.settings.tokens_per_second:
+            time.sleep(len(words) / self.settings.tokens_per_second)
+        message = {"role": "assistant", "content": " ".join(words)}
+        if context:
+            message["context"] = context
+        self._send_json(200, {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": "mock-chat",
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": len(words),
+                "total_tokens": prompt_tokens + len(words),
+            },
+        })
+
+    def _write_chunk(self, data):
+        payload = f"data: {json.dumps(data)}\n\n".encode("utf-8")
+        self.wfile.write(f"{len(payload):x}\r\n".encode("ascii") + payload + b"\r\n")
+        self.wfile.flush()
+
+    def _stream_chat(self, completion_id, words, context, finish_reason):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def chunk(delta, finish=None):
+            return {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": "mock-chat",
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish}],
+            }
+
+        first = {"role": "assistant", "content": ""}
+        if context:
+            first["context"] = context
+        self._write_chunk(chunk(first))
+        delay = 1.0 / self.settings.tokens_per_second if self.settings.tokens_per_second else 0
+        for i, word in enumerate(words):
+            if delay:
+                time.sleep(delay)
+            self._write_chunk(chunk({"content": word if i == 0 else " " + word}))
+        self._write_chunk(chunk({}, finish_reason))
+        done = b"data: [DONE]\n\n"
+        self.wfile.write(f"{len(done):x}\r\n".encode("ascii") + done + b"\r\n0\r\n\r\n")
+        self.wfile.flush()
+
+
+class MockAzureServer(ThreadingHTTPServer):
+    """Threaded HTTP server answering both the Azure OpenAI and the Azure AI Search APIs"""
+
+    daemon_threads = True
+
+    def __init__(self, port=0, settings=None, host="127.0.0.1"):
+        super().__init__((host, port), MockAzureHandler)
+        self.settings = settings or MockSettings()
+        self._counts = {}
+        self._counts_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, name):
+        with self._counts_lock:
+            self._counts[name] = self._counts.get(name, 0) + 1
+
+    def stats(self):
+        with self._counts_lock:
+            return dict(self._counts)
+
+    def config(self, chat_model="mock-chat", embedding_model="mock-embedding", index_name="zodiac-index"):
+        """A RAG engine config pointing at this server"""
+        return {
+            "openai_endpoint": self.url + "/",
+            "openai_api_key": "mock-key",
+            "chat_model": chat_model,
+            "embedding_model": embedding_model,
+            "search_endpoint": self.url,
+            "search_api_key": "mock-key",
+            "index_name": index_name,
+        }
+
+    def start(self):
+        """Serve on a daemon thread"""
+        self._thread = threading.Thread(target=self.serve_forever, name="mock-azure", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def add_settings_arguments(parser):
+    """Command-line options shared with benchmark.py"""
+    parser.add_argument("--latency-ms", type=float, default=200, help="Chat time to first byte")
+    parser.add_argument("--jitter-ms", type=float, default=50, help="Random +/- added to every latency")
+    parser.add_argument("--tokens-per-second", type=float, default=50, help="Generation speed (0 = instant)")
+    parser.add_argument("--answer-tokens", type=int, default=120, help="Tokens in every answer")
+    parser.add_argument("--embedding-latency-ms", type=float, default=20, help="Embedding call latency")
+    parser.add_argument("--search-latency-ms", type=float, default=30, help="Index search latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests to reject")
+    parser.add_argument("--error-status", type=int, default=429, help="HTTP status of injected errors")
+    parser.add_argument("--retry-after-ms", type=int, default=200, help="retry-after-ms sent with injected 429s")
+    parser.add_argument("--seed", type=int, help="Random seed for jitter and error injection")
+
+
+def settings_from_args(args):
+    return MockSettings(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        tokens_per_second=args.tokens_per_second,
+        answer_tokens=args.answer_tokens,
+        embedding_latency_ms=args.embedding_latency_ms,
+        search_latency_ms=args.search_latency_ms,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        retry_after_ms=args.retry_after_ms,
+        seed=args.seed,
+    )
+
+
+def main():
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Mock Azure OpenAI and Azure AI Search endpoints")
+    parser.add_argument("--port", type=int, default=8089, help="Port to listen on")
+    add_settings_arguments(parser)
+    args = parser.parse_args()
+
+    server = MockAzureServer(args.port, settings_from_args(args))
+    print(f"🧪 Mock Azure OpenAI + Search listening on {server.url}")
+    print(f"   OPENAI_ENDPOINT={server.url}/")
+    print(f"   SEARCH_ENDPOINT={server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Mock server stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Prompt registry for Linda Goodman's Zodiac Guide
+Loads the versioned prompt files in prompts/ once and reports what each costs in tokens
+
+Files are named <name>.v<version>.txt; the highest version of each name is used
+unless a version is pinned. List them with: python prompt_registry.py
+"""
+
+import hashlib
+import os
+import re
+import threading
+from history import count_tokens
+
+PROMPTS_DIR = os.getenv("PROMPTS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts"))
+
+# System prompt variant used unless a request picks another
+PROMPT_VARIANT = os.getenv("PROMPT_VARIANT", "full")
+
+# Prompt file behind each system prompt variant
+SYSTEM_PROMPT_VARIANTS = {
+    "full": "system",
+    "condensed": "system_condensed",
+}
+
+_FILE_PATTERN = re.compile(r"^(?P<name>[\w-]+)\.v(?P<version>\d+)\.txt$")
+
+
+class Prompt:
+    """One version of a prompt, with its token cost"""
+
+    def __init__(self, name, version, text):
+        self.name = name
+        self.version = version
+        self.text = text
+        self.tokens = count_tokens(text)
+        self.sha = hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+
+    @property
+    def id(self):
+        """Stable identifier, e.g. "system.v1"; changes whenever the prompt does"""
+        return f"{self.name}.v{self.version}"
+
+    def __repr__(self):
+        return f"<Prompt {self.id} {self.tokens} tokens>"
+
+
+class PromptRegistry:
+    """All prompts in a directory, loaded once.
+
+    Each prompt's text is normalized on load (Unix line endings, no trailing
+    whitespace) and then never rebuilt, so the system message that opens every
+    request is byte-identical from one request to the next. That lets Azure
+    OpenAI's prompt caching reuse the prefix; it only applies to prefixes of
+    1,024 tokens or more, which the condensed variant trades away for a
+    shorter prompt.
+    """
+
+    def __init__(self, path=PROMPTS_DIR):
+        self.path = path
+        self._prompts = {}  # name -> {version: Prompt}
+        for filename in sorted(os.listdir(path)):
+            match = _FILE_PATTERN.match(filename)
+            if not match:
+                continue
+            with open(os.path.join(path, filename), encoding="utf-8") as f:
+                text = f.read().replace("\r\n", "\n").rstrip()
+            prompt = Prompt(match["name"], int(match["version"]), text)
+            self._prompts.setdefault(prompt.name, {})[prompt.version] = prompt
+
+    def get(self, name, version=None):
+        """Return a prompt by name, at its latest version unless one is given"""
+        versions = self._prompts.get(name)
+        if not versions:
+            raise KeyError(f"No prompt named '{name}' in {self.path}")
+        if version is None:
+            version = max(versions)
+        if version not in versions:
+            raise KeyError(f"Prompt '{name}' has no version {version}")
+        return versions[version]
+
+    def system(self, variant=None):
+        """Return the system prompt for a variant ("full" or "condensed")"""
+        variant = variant or PROMPT_VARIANT
+        if variant not in SYSTEM_PROMPT_VARIANTS:
+            raise ValueError(f"Unknown prompt variant: {variant}")
+        return self.get(SYSTEM_PROMPT_VARIANTS[variant])
+
+    def __iter__(self):
+        for name in sorted(self._prompts):
+            for version in sorted(self._prompts[name]):
+                yield self._prompts[name][version]
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """Return the process-wide registry, loading the prompt files on first use"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = PromptRegistry()
+        return _registry
+
+
+def main():
+    """List every prompt with its size and token cost"""
+    registry = get_registry()
+    print(f"📝 Prompts in {registry.path}")
+    for prompt in registry:
+        variants = [v for v, name in SYSTEM_PROMPT_VARIANTS.items() if name == prompt.name]
+        label = f" ({', '.join(variants)})" if variants else ""
+        print(f"   {prompt.id:<28} {prompt.tokens:>5} tokens  {len(prompt.text.encode('utf-8')):>6} bytes  "
+              f"sha {prompt.sha}{label}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,55 +1,32 @@
+import argparse
+import asyncio
 import os
 import sys
-from dotenv import load_dotenv
-from openai import AzureOpenAI
-import json
+from batch import run_batch
+from rag_engine import RagEngine, MissingConfigError
+from rag_engine import load_environment as load_engine_environment
+from client_pool import get_openai_client
+from history import ConversationHistory
+from session_store import create_conversation_store
+from metrics import start_metrics_server
+from prompt_registry import PROMPT_VARIANT, SYSTEM_PROMPT_VARIANTS
 
 def load_environment():
     """Load environment variables from .env file"""
-    load_dotenv()
-    
-    required_vars = [
-        "OPENAI_API_KEY",
-        "OPENAI_ENDPOINT", 
-        "CHAT_MODEL",
-        "EMBEDDING_MODEL",
-        "SEARCH_API_KEY",
-        "SEARCH_ENDPOINT",
-        "INDEX_NAME"
-    ]
-    
-    missing_vars = []
-    for var in required_vars:
-        if not os.getenv(var):
-            missing_vars.append(var)
-    
-    if missing_vars:
+    try:
+        return load_engine_environment()
+    except MissingConfigError as e:
         print("❌ Missing required environment variables:")
-        for var in missing_vars:
+        for var in e.missing_vars:
             print(f"   - {var}")
         print("\n📝 Please copy env_template.txt to .env and fill in your values.")
         print("🔗 See README.md for setup instructions.")
         sys.exit(1)
-    
-    return {
-        "openai_api_key": os.getenv("OPENAI_API_KEY"),
-        "openai_endpoint": os.getenv("OPENAI_ENDPOINT"),
-        "chat_model": os.getenv("CHAT_MODEL"),
-        "embedding_model": os.getenv("EMBEDDING_MODEL"),
-        "search_api_key": os.getenv("SEARCH_API_KEY"),
-        "search_endpoint": os.getenv("SEARCH_ENDPOINT"),
-        "index_name": os.getenv("INDEX_NAME")
-    }
 
 def create_openai_client(config):
     """Create and return Azure OpenAI client"""
     try:
-        client = AzureOpenAI(
-            api_version="2023-12-01-preview",
-            azure_endpoint=config["openai_endpoint"],
-            api_key=config["openai_api_key"]
-        )
-        return client
+        return get_openai_client(config)
     except Exception as e:
         print(f"❌ Error creating OpenAI client: {e}")
         sys.exit(1)
@@ -71,7 +48,29 @@ def format_response_with_sources(response_text, sources=None):
     
     return formatted_response
 
-def main():
+def answer_turn(engine, conversation, user_input):
+    """Answer one question of the conversation loop and return the StreamedResponse"""
+    print("🔍 Searching zodiac information...")
+    
+    # Stream the response so the answer starts printing right away
+    response = engine.ask_stream(user_input, conversation)
+    
+    # Display each delta as it arrives
+    print("\n♌ Zodiac Guide: ", end="", flush=True)
+    for delta in response:
+        print(delta, end="", flush=True)
+    print()
+    
+    # Show the sources collected from the Azure Search data source
+    if response.citations:
+        print(format_response_with_sources("", response.citations))
+    
+    # Add the completed turn and fold turns that left the window into the summary
+    conversation.add_turn(user_input, response.text)
+    engine.compact_history(conversation)
+    return response
+
+def main(prompt_variant=PROMPT_VARIANT, session_id=None):
     """Main application function"""
     # Clear the console
     os.system('cls' if os.name == 'nt' else 'clear')
@@ -88,89 +87,27 @@ def main():
         config = load_environment()
         print("✅ Configuration loaded successfully")
         
-        # Create OpenAI client
+        # Create the pooled OpenAI client the engine shares, failing fast on a bad configuration
         print("🔗 Connecting to Azure OpenAI...")
-        client = create_openai_client(config)
+        create_openai_client(config)
         print("✅ Connected to Azure OpenAI")
         
-        # Initialize conversation history with zodiac-focused system message
-        conversation = [
-            {
-                "role": "system", 
-                "content": """You are Linda Goodman's Zodiac Assistant, an engaging and captivating guide to zodiac signs that makes astrology come alive! 
-                
-                Your mission is to:
-                - Make zodiac information fascinating and interactive
-                - Encourage users to explore deeper aspects of astrology
-                - Provide insights that spark curiosity and further questions
-                - Create engaging narratives about zodiac characteristics
-                
-                Your expertise includes:
-                - Comprehensive zodiac sign personality traits and characteristics
-                - Detailed love compatibility analysis between different zodiac signs
-                - Relationship dynamics based on astrological elements
-                - Linda Goodman's interpretations of zodiac signs
-                - Practical insights about zodiac sign behaviors and tendencies
-                - Element-based personality analysis (Fire, Earth, Air, Water)
-                - Modality characteristics (Cardinal, Fixed, Mutable)
-                - Zodiac signs as children, teenagers, and adults
-                - Gender-specific zodiac characteristics (women vs men)
-                - Professional zodiac traits (as employees, bosses, leaders)
-                - Life stage zodiac manifestations
-                
-                When answering questions:
-                - Start with an engaging hook that captures interest
-                - Provide detailed, comprehensive responses with multiple aspects
-                - Include personality traits, strengths, weaknesses, and tendencies
-                - Explain compatibility factors in depth
-                - Reference Linda Goodman's work when providing insights
-                - Include practical examples and scenarios
-                - Cover emotional, intellectual, and behavioral characteristics
-                - Explain how different elements and modalities interact
-                - Provide relationship advice and compatibility insights
-                
-                **Essential: Always Include Examples & Anecdotes**
-                - Provide real-life scenarios and situations
-                - Include specific examples of how traits manifest
-                - Share relatable anecdotes that illustrate zodiac characteristics
-                - Use "Imagine..." or "Picture this..." scenarios
-                - Include workplace, relationship, and daily life examples
-                - Mention famous people or characters who embody the traits
-                - Create vivid, memorable examples that stick with users
-                
-                **Special Focus Areas:**
-                - **As Children**: How zodiac traits manifest in early years, learning styles, family dynamics
-                - **As Women**: Feminine energy expressions, relationship patterns, career approaches
-                - **As Men**: Masculine energy expressions, leadership styles, romantic tendencies
-                - **As Employees**: Work ethic, team dynamics, communication styles, career preferences
-                - **As Bosses/Leaders**: Management styles, decision-making, team motivation, leadership qualities
-                
-                **Engagement Techniques:**
-                - Ask thought-provoking questions to encourage exploration
-                - Suggest related topics they might find interesting
-                - Use phrases like "You might also wonder..." or "This connects to..."
-                - Mention how different life stages affect zodiac expressions
-                - Encourage users to explore their own zodiac journey
-                
-                **Response Structure:**
-                1. Engaging opening that hooks their interest
-                2. Comprehensive analysis of the zodiac sign/topic
-                3. **Specific examples and anecdotes** that illustrate the traits
-                4. Life stage manifestations (child, adult, professional) with examples
-                5. Gender-specific insights when relevant, with relatable scenarios
-                6. Interactive elements that encourage further exploration
-                7. Connection to broader astrological themes
-                
-                **Example Types to Include:**
-                - **Daily Life Scenarios**: "Picture a Leo at a party..." or "Imagine a Virgo organizing their desk..."
-                - **Relationship Situations**: "When a Cancer meets someone new..." or "A Scorpio in love might..."
-                - **Workplace Examples**: "In the office, a Capricorn boss would..." or "As an employee, a Gemini might..."
-                - **Family Dynamics**: "As a parent, a Taurus would..." or "Growing up, an Aries child..."
-                - **Social Interactions**: "At a social gathering, a Libra would..." or "In a group project, a Sagittarius..."
-                
-                Remember: You're not just providing information - you're creating an engaging journey through zodiac wisdom with vivid examples and relatable anecdotes that make users want to explore more! Be captivating, thorough, and always include memorable examples that bring the zodiac to life."""
-            }
-        ]
+        # Create the RAG engine (it supplies the zodiac-focused system message)
+        engine = RagEngine(config, prompt_variant=prompt_variant)
+        prompt = engine.prompt()
+        print(f"📝 System prompt {prompt.id} ({prompt_variant}): {prompt.tokens} tokens per request")
+        if start_metrics_server():
+            print(f"📊 Metrics at http://localhost:{os.getenv('METRICS_PORT')}/metrics")
+        
+        # Initialize conversation history (recent turns plus a rolling summary)
+        store = None
+        if session_id:
+            # Resume the session from the conversation store and save it after every turn
+            store = create_conversation_store()
+            conversation = store.load(session_id)
+            print(f"💾 Session {session_id}: {len(store.transcript(session_id)) // 2} earlier turns")
+        else:
+            conversation = ConversationHistory()
         
         print("\n♌ Ready to explore the fascinating world of zodiac signs!")
         print("Ask about any sign as a child, adult, professional, or in relationships...")
@@ -188,7 +125,9 @@ def main():
                     break
                     
                 if user_input.lower() == "clear":
-                    conversation = [conversation[0]]  # Keep system message
+                    conversation.clear()
+                    if store:
+                        store.delete(session_id)
                     print("🔄 Starting a new zodiac reading...")
                     continue
                     
@@ -196,50 +135,9 @@ def main():
                     print("❌ Please ask me about zodiac signs!")
                     continue
                 
-                # Add user message to conversation
-                conversation.append({"role": "user", "content": user_input})
-                
-                # Configure RAG parameters for zodiac content
-                rag_params = {
-                    "data_sources": [
-                        {
-                            "type": "azure_search",
-                            "parameters": {
-                                "endpoint": config["search_endpoint"],
-                                "index_name": config["index_name"],
-                                "authentication": {
-                                    "type": "api_key",
-                                    "key": config["search_api_key"],
-                                },
-                                "query_type": "vector",
-                                "embedding_dependency": {
-                                    "type": "deployment_name",
-                                    "deployment_name": config["embedding_model"],
-                                },
-                            }
-                        }
-                    ],
-                }
-                
-                print("🔍 Searching zodiac information...")
-                
-                # Get response from OpenAI
-                response = client.chat.completions.create(
-                    model=config["chat_model"] or "gpt-4o",  # Provide fallback if None
-                    messages=conversation,  # type: ignore
-                    extra_body=rag_params,
-                    temperature=0.7,  # Balanced for informative responses
-                    max_tokens=2000  # Increased for more verbose responses
-                )
-                
-                # Extract response content
-                assistant_response = response.choices[0].message.content
-                
-                # Add assistant response to conversation
-                conversation.append({"role": "assistant", "content": assistant_response or ""})
-                
-                # Display formatted response
-                print(f"\n♌ Zodiac Guide: {assistant_response}")
+                answer_turn(engine, conversation, user_input)
+                if store:
+                    store.save(session_id, conversation)
                 
             except KeyboardInterrupt:
                 print("\n\n👋 Thanks for exploring the zodiac! Goodbye!")
@@ -247,13 +145,48 @@ def main():
             except Exception as e:
                 print(f"\n❌ Error: {e}")
                 print("Please try again or type 'quit' to exit.")
-                # Remove the last user message from conversation to retry
-                if conversation and conversation[-1]["role"] == "user":
-                    conversation.pop()
     
     except Exception as e:
         print(f"❌ Fatal error: {e}")
         sys.exit(1)
 
+def batch_main(args):
+    """Answer a JSONL file of questions concurrently"""
+    config = load_environment()
+    engine = RagEngine(config, prompt_variant=args.prompt_variant)
+    start_metrics_server()
+    output = args.output or os.path.splitext(args.batch)[0] + ".answers.jsonl"
+    
+    print(f"📋 Answering questions from {args.batch} → {output}")
+    print(f"⚙️  Concurrency {args.concurrency}, RPM limit {args.rpm or 'none'}, TPM limit {args.tpm or 'none'}")
+    
+    def report(record):
+        status = "❌" if record.get("error") else "✅"
+        print(f"{status} [{record['id']}] {record['latency_ms']:.0f} ms  {record['question'][:60]}")
+    
+    answered, failed, skipped = asyncio.run(run_batch(
+        engine, args.batch, output,
+        concurrency=args.concurrency, rpm=args.rpm, tpm=args.tpm, on_result=report
+    ))
+    print(f"\n🎉 Answered {answered}, failed {failed}, skipped {skipped} already answered")
+    if failed:
+        print("🔁 Run the same command again to retry the failed questions.")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Linda Goodman's Zodiac Guide")
+    parser.add_argument("--batch", metavar="QUESTIONS_JSONL", help="Answer a JSONL file of questions instead of chatting")
+    parser.add_argument("--output", metavar="ANSWERS_JSONL", help="Where to append batch answers (default: <batch>.answers.jsonl)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Maximum requests in flight in batch mode")
+    parser.add_argument("--rpm", type=int, help="Requests-per-minute limit in batch mode")
+    parser.add_argument("--tpm", type=int, help="Tokens-per-minute limit in batch mode")
+    parser.add_argument("--prompt-variant", choices=sorted(SYSTEM_PROMPT_VARIANTS), default=PROMPT_VARIANT,
+                        help="System prompt: full, or condensed for shorter prompts and answers")
+    parser.add_argument("--session", metavar="ID", help="Keep the conversation in the session store under this id")
+    return parser.parse_args()
+
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    args = parse_args()
+    if args.batch:
+        batch_main(args)
+    else:
+        main(args.prompt_variant, args.session)
\ No newline at end of file
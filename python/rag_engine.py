@@ -0,0 +1,852 @@
+#!/usr/bin/env python3
+"""
+RAG engine for Linda Goodman's Zodiac Guide
+Shared configuration, system prompt and Azure OpenAI + Azure Search calls for every front-end
+"""
+
+import asyncio
+import os
+import time
+from dotenv import load_dotenv
+from client_pool import get_openai_client, get_async_openai_client, get_rate_limiter
+from compatibility import CompatibilityMatrix
+from context_packing import CONTEXT_PACKING, ContextPacker
+from facets import FACET_FILTER, FACET_MIN_RESULTS, QueryFacets
+from history import ConversationHistory, count_tokens, count_message_tokens
+from intent_router import IntentRouter, Route
+from metrics import RequestMetrics
+from rerank import RERANK, LexicalReranker
+from prompt_registry import PROMPT_VARIANT, Prompt, get_registry
+from rate_limit import call_with_retry, acall_with_retry
+from embedding_cache import create_embedding_cache
+from response_cache import cache_key, create_response_cache
+from tiering import TIERING, TieringPolicy
+from warmup import WarmAnswers
+from single_flight import SINGLE_FLIGHT, SingleFlight, Call, AsyncCall, SharedStream, AsyncSharedStream
+from retrieval import (RETRIEVAL_MODE, RETRIEVAL_MODES, MULTI_QUERY, SEARCH_QUERY_TYPE, SEARCH_QUERY_TYPES,
+                       SEARCH_SEMANTIC_CONFIG, build_context_message, create_retriever, plan_queries,
+                       reciprocal_rank_fusion)
+from streaming import StreamedResponse, AsyncStreamedResponse, extract_citations
+
+REQUIRED_VARS = [
+    "OPENAI_API_KEY",
+    "OPENAI_ENDPOINT",
+    "CHAT_MODEL",
+    "EMBEDDING_MODEL",
+    "SEARCH_API_KEY",
+    "SEARCH_ENDPOINT",
+    "INDEX_NAME"
+]
+
+# Upper bound on the rolling summary's length
+SUMMARY_MAX_TOKENS = 300
+
+# Rough size of the retrieved passages, which are only known after retrieval
+RETRIEVED_CONTEXT_TOKENS = 1500
+
+
+class MissingConfigError(Exception):
+    """Raised when required environment variables are not set"""
+
+    def __init__(self, missing_vars):
+        self.missing_vars = missing_vars
+        super().__init__(f"Missing required environment variables: {', '.join(missing_vars)}")
+
+
+def load_environment():
+    """Load environment variables from .env file"""
+    load_dotenv()
+
+    missing_vars = [var for var in REQUIRED_VARS if not os.getenv(var)]
+    if missing_vars:
+        raise MissingConfigError(missing_vars)
+
+    return {
+        "openai_api_key": os.getenv("OPENAI_API_KEY"),
+        "openai_endpoint": os.getenv("OPENAI_ENDPOINT"),
+        "chat_model": os.getenv("CHAT_MODEL"),
+        "embedding_model": os.getenv("EMBEDDING_MODEL"),
+        "search_api_key": os.getenv("SEARCH_API_KEY"),
+        "search_endpoint": os.getenv("SEARCH_ENDPOINT"),
+        "index_name": os.getenv("INDEX_NAME")
+    }
+
+
+def build_rag_params(config, query_type=SEARCH_QUERY_TYPE):
+    """Configure RAG parameters for zodiac content"""
+    if query_type not in SEARCH_QUERY_TYPES:
+        raise ValueError(f"Unknown search query type: {query_type}")
+    params = {
+        "data_sources": [
+            {
+                "type": "azure_search",
+                "parameters": {
+                    "endpoint": config["search_endpoint"],
+                    "index_name": config["index_name"],
+                    "authentication": {
+                        "type": "api_key",
+                        "key": config["search_api_key"],
+                    },
+                    "query_type": query_type,
+                    "embedding_dependency": {
+                        "type": "deployment_name",
+                        "deployment_name": config["embedding_model"],
+                    },
+                }
+            }
+        ],
+    }
+    if query_type == "vector_semantic_hybrid":
+        params["data_sources"][0]["parameters"]["semantic_configuration"] = SEARCH_SEMANTIC_CONFIG
+    return params
+
+
+class RagAnswer:
+    """A complete answer from the RAG engine"""
+
+    def __init__(self, text, citations=None, finish_reason=None, usage=None, cached=False):
+        self.text = text
+        self.citations = citations or []
+        self.finish_reason = finish_reason
+        self.usage = usage
+        self.cached = cached
+        self.metrics = None
+
+    @classmethod
+    def from_completion(cls, response):
+        """Build an answer from a non-streamed chat completion"""
+        choice = response.choices[0]
+        return cls(
+            text=choice.message.content or "",
+            citations=extract_citations(getattr(choice.message, "context", None)),
+            finish_reason=choice.finish_reason,
+            usage=response.usage
+        )
+
+    @classmethod
+    def from_cache(cls, entry):
+        """Build an answer from a response cache entry"""
+        return cls(entry["text"], entry["citations"], finish_reason="stop", cached=True)
+
+
+class RagEngine:
+    """Answers zodiac questions grounded in the Azure Search index.
+
+    ``ask``/``ask_stream`` use the shared sync client; ``aask``/``aask_stream``
+    use the async client so one process can serve many conversations at once.
+    ``history`` is either a ConversationHistory or a plain list of prior
+    user/assistant messages, without the system prompt.
+
+    Answers go through a ResponseCache, configured from the environment
+    unless one is passed in; pass ``cache=False`` to disable it.
+
+    In the default "extension" retrieval mode Azure OpenAI searches the index
+    itself through ``data_sources``. In "client" mode the engine embeds the
+    question, searches the index and builds the grounding context itself;
+    "local" does the same against an exported in-process LocalVectorIndex.
+    There, a question naming several signs or sign groups is searched once
+    per subject as well as whole (``multi_query``); the sub-queries are
+    embedded in one batch, searched concurrently and merged with
+    reciprocal-rank fusion. A LexicalReranker then picks the final passages
+    from a wider set of candidates by keyword overlap with the question,
+    unless the retrieval stage is already close to its time budget; pass
+    ``reranker=False`` to keep the search order. ``SEARCH_QUERY_TYPE`` adds
+    Azure's keyword and semantic ranking in the extension and client modes.
+    With ``facet_filter``, the signs, elements, modalities and life stages
+    a question names restrict the search to chunks tagged with them at
+    ingestion; a search with too few matches is repeated unfiltered.
+    Finally a ContextPacker drops duplicate and low-score passages and fits
+    the rest into a token budget, reporting the tokens saved in the request
+    metrics; pass ``packer=False`` to send the passages as retrieved.
+
+    Every Azure call goes through the endpoint's shared RateLimiter and is
+    retried with jittered exponential backoff until its deadline.
+
+    System prompts come from the PromptRegistry; ``prompt_variant`` picks the
+    "full" or "condensed" one for the engine or for a single request.
+
+    An IntentRouter runs first: pure fact questions ("What element is
+    Scorpio?") are answered from its local table without any Azure call, and
+    the facts of the signs a question mentions are added to RAG requests.
+    Pass ``router=False`` to send everything through RAG unchanged.
+
+    Pair questions ("How compatible are Aries and Libra?") are served from
+    the precomputed CompatibilityMatrix when it is current; more specific
+    ones are answered from the stored analysis instead of a fresh search.
+
+    Opening questions warmed ahead of time (``python warmup.py run``) are
+    answered from WarmAnswers before the response cache is consulted.
+
+    A TieringPolicy picks the deployment, ``max_tokens`` and prompt variant
+    per request: quick follow-ups go to FAST_CHAT_MODEL with short answers,
+    compatibility and in-depth questions get the full length. ``max_tokens``
+    caps every tier. Pass ``tiering=False`` to use one setting for all.
+
+    Concurrent identical requests (same question, conversation context and
+    prompt) share one upstream call through a SingleFlight: followers wait
+    for the leader's answer, or replay its stream chunk by chunk as it
+    arrives. Pass ``coalesce=False`` to send every request upstream.
+
+    Each answer carries a RequestMetrics (``.metrics``) with per-stage
+    timings, time to first token, token counts and retries.
+    """
+
+    def __init__(self, config, system_prompt=None, temperature=0.7, max_tokens=2000, cache=None,
+                 retrieval_mode=RETRIEVAL_MODE, embedding_cache=None, prompt_variant=PROMPT_VARIANT, router=None,
+                 compatibility=None, coalesce=SINGLE_FLIGHT, warm=None, tiering=None, multi_query=MULTI_QUERY,
+                 reranker=None, packer=None, facet_filter=FACET_FILTER):
+        if retrieval_mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode: {retrieval_mode}")
+        self.config = config
+        self.prompts = get_registry()
+        # A system_prompt string replaces the registry's prompts for every request
+        self.custom_prompt = Prompt("custom", 0, system_prompt) if system_prompt else None
+        self.prompt_variant = prompt_variant
+        self.prompt()  # Fail fast on an unknown variant
+        self.temperature = temperature  # Balanced for informative responses
+        self.max_tokens = max_tokens  # Generous for verbose responses
+        self.retrieval_mode = retrieval_mode
+        self.rag_params = build_rag_params(config)
+        self.retriever = create_retriever(config, retrieval_mode)
+        self.multi_query = multi_query
+        self.facet_filter = facet_filter
+        if reranker is None:
+            reranker = LexicalReranker() if RERANK and self.retriever is not None else None
+        self.reranker = reranker or None
+        if packer is None:
+            packer = ContextPacker() if CONTEXT_PACKING and self.retriever is not None else None
+        self.packer = packer or None
+        self.embedding_cache = embedding_cache or create_embedding_cache()
+        self.cache = create_response_cache(self.embed) if cache is None else (cache or None)
+        self.limiter = get_rate_limiter(config)
+        self.router = IntentRouter() if router is None else (router or None)
+        self.compatibility = CompatibilityMatrix.load(self) if compatibility is None else (compatibility or None)
+        self.flights = SingleFlight() if coalesce else None
+        self.warm = WarmAnswers.load(self) if warm is None else (warm or None)
+        if tiering is None:
+            tiering = TieringPolicy() if TIERING else None
+        self.tiering = tiering or None
+
+    def prompt(self, variant=None):
+        """The system Prompt for a variant, defaulting to the engine's"""
+        return self.custom_prompt or self.prompts.system(variant or self.prompt_variant)
+
+    @property
+    def client(self):
+        return get_openai_client(self.config)
+
+    @property
+    def async_client(self):
+        return get_async_openai_client(self.config)
+
+    def _observe(self, raw, tokens):
+        """Record a response's rate-limit headers and refund over-estimated tokens"""
+        self.limiter.observe_headers(raw.headers)
+        result = raw.parse()
+        usage = getattr(result, "usage", None)
+        if usage is not None and tokens:
+            self.limiter.refund(tokens - usage.total_tokens)
+        return result
+
+    def _create(self, resource, tokens, metrics=None, **kwargs):
+        """Call ``resource.create`` under the shared limiter, retrying throttled and transient failures"""
+        def attempt(timeout):
+            return self._observe(resource.with_raw_response.create(timeout=timeout, **kwargs), tokens)
+        return call_with_retry(attempt, self.limiter, tokens, on_retry=metrics.retried if metrics else None)
+
+    async def _acreate(self, resource, tokens, metrics=None, **kwargs):
+        """Async ``_create``"""
+        async def attempt(timeout):
+            return self._observe(await resource.with_raw_response.create(timeout=timeout, **kwargs), tokens)
+        return await acall_with_retry(attempt, self.limiter, tokens, on_retry=metrics.retried if metrics else None)
+
+    def _chat_tokens(self, kwargs):
+        """Estimate the TPM cost of a chat request before sending it"""
+        tokens = count_message_tokens(kwargs["messages"]) + kwargs["max_tokens"]
+        if "extra_body" in kwargs:
+            tokens += RETRIEVED_CONTEXT_TOKENS
+        return tokens
+
+    def _stream_hooks(self, lookup, metrics, kwargs):
+        """Completion and error hooks for streams: refund unused tokens, record metrics, cache the answer"""
+        # Streamed responses carry no usage, so tokens are counted locally
+        prompt_tokens = count_message_tokens(kwargs["messages"])
+        started = time.perf_counter()
+
+        def on_complete(response):
+            metrics.record_stage("generation", time.perf_counter() - started)
+            completion_tokens = count_tokens(response.text)
+            self.limiter.refund(kwargs["max_tokens"] - completion_tokens)
+            if response.first_token_at:
+                metrics.first_token(response.first_token_at)
+            metrics.finish(prompt_tokens, completion_tokens)
+            self._cache_store(lookup, response)
+
+        def on_error(response, error):
+            metrics.finish(error=f"{type(error).__name__}: {error}")
+
+        return on_complete, on_error
+
+    def _finish_answer(self, answer, metrics):
+        """Record a complete answer's usage and attach its metrics"""
+        usage = answer.usage
+        metrics.finish(usage.prompt_tokens if usage else None, usage.completion_tokens if usage else None)
+        answer.metrics = metrics
+        return answer
+
+    def embed(self, text, metrics=None):
+        """Embed text with the configured embedding deployment, skipping the call on a cache hit"""
+        model = self.config["embedding_model"]
+        vector = self.embedding_cache.get(text, model)
+        if vector is None:
+            response = self._create(self.client.embeddings, count_tokens(text), metrics, model=model, input=text)
+            vector = response.data[0].embedding
+            self.embedding_cache.put(text, model, vector)
+        return vector
+
+    async def aembed(self, text, metrics=None):
+        """Async ``embed``; the cache's SQLite reads and writes run in a worker thread"""
+        model = self.config["embedding_model"]
+        vector = await asyncio.to_thread(self.embedding_cache.get, text, model)
+        if vector is None:
+            response = await self._acreate(self.async_client.embeddings, count_tokens(text), metrics,
+                                           model=model, input=text)
+            vector = response.data[0].embedding
+            await asyncio.to_thread(self.embedding_cache.put, text, model, vector)
+        return vector
+
+    def _cached_embeddings(self, texts, cache=True):
+        """Cached vectors for texts (None where missing) and the indexes still to embed"""
+        if not cache:
+            return [None] * len(texts), list(range(len(texts)))
+        model = self.config["embedding_model"]
+        vectors = [self.embedding_cache.get(text, model) for text in texts]
+        return vectors, [i for i, vector in enumerate(vectors) if vector is None]
+
+    def _store_embeddings(self, texts, vectors, missing, response, cache=True):
+        model = self.config["embedding_model"]
+        for i, item in zip(missing, sorted(response.data, key=lambda item: item.index)):
+            vectors[i] = item.embedding
+            if cache:
+                self.embedding_cache.put(texts[i], model, item.embedding)
+        return vectors
+
+    def embed_many(self, texts, metrics=None, cache=True):
+        """Embed several texts in one request, skipping the cached ones.
+        Pass ``cache=False`` for documents, which would only crowd out query embeddings."""
+        vectors, missing = self._cached_embeddings(texts, cache)
+        if missing:
+            inputs = [texts[i] for i in missing]
+            response = self._create(self.client.embeddings, sum(count_tokens(text) for text in inputs), metrics,
+                                    model=self.config["embedding_model"], input=inputs)
+            self._store_embeddings(texts, vectors, missing, response, cache)
+        return vectors
+
+    async def aembed_many(self, texts, metrics=None, cache=True):
+        """Async ``embed_many``"""
+        vectors, missing = await asyncio.to_thread(self._cached_embeddings, texts, cache)
+        if missing:
+            inputs = [texts[i] for i in missing]
+            response = await self._acreate(self.async_client.embeddings, sum(count_tokens(text) for text in inputs),
+                                           metrics, model=self.config["embedding_model"], input=inputs)
+            await asyncio.to_thread(self._store_embeddings, texts, vectors, missing, response, cache)
+        return vectors
+
+    def _candidates(self):
+        """Passages to retrieve: the final top-k, or more for the reranker to choose from"""
+        top_k = self.retriever.top_k
+        return max(self.reranker.candidates, top_k) if self.reranker else top_k
+
+    def _fuse(self, rankings):
+        """A single ranking as is; several merged with reciprocal-rank fusion"""
+        if len(rankings) == 1:
+            return rankings[0]
+        return reciprocal_rank_fusion(rankings, self._candidates())
+
+    def _rerank(self, question, passages, metrics, started):
+        """The final top-k passages, reranked if that fits the retrieval time budget"""
+        top_k = self.retriever.top_k
+        if self.reranker is None or len(passages) <= 1:
+            return passages[:top_k]
+        if not self.reranker.fits(time.perf_counter() - started, len(passages)):
+            metrics.reranked("skipped")
+            return passages[:top_k]
+        with metrics.stage("rerank"):
+            passages = self.reranker.rerank(question, passages, top_k)
+        metrics.reranked("applied")
+        return passages
+
+    def _facets(self, question):
+        """The QueryFacets to filter a question's search by, or None when it names none or the index has none"""
+        if not self.facet_filter:
+            return None
+        facets = QueryFacets.from_question(question)
+        return facets if facets and self.retriever.can_filter() else None
+
+    def _enough(self, passages, facets, metrics):
+        """Whether a search found enough passages; records the facet filter and any fallback"""
+        if facets is None:
+            return True
+        enough = len(passages) >= min(FACET_MIN_RESULTS, self.retriever.top_k)
+        metrics.filtered(facets, fallback=not enough)
+        return enough
+
+    def retrieve(self, question, metrics=None):
+        """Find the passages that ground an answer (client and local retrieval modes)"""
+        metrics = metrics or RequestMetrics(self.retrieval_mode)
+        started = time.perf_counter()
+        queries = plan_queries(question) if self.multi_query else [question]
+        facets = self._facets(question)
+        with metrics.stage("embedding"):
+            vectors = self.embed_many(queries, metrics)
+
+        def search(facets):
+            rankings = call_with_retry(
+                lambda timeout: self.retriever.search_many(vectors, self._candidates(), queries, facets),
+                on_retry=metrics.retried
+            )
+            return self._fuse(rankings)
+
+        with metrics.stage("retrieval"):
+            passages = search(facets)
+            if not self._enough(passages, facets, metrics):
+                passages = search(None)
+        return self._rerank(question, passages, metrics, started)
+
+    async def aretrieve(self, question, metrics=None):
+        """Async ``retrieve``"""
+        metrics = metrics or RequestMetrics(self.retrieval_mode)
+        started = time.perf_counter()
+        queries = plan_queries(question) if self.multi_query else [question]
+        # The first call reads the index schema; keep it off the event loop
+        facets = await asyncio.to_thread(self._facets, question) if self.facet_filter else None
+        with metrics.stage("embedding"):
+            vectors = await self.aembed_many(queries, metrics)
+
+        async def search(facets):
+            rankings = await acall_with_retry(
+                lambda timeout: self.retriever.asearch_many(vectors, self._candidates(), queries, facets),
+                on_retry=metrics.retried
+            )
+            return self._fuse(rankings)
+
+        with metrics.stage("retrieval"):
+            passages = await search(facets)
+            if not self._enough(passages, facets, metrics):
+                passages = await search(None)
+        return self._rerank(question, passages, metrics, started)
+
+    def pack_context(self, question, passages, metrics=None):
+        """The retrieved passages as they go into the prompt, deduplicated and within the token budget"""
+        if self.packer is None or not passages:
+            return passages
+        metrics = metrics or RequestMetrics(self.retrieval_mode)
+        with metrics.stage("packing"):
+            passages, report = self.packer.pack(question, passages)
+        metrics.packed(report)
+        return passages
+
+    def _route(self, question, metrics):
+        if self.router is None:
+            return Route("rag")
+        with metrics.stage("routing"):
+            route = self.router.route(question)
+        metrics.route = route.intent if route.answer else "rag"
+        return route
+
+    def _compatibility_entry(self, route, metrics):
+        """The stored entry that answers a pair question outright, or None.
+
+        A more specific pair question ("... at work?") is instead grounded in
+        the stored analysis: it becomes the route's context and citations.
+        """
+        if route.intent != "compatibility" or self.compatibility is None:
+            return None
+        a, b = (sign.name for sign in route.signs)
+        entry = self.compatibility.get(a, b)
+        if entry is None:
+            return None
+        if route.exact:
+            metrics.route = "compatibility"
+            return entry
+        metrics.route = "personalized"
+        route.context = self.compatibility.context_message(a, b)
+        route.citations = entry["citations"]
+        return None
+
+    def _tier(self, question, history, route, variant, metrics):
+        """The TierDecision for a request that needs generation, or None without a policy"""
+        if self.tiering is None:
+            return None
+        decision = self.tiering.decide(question, bool(self._history_messages(history)), route,
+                                       self.config["chat_model"] or "gpt-4o", self.max_tokens, variant)
+        metrics.tier = decision.to_dict()
+        return decision
+
+    def _warm_entry(self, question, history, metrics, variant=None):
+        """The warmed answer to this question, or None"""
+        if self.warm is None:
+            return None
+        entry = self.warm.get(question, self._history_messages(history), self.prompt(variant).id)
+        if entry:
+            metrics.cache = "hit_warm"
+        return entry
+
+    def _cache_lookup(self, question, history, metrics=None, variant=None):
+        if not self.cache:
+            return None
+        metrics = metrics or RequestMetrics(self.retrieval_mode)
+        with metrics.stage("cache"):
+            # Answers from different prompts differ in length and style, so each gets its own entries
+            lookup = self.cache.lookup(question, self._history_messages(history), namespace=self.prompt(variant).id)
+        metrics.cache = f"hit_{lookup.tier}" if lookup.hit else "miss"
+        return lookup
+
+    def _cache_store(self, lookup, answer):
+        # Only complete answers are worth replaying
+        if lookup is not None and answer.text and answer.finish_reason == "stop":
+            self.cache.store(lookup, answer.text, answer.citations)
+
+    def _summary_kwargs(self, summary, messages):
+        transcript = "\n\n".join(f"{m['role']}: {m['content']}" for m in messages)
+        current = summary or "(empty)"
+        return {
+            "model": self.config["chat_model"] or "gpt-4o",
+            "messages": [
+                {"role": "system", "content": self.prompts.get("summary").text},
+                {"role": "user", "content": f"Current summary:\n{current}\n\nNew messages:\n{transcript}"}
+            ],
+            "temperature": 0.2,
+            "max_tokens": SUMMARY_MAX_TOKENS
+        }
+
+    def summarize(self, summary, messages):
+        """Fold messages into a rolling conversation summary"""
+        kwargs = self._summary_kwargs(summary, messages)
+        response = self._create(self.client.chat.completions, self._chat_tokens(kwargs), **kwargs)
+        return response.choices[0].message.content or summary
+
+    async def asummarize(self, summary, messages):
+        """Async ``summarize``"""
+        kwargs = self._summary_kwargs(summary, messages)
+        response = await self._acreate(self.async_client.chat.completions, self._chat_tokens(kwargs), **kwargs)
+        return response.choices[0].message.content or summary
+
+    def compact_history(self, history):
+        """Summarize turns that have left the history window; call after each answer"""
+        history.compact(self.summarize)
+
+    async def acompact_history(self, history):
+        """Async ``compact_history``"""
+        await history.acompact(self.asummarize)
+
+    def _history_messages(self, history):
+        if isinstance(history, ConversationHistory):
+            return history.request_messages()
+        return list(history or [])
+
+    def build_messages(self, question, history=None, passages=None, variant=None, facts=None):
+        """Assemble the system prompt, prior turns, any retrieved context and the new question.
+
+        Messages run from most to least stable: the static system prompt, the
+        summary and earlier turns, then this turn's context and question, so
+        consecutive requests share the longest possible cacheable prefix.
+        """
+        messages = [{"role": "system", "content": self.prompt(variant).text}]
+        messages.extend(self._history_messages(history))
+        if facts:
+            messages.append(facts)
+        if passages:
+            messages.append(build_context_message(passages))
+        messages.append({"role": "user", "content": question})
+        return messages
+
+    def estimate_tokens(self, question, history=None, variant=None):
+        """Upper estimate of the tokens a request counts against the TPM quota"""
+        prompt_tokens = count_message_tokens(self.build_messages(question, history, variant=variant))
+        return prompt_tokens + RETRIEVED_CONTEXT_TOKENS + self.max_tokens
+
+    def _request_kwargs(self, question, history, passages=None, variant=None, route=None, tier=None):
+        kwargs = {
+            "model": tier.model if tier else self.config["chat_model"] or "gpt-4o",  # Provide fallback if None
+            "messages": self.build_messages(question, history, passages, variant, route and route.context),
+            "temperature": self.temperature,
+            "max_tokens": tier.max_tokens if tier else self.max_tokens
+        }
+        if self.retriever is None and not (route and route.citations is not None):
+            kwargs["extra_body"] = self.rag_params
+        return kwargs
+
+    def _prepare(self, question, history, metrics, variant=None, route=None, tier=None):
+        """Build the chat request; returns (kwargs, citations known before generation)"""
+        if route and route.citations is not None:
+            return self._request_kwargs(question, history, None, variant, route, tier), route.citations
+        passages = self.retrieve(question, metrics) if self.retriever else None
+        passages = self.pack_context(question, passages, metrics)
+        kwargs = self._request_kwargs(question, history, passages, variant, route, tier)
+        return kwargs, [p.to_citation() for p in passages or []]
+
+    async def _aprepare(self, question, history, metrics, variant=None, route=None, tier=None):
+        """Async ``_prepare``"""
+        if route and route.citations is not None:
+            return self._request_kwargs(question, history, None, variant, route, tier), route.citations
+        passages = await self.aretrieve(question, metrics) if self.retriever else None
+        passages = self.pack_context(question, passages, metrics)
+        kwargs = self._request_kwargs(question, history, passages, variant, route, tier)
+        return kwargs, [p.to_citation() for p in passages or []]
+
+    def _flight_key(self, kind, question, history, variant):
+        """Requests that would produce the same answer: the response cache key plus the kind of call"""
+        return (kind, cache_key(question, self._history_messages(history), namespace=self.prompt(variant).id))
+
+    def _follower_hooks(self, metrics):
+        """Stream hooks for a request replaying another request's stream"""
+        started = time.perf_counter()
+
+        def on_complete(response):
+            metrics.record_stage("coalesced", time.perf_counter() - started)
+            if response.first_token_at:
+                metrics.first_token(response.first_token_at)
+            metrics.finish()
+
+        def on_error(response, error):
+            metrics.finish(error=f"{type(error).__name__}: {error}")
+
+        return on_complete, on_error
+
+    def _coalesce(self, key, metrics, generate):
+        """Run ``generate`` once for concurrent requests with the same key; followers get a copy of the answer"""
+        if self.flights is None:
+            return generate()
+        call, leader = self.flights.join(key, Call)
+        if not leader:
+            metrics.cache = "coalesced"
+            with metrics.stage("coalesced"):
+                answer = call.wait()
+            return RagAnswer(answer.text, answer.citations, answer.finish_reason)
+        try:
+            answer = generate()
+        except Exception as e:
+            call.resolve(error=e)
+            raise
+        call.resolve(answer)
+        return answer
+
+    async def _acoalesce(self, key, metrics, generate):
+        """Async ``_coalesce``"""
+        if self.flights is None:
+            return await generate()
+        call, leader = self.flights.join((asyncio.get_running_loop(),) + key, AsyncCall)
+        if not leader:
+            metrics.cache = "coalesced"
+            with metrics.stage("coalesced"):
+                answer = await call.wait()
+            return RagAnswer(answer.text, answer.citations, answer.finish_reason)
+        try:
+            answer = await generate()
+        except Exception as e:
+            call.resolve(error=e)
+            raise
+        call.resolve(answer)
+        return answer
+
+    def _coalesce_stream(self, key, metrics, open_stream):
+        """Open a stream, or subscribe to the identical one in flight; returns (chunks, citations, hooks)"""
+        if self.flights is None:
+            return open_stream()
+        shared, leader = self.flights.join(key, SharedStream)
+        if not leader:
+            metrics.cache = "coalesced"
+            shared.wait_open()
+            return shared.subscribe(), shared.citations, self._follower_hooks(metrics)
+        try:
+            stream, citations, hooks = open_stream()
+        except Exception as e:
+            shared.fail(e)
+            raise
+        return shared.open(stream, citations), citations, hooks
+
+    async def _acoalesce_stream(self, key, metrics, open_stream):
+        """Async ``_coalesce_stream``"""
+        if self.flights is None:
+            return await open_stream()
+        shared, leader = self.flights.join((asyncio.get_running_loop(),) + key, AsyncSharedStream)
+        if not leader:
+            metrics.cache = "coalesced"
+            await shared.wait_open()
+            return shared.subscribe(), shared.citations, self._follower_hooks(metrics)
+        try:
+            stream, citations, hooks = await open_stream()
+        except Exception as e:
+            shared.fail(e)
+            raise
+        return shared.open(stream, citations), citations, hooks
+
+    def _generate(self, question, history, metrics, variant, route, lookup, tier=None):
+        """Retrieve, generate and cache a complete answer"""
+        kwargs, citations = self._prepare(question, history, metrics, variant, route, tier)
+        with metrics.stage("generation"):
+            response = self._create(self.client.chat.completions, self._chat_tokens(kwargs), metrics, **kwargs)
+        answer = RagAnswer.from_completion(response)
+        answer.citations = citations or answer.citations
+        self._cache_store(lookup, answer)
+        return answer
+
+    async def _agenerate(self, question, history, metrics, variant, route, lookup, tier=None):
+        """Async ``_generate``"""
+        kwargs, citations = await self._aprepare(question, history, metrics, variant, route, tier)
+        with metrics.stage("generation"):
+            response = await self._acreate(self.async_client.chat.completions, self._chat_tokens(kwargs),
+                                           metrics, **kwargs)
+        answer = RagAnswer.from_completion(response)
+        answer.citations = citations or answer.citations
+        await asyncio.to_thread(self._cache_store, lookup, answer)
+        return answer
+
+    def _open_stream(self, question, history, metrics, variant, route, lookup, tier=None):
+        """Retrieve and start a streamed generation; returns (stream, citations, hooks)"""
+        kwargs, citations = self._prepare(question, history, metrics, variant, route, tier)
+        hooks = self._stream_hooks(lookup, metrics, kwargs)
+        stream = self._create(self.client.chat.completions, self._chat_tokens(kwargs), metrics,
+                              stream=True, **kwargs)
+        return stream, citations, hooks
+
+    async def _aopen_stream(self, question, history, metrics, variant, route, lookup, tier=None):
+        """Async ``_open_stream``"""
+        kwargs, citations = await self._aprepare(question, history, metrics, variant, route, tier)
+        hooks = self._stream_hooks(lookup, metrics, kwargs)
+        stream = await self._acreate(self.async_client.chat.completions, self._chat_tokens(kwargs), metrics,
+                                     stream=True, **kwargs)
+        return stream, citations, hooks
+
+    def ask(self, question, history=None, prompt_variant=None):
+        """Answer a question and return a RagAnswer; ``answer.metrics`` holds its RequestMetrics"""
+        metrics = RequestMetrics(self.retrieval_mode)
+        try:
+            route = self._route(question, metrics)
+            if route.answer:
+                return self._finish_answer(RagAnswer(route.answer, finish_reason="stop"), metrics)
+            entry = self._compatibility_entry(route, metrics)
+            if entry:
+                return self._finish_answer(RagAnswer(entry["text"], entry["citations"], "stop"), metrics)
+            tier = self._tier(question, history, route, prompt_variant, metrics)
+            prompt_variant = tier.prompt_variant if tier else prompt_variant
+            warmed = self._warm_entry(question, history, metrics, prompt_variant)
+            if warmed:
+                return self._finish_answer(RagAnswer.from_cache(warmed), metrics)
+
+            lookup = self._cache_lookup(question, history, metrics, prompt_variant)
+            if lookup and lookup.hit:
+                return self._finish_answer(RagAnswer.from_cache(lookup.entry), metrics)
+
+            answer = self._coalesce(
+                self._flight_key("ask", question, history, prompt_variant), metrics,
+                lambda: self._generate(question, history, metrics, prompt_variant, route, lookup, tier)
+            )
+        except Exception as e:
+            metrics.finish(error=f"{type(e).__name__}: {e}")
+            raise
+        return self._finish_answer(answer, metrics)
+
+    def ask_stream(self, question, history=None, prompt_variant=None):
+        """Answer a question as a StreamedResponse of text deltas; metrics are final once it is consumed"""
+        metrics = RequestMetrics(self.retrieval_mode)
+        try:
+            route = self._route(question, metrics)
+            entry = self._compatibility_entry(route, metrics)
+            if route.answer or entry:
+                response = StreamedResponse.replay(route.answer or entry["text"], entry and entry["citations"])
+                response.cached = False
+                response.metrics = metrics.finish()
+                return response
+            tier = self._tier(question, history, route, prompt_variant, metrics)
+            prompt_variant = tier.prompt_variant if tier else prompt_variant
+            warmed = self._warm_entry(question, history, metrics, prompt_variant)
+            if warmed:
+                response = StreamedResponse.replay(warmed["text"], warmed["citations"])
+                response.metrics = metrics.finish()
+                return response
+
+            lookup = self._cache_lookup(question, history, metrics, prompt_variant)
+            if lookup and lookup.hit:
+                response = StreamedResponse.replay(lookup.entry["text"], lookup.entry["citations"])
+                response.metrics = metrics.finish()
+                return response
+
+            stream, citations, hooks = self._coalesce_stream(
+                self._flight_key("stream", question, history, prompt_variant), metrics,
+                lambda: self._open_stream(question, history, metrics, prompt_variant, route, lookup, tier)
+            )
+        except Exception as e:
+            metrics.finish(error=f"{type(e).__name__}: {e}")
+            raise
+        response = StreamedResponse(stream, *hooks)
+        response.citations = citations
+        response.metrics = metrics
+        return response
+
+    async def aask(self, question, history=None, prompt_variant=None):
+        """Answer a question without blocking the event loop"""
+        metrics = RequestMetrics(self.retrieval_mode)
+        try:
+            route = self._route(question, metrics)
+            if route.answer:
+                return self._finish_answer(RagAnswer(route.answer, finish_reason="stop"), metrics)
+            entry = self._compatibility_entry(route, metrics)
+            if entry:
+                return self._finish_answer(RagAnswer(entry["text"], entry["citations"], "stop"), metrics)
+            tier = self._tier(question, history, route, prompt_variant, metrics)
+            prompt_variant = tier.prompt_variant if tier else prompt_variant
+            warmed = self._warm_entry(question, history, metrics, prompt_variant)
+            if warmed:
+                return self._finish_answer(RagAnswer.from_cache(warmed), metrics)
+
+            lookup = await asyncio.to_thread(self._cache_lookup, question, history, metrics, prompt_variant)
+            if lookup and lookup.hit:
+                return self._finish_answer(RagAnswer.from_cache(lookup.entry), metrics)
+
+            answer = await self._acoalesce(
+                self._flight_key("ask", question, history, prompt_variant), metrics,
+                lambda: self._agenerate(question, history, metrics, prompt_variant, route, lookup, tier)
+            )
+        except Exception as e:
+            metrics.finish(error=f"{type(e).__name__}: {e}")
+            raise
+        return self._finish_answer(answer, metrics)
+
+    async def aask_stream(self, question, history=None, prompt_variant=None):
+        """Answer a question as an AsyncStreamedResponse of text deltas"""
+        metrics = RequestMetrics(self.retrieval_mode)
+        try:
+            route = self._route(question, metrics)
+            entry = self._compatibility_entry(route, metrics)
+            if route.answer or entry:
+                response = AsyncStreamedResponse.replay(route.answer or entry["text"], entry and entry["citations"])
+                response.cached = False
+                response.metrics = metrics.finish()
+                return response
+            tier = self._tier(question, history, route, prompt_variant, metrics)
+            prompt_variant = tier.prompt_variant if tier else prompt_variant
+            warmed = self._warm_entry(question, history, metrics, prompt_variant)
+            if warmed:
+                response = AsyncStreamedResponse.replay(warmed["text"], warmed["citations"])
+                response.metrics = metrics.finish()
+                return response
+
+            lookup = await asyncio.to_thread(self._cache_lookup, question, history, metrics, prompt_variant)
+            if lookup and lookup.hit:
+                response = AsyncStreamedResponse.replay(lookup.entry["text"], lookup.entry["citations"])
+                response.metrics = metrics.finish()
+                return response
+
+            stream, citations, hooks = await self._acoalesce_stream(
+                self._flight_key("stream", question, history, prompt_variant), metrics,
+                lambda: self._aopen_stream(question, history, metrics, prompt_variant, route, lookup, tier)
+            )
+        except Exception as e:
+            metrics.finish(error=f"{type(e).__name__}: {e}")
+            raise
+        response = AsyncStreamedResponse(stream, *hooks)
+        response.citations = citations
+        response.metrics = metrics
+        return response
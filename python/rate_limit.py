@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Client-side rate limiting and retries for Linda Goodman's Zodiac Guide
+Token buckets on requests and tokens per minute, 429-aware backoff and per-request deadlines
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+
+# Deployment quota; leave unset to rely on Azure's rate-limit headers and 429s only
+AZURE_OPENAI_RPM = int(os.getenv("AZURE_OPENAI_RPM", "0")) or None
+AZURE_OPENAI_TPM = int(os.getenv("AZURE_OPENAI_TPM", "0")) or None
+
+# Retry policy for every Azure call
+AZURE_MAX_RETRIES = int(os.getenv("AZURE_MAX_RETRIES", "5"))
+AZURE_REQUEST_DEADLINE = float(os.getenv("AZURE_REQUEST_DEADLINE", "120"))
+
+# HTTP statuses worth retrying: throttling, timeouts and transient server errors
+RETRYABLE_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class DeadlineExceededError(TimeoutError):
+    """Raised when a request cannot complete within its deadline"""
+
+
+class _Bucket:
+    """A token bucket refilled continuously at ``per_minute`` tokens per minute"""
+
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount, now):
+        """Take ``amount`` from the bucket and return how long the caller must wait"""
+        self._refill(now)
+        # Never ask for more than a full bucket, or a large request could wait forever
+        self.level -= min(amount, self.capacity)
+        return max(0.0, -self.level / self.rate)
+
+    def refund(self, amount):
+        self.level = min(self.capacity, self.level + amount)
+
+    def observe_remaining(self, remaining, now):
+        """Lower the bucket to what the server says is left"""
+        self._refill(now)
+        self.level = min(self.level, remaining)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits shared by all callers.
+
+    ``acquire``/``aacquire`` reserve capacity up front and sleep until the
+    reservation is covered, so concurrent callers queue in arrival order
+    instead of bursting. Token estimates are usually high (prompt plus
+    ``max_tokens``), so callers ``refund`` the difference once the actual
+    usage is known.
+
+    ``observe_headers`` keeps the buckets in line with the server's
+    ``x-ratelimit-remaining-*`` headers, and ``pause`` holds every caller
+    back after a 429 until its ``retry-after`` has passed.
+    """
+
+    def __init__(self, rpm=None, tpm=None):
+        self._requests = _Bucket(rpm) if rpm else None
+        self._tokens = _Bucket(tpm) if tpm else None
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens, max_wait=None):
+        now = time.monotonic()
+        with self._lock:
+            wait = max(0.0, self._paused_until - now)
+            if self._requests:
+                wait = max(wait, self._requests.reserve(1, now))
+            if self._tokens and tokens:
+                wait = max(wait, self._tokens.reserve(tokens, now))
+            if max_wait is not None and wait > max_wait:
+                # Give the reservation back rather than hold capacity that will never be used
+                if self._requests:
+                    self._requests.refund(1)
+                if self._tokens and tokens:
+                    self._tokens.refund(tokens)
+                raise DeadlineExceededError(f"Rate limit wait of {wait:.1f}s exceeds the request deadline")
+            return wait
+
+    def acquire(self, tokens=0, max_wait=None):
+        """Block until a request of ``tokens`` estimated tokens may be sent"""
+        wait = self._reserve(tokens, max_wait)
+        if wait:
+            time.sleep(wait)
+
+    async def aacquire(self, tokens=0, max_wait=None):
+        """Async ``acquire``"""
+        wait = self._reserve(tokens, max_wait)
+        if wait:
+            await asyncio.sleep(wait)
+
+    def refund(self, tokens):
+        """Return over-estimated tokens to the tokens-per-minute bucket"""
+        if self._tokens and tokens > 0:
+            with self._lock:
+                self._tokens.refund(tokens)
+
+    def pause(self, seconds):
+        """Hold back every caller for ``seconds``, e.g. after a 429 with retry-after"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def observe_headers(self, headers):
+        """Sync the buckets with Azure's x-ratelimit-remaining-* response headers"""
+        now = time.monotonic()
+        with self._lock:
+            for name, bucket in (("x-ratelimit-remaining-requests", self._requests),
+                                 ("x-ratelimit-remaining-tokens", self._tokens)):
+                value = headers.get(name)
+                if bucket and value is not None:
+                    try:
+                        bucket.observe_remaining(float(value), now)
+                    except ValueError:
+                        pass
+
+
+def retry_after_seconds(error):
+    """Read retry-after-ms / retry-after from an error's HTTP response, if any"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    for name, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(name)
+        if value is not None:
+            try:
+                return max(0.0, float(value) * scale)
+            except ValueError:
+                pass
+    return None
+
+
+def is_retryable(error):
+    """Whether an Azure OpenAI or Azure Search error is worth retrying"""
+    import openai
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status in RETRYABLE_STATUSES
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, bounded by a per-request deadline"""
+
+    def __init__(self, max_retries=AZURE_MAX_RETRIES, base_delay=0.5, max_delay=30.0,
+                 deadline=AZURE_REQUEST_DEADLINE):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+
+    def delay(self, attempt, retry_after=None):
+        """Seconds to wait before retry number ``attempt`` (0-based)"""
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return max(backoff, retry_after or 0.0)
+
+
+DEFAULT_RETRY_POLICY = RetryPolicy()
+
+
+def _next_delay(error, attempt, deadline, limiter, policy):
+    """Decide whether to retry ``error``; returns the delay or raises"""
+    if not is_retryable(error) or attempt >= policy.max_retries:
+        raise error
+    retry_after = retry_after_seconds(error)
+    if retry_after and limiter:
+        limiter.pause(retry_after)
+    delay = policy.delay(attempt, retry_after)
+    if time.monotonic() + delay >= deadline:
+        raise DeadlineExceededError(f"Request deadline reached after {attempt + 1} attempts") from error
+    return delay
+
+
+def call_with_retry(fn, limiter=None, tokens=0, policy=DEFAULT_RETRY_POLICY, on_retry=None):
+    """Call ``fn(timeout)`` under the limiter, retrying transient errors until the deadline.
+
+    ``fn`` receives the seconds left before the deadline so it can pass them on
+    as the HTTP timeout. ``on_retry(attempt, error)`` is called before each retry.
+    """
+    deadline = time.monotonic() + policy.deadline
+    attempt = 0
+    while True:
+        if limiter:
+            limiter.acquire(tokens, max_wait=deadline - time.monotonic())
+        try:
+            return fn(max(0.1, deadline - time.monotonic()))
+        except Exception as e:
+            if limiter:
+                limiter.refund(tokens)  # Rejected requests do not count against the quota
+            delay = _next_delay(e, attempt, deadline, limiter, policy)
+            error = e
+        attempt += 1
+        if on_retry:
+            on_retry(attempt, error)
+        time.sleep(delay)
+
+
+async def acall_with_retry(fn, limiter=None, tokens=0, policy=DEFAULT_RETRY_POLICY, on_retry=None):
+    """Async ``call_with_retry`` for a coroutine function ``fn(timeout)``"""
+    deadline = time.monotonic() + policy.deadline
+    attempt = 0
+    while True:
+        if limiter:
+            await limiter.aacquire(tokens, max_wait=deadline - time.monotonic())
+        try:
+            return await fn(max(0.1, deadline - time.monotonic()))
+        except Exception as e:
+            if limiter:
+                limiter.refund(tokens)
+            delay = _next_delay(e, attempt, deadline, limiter, policy)
+            error = e
+        attempt += 1
+        if on_retry:
+            on_retry(attempt, error)
+        await asyncio.sleep(delay)
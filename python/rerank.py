@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Reranking for Linda Goodman's Zodiac Guide
+Reorders retrieved passages by keyword overlap with the question, within a per-request time budget
+"""
+
+import math
+import os
+import re
+import time
+from retrieval import SEARCH_TOP_K, reciprocal_rank_fusion
+
+RERANK = os.getenv("RERANK", "on").lower() not in ("off", "0", "false", "no")
+# Passages retrieved for the reranker to choose SEARCH_TOP_K from
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+# Milliseconds the retrieval stage may take per request, reranking included;
+# reranking is skipped when it would run past the budget
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "400"))
+
+_WORD_PATTERN = re.compile(r"[a-z0-9']+")
+_STOPWORDS = {
+    "a", "an", "the", "and", "or", "of", "to", "in", "on", "at", "for", "with", "by", "as", "from", "that",
+    "this", "it", "its", "how", "what", "which", "who", "why", "when", "do", "does", "did", "is", "are", "was",
+    "were", "be", "can", "will", "would", "should", "tell", "me", "about", "say", "says", "i", "my", "you",
+    "your", "they", "them", "their", "he", "she", "his", "her",
+}
+# BM25 term-frequency saturation and length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Weight of an estimate's newest observation
+_EWMA_WEIGHT = 0.2
+
+
+def content_terms(text):
+    """Lowercased content words, with a plural "s" dropped so "Leos" matches "Leo" """
+    terms = []
+    for word in _WORD_PATTERN.findall(text.lower()):
+        if word in _STOPWORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+class LexicalReranker:
+    """BM25 over the retrieved candidates, fused with their retrieval order.
+
+    Sign names, chapter titles and terms like "cusp" are where exact
+    keywords beat embeddings; titles count twice. Term statistics come from
+    the candidates themselves, so no corpus index is needed. The keyword
+    ranking is merged with the retrieval ranking by reciprocal-rank fusion,
+    so a passage both find relevant rises to the top.
+
+    ``fits`` keeps a running per-passage cost estimate and refuses reranking
+    that would take the retrieval stage past ``budget`` seconds.
+    """
+
+    def __init__(self, candidates=RERANK_CANDIDATES, budget=RERANK_BUDGET_MS / 1000):
+        self.candidates = candidates
+        self.budget = budget
+        self.seconds_per_passage = 0.0
+
+    def fits(self, elapsed, count):
+        """Whether reranking ``count`` passages fits the budget after ``elapsed`` seconds of retrieval"""
+        return elapsed + self.seconds_per_passage * count <= self.budget
+
+    def scores(self, question, passages):
+        """BM25 score of each passage for the question's terms"""
+        query = set(content_terms(question))
+        docs = [content_terms(p.title or "") * 2 + content_terms(p.content) for p in passages]
+        if not query or not docs:
+            return [0.0] * len(passages)
+        average_length = sum(len(doc) for doc in docs) / len(docs) or 1.0
+        frequencies = [{} for _ in docs]
+        for counts, doc in zip(frequencies, docs):
+            for term in doc:
+                if term in query:
+                    counts[term] = counts.get(term, 0) + 1
+        scores = []
+        for counts, doc in zip(frequencies, docs):
+            score = 0.0
+            for term, tf in counts.items():
+                containing = sum(term in other for other in frequencies)
+                idf = math.log(1 + (len(docs) - containing + 0.5) / (containing + 0.5))
+                norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * len(doc) / average_length)
+                score += idf * tf * (BM25_K1 + 1) / norm
+            scores.append(score)
+        return scores
+
+    def rerank(self, question, passages, top_k=SEARCH_TOP_K):
+        """The ``top_k`` best passages, by retrieval order and keyword score together.
+
+        Like ``reciprocal_rank_fusion`` this returns copies: ``score`` keeps
+        the retrieval score and ``fused_score`` holds the combined one.
+        """
+        started = time.perf_counter()
+        scores = self.scores(question, passages)
+        keyword = [p for score, p in sorted(zip(scores, passages), key=lambda pair: pair[0], reverse=True)
+                   if score > 0]
+        ranked = reciprocal_rank_fusion([passages, keyword], top_k)
+        if passages:
+            cost = (time.perf_counter() - started) / len(passages)
+            if self.seconds_per_passage:
+                cost = self.seconds_per_passage + _EWMA_WEIGHT * (cost - self.seconds_per_passage)
+            self.seconds_per_passage = cost
+        return ranked
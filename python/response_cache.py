@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+Response cache for Linda Goodman's Zodiac Guide
+Serves repeated questions from an exact-hash tier and an optional embedding-similarity tier
+"""
+
+import hashlib
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+
+# How many of the most recent history messages make up the "context" of a question
+CONTEXT_MESSAGES = 2
+# Seconds before a process reloads a context's semantic index from the backend, which other
+# processes may have added to
+SEMANTIC_INDEX_REFRESH = float(os.getenv("RESPONSE_CACHE_INDEX_REFRESH", "30"))
+# Conversation contexts whose semantic index a process keeps in memory
+SEMANTIC_INDEX_CONTEXTS = 256
+
+
+def normalize_question(text):
+    """Lower-case, collapse whitespace and drop trailing punctuation"""
+    text = re.sub(r"\s+", " ", text.strip().lower())
+    return text.rstrip("?!. ")
+
+
+def context_hash(history, messages=CONTEXT_MESSAGES, namespace=""):
+    """Hash the tail of the conversation that a follow-up question depends on.
+
+    ``namespace`` separates answers that must not be shared, e.g. those of different prompts.
+    """
+    tail = (history or [])[-messages:] if messages else []
+    payload = json.dumps([namespace] + [[m["role"], normalize_question(m["content"])] for m in tail])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def cache_key(question, history=None, namespace=""):
+    """Exact-match key for a question asked in a given conversation context"""
+    payload = f"{normalize_question(question)}\x1f{context_hash(history, namespace=namespace)}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _unit(vector):
+    """Scale a vector to unit length so similarity is a plain dot product"""
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+class MemoryBackend:
+    """In-process LRU store"""
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def entries(self, context):
+        """Return (key, entry) pairs stored for a conversation context"""
+        with self._lock:
+            return [(k, e) for k, e in self._entries.items() if e["context"] == context]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """On-disk LRU store shared by every process that opens the same file"""
+
+    def __init__(self, path="response_cache.db", max_entries=10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                "key TEXT PRIMARY KEY, context TEXT NOT NULL, entry TEXT NOT NULL, last_access REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS response_cache_context ON response_cache (context)")
+            db.execute("CREATE INDEX IF NOT EXISTS response_cache_access ON response_cache (last_access)")
+
+    def _connect(self):
+        # sqlite3 connections cannot be shared across threads, so keep one per thread
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+
+    def get(self, key):
+        db = self._connect()
+        row = db.execute("SELECT entry FROM response_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        with db:
+            db.execute("UPDATE response_cache SET last_access = ? WHERE key = ?", (time.time(), key))
+        return json.loads(row[0])
+
+    def set(self, key, entry):
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO response_cache (key, context, entry, last_access) VALUES (?, ?, ?, ?)",
+                (key, entry["context"], json.dumps(entry), time.time())
+            )
+            db.execute(
+                "DELETE FROM response_cache WHERE key IN ("
+                "SELECT key FROM response_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def delete(self, key):
+        with self._connect() as db:
+            db.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+
+    def entries(self, context):
+        rows = self._connect().execute(
+            "SELECT key, entry FROM response_cache WHERE context = ?", (context,)
+        ).fetchall()
+        return [(key, json.loads(entry)) for key, entry in rows]
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+
+
+class RedisBackend:
+    """Store backed by any Redis-protocol server (Redis, Valkey or a local stand-in)"""
+
+    def __init__(self, url="redis://localhost:6379/0", max_entries=10000, prefix="zodiac:response"):
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("The redis cache backend needs the 'redis' package: pip install redis")
+        self.redis = redis.Redis.from_url(url)
+        self.max_entries = max_entries
+        self.prefix = prefix
+
+    def _entry_key(self, key):
+        return f"{self.prefix}:entry:{key}"
+
+    def _context_key(self, context):
+        return f"{self.prefix}:context:{context}"
+
+    def get(self, key):
+        raw = self.redis.get(self._entry_key(key))
+        if raw is None:
+            return None
+        self.redis.zadd(f"{self.prefix}:lru", {key: time.time()})
+        return json.loads(raw)
+
+    def set(self, key, entry):
+        pipe = self.redis.pipeline()
+        pipe.set(self._entry_key(key), json.dumps(entry))
+        pipe.sadd(self._context_key(entry["context"]), key)
+        pipe.zadd(f"{self.prefix}:lru", {key: time.time()})
+        pipe.execute()
+
+        # Evict the least recently used entries beyond the limit
+        overflow = self.redis.zcard(f"{self.prefix}:lru") - self.max_entries
+        if overflow > 0:
+            for old in self.redis.zrange(f"{self.prefix}:lru", 0, overflow - 1):
+                self.delete(old.decode("utf-8"))
+
+    def delete(self, key):
+        raw = self.redis.get(self._entry_key(key))
+        pipe = self.redis.pipeline()
+        if raw is not None:
+            pipe.srem(self._context_key(json.loads(raw)["context"]), key)
+        pipe.delete(self._entry_key(key))
+        pipe.zrem(f"{self.prefix}:lru", key)
+        pipe.execute()
+
+    def entries(self, context):
+        keys = [k.decode("utf-8") for k in self.redis.smembers(self._context_key(context))]
+        if not keys:
+            return []
+        values = self.redis.mget([self._entry_key(k) for k in keys])
+        return [(k, json.loads(v)) for k, v in zip(keys, values) if v is not None]
+
+    def __len__(self):
+        return self.redis.zcard(f"{self.prefix}:lru")
+
+
+class SemanticIndex:
+    """The cached question embeddings of one conversation context as a float32 matrix,
+    so a lookup is a single matrix-vector product"""
+
+    def __init__(self, entries=()):
+        entries = [(key, entry) for key, entry in entries if entry.get("embedding")]
+        self.keys = [key for key, _ in entries]
+        self.created = np.array([entry["created"] for _, entry in entries], dtype=np.float64)
+        self.matrix = np.array([entry["embedding"] for _, entry in entries], dtype=np.float32)
+        self.loaded = time.monotonic()
+
+    def add(self, key, embedding, created):
+        self.remove(key)
+        row = np.asarray(embedding, dtype=np.float32)[None, :]
+        self.matrix = np.concatenate([self.matrix, row]) if self.keys else row
+        self.keys.append(key)
+        self.created = np.append(self.created, created)
+
+    def remove(self, key):
+        if key in self.keys:
+            row = self.keys.index(key)
+            del self.keys[row]
+            self.matrix = np.delete(self.matrix, row, axis=0)
+            self.created = np.delete(self.created, row)
+
+    def search(self, embedding, threshold, created_after=0.0):
+        """Keys of the entries at least ``threshold`` similar and created after ``created_after``, best first"""
+        if not self.keys:
+            return []
+        scores = self.matrix @ np.asarray(embedding, dtype=np.float32)
+        rows = np.flatnonzero((scores >= threshold) & (self.created > created_after))
+        return [self.keys[row] for row in rows[np.argsort(-scores[rows])]]
+
+
+class CacheLookup:
+    """Result of a cache lookup; pass it back to ResponseCache.store on a miss"""
+
+    def __init__(self, key, context, question, entry=None, embedding=None, tier=None):
+        self.key = key
+        self.context = context
+        self.question = question
+        self.entry = entry
+        self.embedding = embedding
+        self.tier = tier  # "exact", "semantic" or None on a miss
+
+    @property
+    def hit(self):
+        return self.entry is not None
+
+
+class ResponseCache:
+    """Two-tier response cache in front of the RAG call.
+
+    The exact tier matches the normalized question in the same conversation
+    context. When ``embed`` and ``semantic_threshold`` are set, a miss falls
+    back to the most similar cached question in that context whose cosine
+    similarity reaches the threshold. Each process keeps the embeddings of
+    recently used contexts in a SemanticIndex, reloaded from the backend
+    every ``SEMANTIC_INDEX_REFRESH`` seconds, and confirms a match with the
+    backend before serving it.
+    """
+
+    def __init__(self, backend=None, ttl=86400, semantic_threshold=None, embed=None):
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.ttl = ttl
+        self.semantic_threshold = semantic_threshold
+        self.embed = embed
+        self._indexes = OrderedDict()  # context -> SemanticIndex, least recently used first
+        self._lock = threading.Lock()
+
+    @property
+    def semantic(self):
+        return bool(self.embed and self.semantic_threshold)
+
+    def _fresh(self, entry):
+        return not self.ttl or time.time() - entry["created"] < self.ttl
+
+    def _index(self, context):
+        """The semantic index of a context, loaded from the backend when missing or out of date"""
+        with self._lock:
+            index = self._indexes.get(context)
+            if index is not None and time.monotonic() - index.loaded < SEMANTIC_INDEX_REFRESH:
+                self._indexes.move_to_end(context)
+                return index
+        index = SemanticIndex(self.backend.entries(context))
+        with self._lock:
+            self._indexes[context] = index
+            self._indexes.move_to_end(context)
+            while len(self._indexes) > SEMANTIC_INDEX_CONTEXTS:
+                self._indexes.popitem(last=False)
+        return index
+
+    def lookup(self, question, history=None, namespace=""):
+        """Look a question up in the exact tier, then the semantic tier"""
+        context = context_hash(history, namespace=namespace)
+        lookup = CacheLookup(cache_key(question, history, namespace), context, normalize_question(question))
+
+        entry = self.backend.get(lookup.key)
+        if entry is not None:
+            if self._fresh(entry):
+                lookup.entry, lookup.tier = entry, "exact"
+                return lookup
+            self.backend.delete(lookup.key)
+
+        if self.semantic:
+            lookup.embedding = _unit(self.embed(lookup.question))
+            index = self._index(context)
+            created_after = time.time() - self.ttl if self.ttl else 0.0
+            with self._lock:
+                matches = index.search(lookup.embedding, self.semantic_threshold, created_after)
+            for key in matches:
+                entry = self.backend.get(key)  # Also refreshes its LRU position
+                if entry is not None and self._fresh(entry):
+                    lookup.entry, lookup.tier = entry, "semantic"
+                    break
+                with self._lock:
+                    index.remove(key)  # Evicted or replaced since the index was loaded
+        return lookup
+
+    def store(self, lookup, text, citations=None):
+        """Cache an answer for the question behind a missed lookup"""
+        if self.semantic and lookup.embedding is None:
+            lookup.embedding = _unit(self.embed(lookup.question))
+        created = time.time()
+        self.backend.set(lookup.key, {
+            "question": lookup.question,
+            "context": lookup.context,
+            "text": text,
+            "citations": citations or [],
+            "embedding": lookup.embedding,
+            "created": created,
+        })
+        if lookup.embedding:
+            with self._lock:
+                index = self._indexes.get(lookup.context)
+                if index is not None:
+                    index.add(lookup.key, lookup.embedding, created)
+
+
+def create_response_cache(embed=None):
+    """Build the response cache described by the RESPONSE_CACHE_* environment variables"""
+    kind = os.getenv("RESPONSE_CACHE_BACKEND", "memory").lower()
+    max_entries = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+
+    if kind in ("", "none", "off"):
+        return None
+    if kind == "memory":
+        backend = MemoryBackend(max_entries)
+    elif kind == "sqlite":
+        backend = SQLiteBackend(os.getenv("RESPONSE_CACHE_PATH", "response_cache.db"), max_entries)
+    elif kind == "redis":
+        backend = RedisBackend(os.getenv("RESPONSE_CACHE_REDIS_URL", "redis://localhost:6379/0"), max_entries)
+    else:
+        raise ValueError(f"Unknown RESPONSE_CACHE_BACKEND: {kind}")
+
+    threshold = os.getenv("RESPONSE_CACHE_SEMANTIC_THRESHOLD")
+    return ResponseCache(
+        backend,
+        ttl=int(os.getenv("RESPONSE_CACHE_TTL", "86400")),
+        semantic_threshold=float(threshold) if threshold else None,
+        embed=embed
+    )
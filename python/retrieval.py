@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Client-side retrieval for Linda Goodman's Zodiac Guide
+Queries the Azure Search index directly and assembles the grounding context in the app
+"""
+
+import asyncio
+import copy
+import hashlib
+import os
+import re
+import sys
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from azure.core.credentials import AzureKeyCredential
+from azure.search.documents import SearchClient
+from azure.search.documents.models import VectorizedQuery
+from facets import FACET_FIELDS
+from intent_router import find_signs
+
+# "extension" lets Azure OpenAI search the index ("on your data");
+# "client" embeds, searches and builds the prompt in the app;
+# "local" does the same against an exported in-process index (see local_index.py)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "extension").lower()
+RETRIEVAL_MODES = ("extension", "client", "local")
+
+SEARCH_TOP_K = int(os.getenv("SEARCH_TOP_K", "5"))
+
+# "vector" searches embeddings only; "vector_simple_hybrid" adds keyword (BM25) search of the question;
+# "vector_semantic_hybrid" also reorders results with the index's semantic ranker (SEARCH_SEMANTIC_CONFIG)
+SEARCH_QUERY_TYPE = os.getenv("SEARCH_QUERY_TYPE", "vector").lower()
+SEARCH_QUERY_TYPES = ("vector", "vector_simple_hybrid", "vector_semantic_hybrid")
+SEARCH_SEMANTIC_CONFIG = os.getenv("SEARCH_SEMANTIC_CONFIG", "default")
+
+# Questions about several signs or sign groups are searched once per subject, and the
+# rankings merged with reciprocal-rank fusion (RRF_K damps the weight of the top ranks)
+MULTI_QUERY = os.getenv("MULTI_QUERY", "on").lower() not in ("off", "0", "false", "no")
+MULTI_QUERY_MAX = int(os.getenv("MULTI_QUERY_MAX", "4"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# Seconds to wait before reading the index schema again after a failed attempt
+SCHEMA_RETRY_SECONDS = 60
+
+# Index field names; leave an optional field empty if the index does not have it
+SEARCH_VECTOR_FIELD = os.getenv("SEARCH_VECTOR_FIELD", "contentVector")
+SEARCH_CONTENT_FIELD = os.getenv("SEARCH_CONTENT_FIELD", "content")
+SEARCH_TITLE_FIELD = os.getenv("SEARCH_TITLE_FIELD", "title")
+SEARCH_KEY_FIELD = os.getenv("SEARCH_KEY_FIELD", "id")
+SEARCH_URL_FIELD = os.getenv("SEARCH_URL_FIELD", "")
+SEARCH_FILEPATH_FIELD = os.getenv("SEARCH_FILEPATH_FIELD", "")
+
+CONTEXT_PROMPT = """Answer using the following excerpts from the zodiac library. Cite an excerpt as [docN] when you use it. If the excerpts do not cover the question, say so and answer from general zodiac knowledge."""
+
+
+class Passage:
+    """One retrieved chunk of the zodiac library"""
+
+    def __init__(self, content, title=None, score=None, id=None, url=None, filepath=None, metadata=None):
+        self.content = content
+        self.title = title
+        self.score = score
+        self.fused_score = None  # Set by reciprocal_rank_fusion; ``score`` stays the retrieval score
+        self.id = id
+        self.url = url
+        self.filepath = filepath
+        self.metadata = metadata or {}
+
+    def to_citation(self):
+        """Shape the passage like an Azure "on your data" citation"""
+        return {
+            "content": self.content,
+            "title": self.title,
+            "url": self.url,
+            "filepath": self.filepath,
+            "chunk_id": self.id,
+        }
+
+
+_WORD_PATTERN = re.compile(r"[a-z']+")
+_GROUP_WORDS = ("fire", "earth", "air", "water", "cardinal", "fixed", "mutable")
+_QUERY_STOPWORDS = {
+    "a", "an", "the", "and", "or", "of", "to", "in", "on", "at", "for", "with", "between", "vs", "versus",
+    "how", "what", "which", "who", "why", "when", "do", "does", "did", "is", "are", "was", "were", "be",
+    "can", "will", "would", "should", "tell", "me", "about", "say", "says", "linda", "goodman", "i", "my",
+    "you", "your", "they", "them", "their", "sign", "signs", "each", "other", "both",
+}
+
+
+def plan_queries(question, max_queries=MULTI_QUERY_MAX):
+    """Search queries for a question: the question itself, plus one per subject when it names several.
+
+    "How do fire signs and water signs interact?" becomes the question,
+    "fire signs interact" and "water signs interact".
+    """
+    words = _WORD_PATTERN.findall(question.lower())
+    subjects = [sign.name for sign in find_signs(question)]
+    if "sign" in words or "signs" in words:
+        subjects += [f"{group} signs" for group in _GROUP_WORDS if group in words]
+    if len(subjects) < 2 or max_queries < 2:
+        return [question]
+    focus = " ".join(word for word in words
+                     if word not in _QUERY_STOPWORDS and word not in _GROUP_WORDS and not find_signs(word))
+    return [question] + [f"{subject} {focus}".strip() for subject in subjects[:max_queries - 1]]
+
+
+def _passage_key(passage):
+    return passage.id or hashlib.sha256(passage.content.encode("utf-8")).hexdigest()
+
+
+def reciprocal_rank_fusion(rankings, top_k, k=RRF_K):
+    """Merge ranked passage lists into one, without duplicates.
+
+    Each passage scores the sum of 1 / (k + rank) over the lists it appears
+    in, so passages ranked well by several sub-queries rise to the top.
+    Returns copies carrying that sum as ``fused_score`` and the passage's
+    best retrieval score as ``score``; the input passages are left as is.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, passage in enumerate(ranking, 1):
+            entry = fused.get(_passage_key(passage))
+            if entry is None:
+                entry = fused[_passage_key(passage)] = copy.copy(passage)
+                entry.fused_score = 0.0
+            elif passage.score is not None and (entry.score is None or passage.score > entry.score):
+                entry.score = passage.score
+            entry.fused_score += 1.0 / (k + rank)
+    return sorted(fused.values(), key=lambda passage: passage.fused_score, reverse=True)[:top_k]
+
+
+def index_fields(config):
+    """Names of the Azure Search index's fields, or None if the schema cannot be read"""
+    from azure.search.documents.indexes import SearchIndexClient
+
+    try:
+        client = SearchIndexClient(str(config["search_endpoint"]), AzureKeyCredential(str(config["search_api_key"])))
+        return {field.name for field in client.get_index(str(config["index_name"])).fields}
+    except Exception as e:
+        print(f"⚠️ Could not read the schema of index {config['index_name']}: {type(e).__name__}: {e}",
+              file=sys.stderr)
+        return None
+
+
+def build_context_message(passages):
+    """Format retrieved passages as a grounding message placed before the question"""
+    excerpts = []
+    for i, passage in enumerate(passages, 1):
+        title = f" ({passage.title})" if passage.title else ""
+        excerpts.append(f"[doc{i}]{title}\n{passage.content}")
+    return {"role": "system", "content": CONTEXT_PROMPT + "\n\n" + "\n\n".join(excerpts)}
+
+
+class AzureSearchRetriever:
+    """Vector or hybrid search against the Azure Search index with the azure-search-documents SDK"""
+
+    def __init__(self, config, top_k=SEARCH_TOP_K, query_type=SEARCH_QUERY_TYPE):
+        if query_type not in SEARCH_QUERY_TYPES:
+            raise ValueError(f"Unknown search query type: {query_type}")
+        self.config = config
+        self.top_k = top_k
+        self.query_type = query_type
+        self._credential = AzureKeyCredential(str(config["search_api_key"]))
+        # Retries go through rate_limit.call_with_retry, so the SDK's own retry policy is off
+        self._client = SearchClient(
+            endpoint=str(config["search_endpoint"]),
+            index_name=str(config["index_name"]),
+            credential=self._credential,
+            retry_total=0
+        )
+        # Async clients are bound to the event loop they were created on
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._pool = ThreadPoolExecutor(MULTI_QUERY_MAX, thread_name_prefix="search")
+        self._facet_fields = None
+        self._schema_failed_at = None
+
+    def _async_client(self):
+        from azure.search.documents.aio import SearchClient as AsyncSearchClient
+
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = AsyncSearchClient(
+                endpoint=str(self.config["search_endpoint"]),
+                index_name=str(self.config["index_name"]),
+                credential=self._credential,
+                retry_total=0
+            )
+            self._async_clients[loop] = client
+        return client
+
+    def facet_fields(self):
+        """The facet fields the index has; filters only use those, so older indexes are searched unfiltered"""
+        if self._facet_fields is None:
+            if self._schema_failed_at and time.monotonic() - self._schema_failed_at < SCHEMA_RETRY_SECONDS:
+                return set()
+            fields = index_fields(self.config)
+            if fields is None:
+                # Search unfiltered for now and read the schema again later
+                self._schema_failed_at = time.monotonic()
+                return set()
+            self._facet_fields = set(FACET_FIELDS) & fields
+        return self._facet_fields
+
+    def can_filter(self):
+        return bool(self.facet_fields())
+
+    def _search_kwargs(self, vector, top_k, text=None, facets=None):
+        top_k = top_k or self.top_k
+        kwargs = {
+            "search_text": text if self.query_type != "vector" else None,
+            "vector_queries": [VectorizedQuery(vector=vector, k_nearest_neighbors=top_k, fields=SEARCH_VECTOR_FIELD)],
+            "select": [f for f in (SEARCH_KEY_FIELD, SEARCH_CONTENT_FIELD, SEARCH_TITLE_FIELD,
+                                   SEARCH_URL_FIELD, SEARCH_FILEPATH_FIELD) if f],
+            "top": top_k,
+        }
+        if self.query_type == "vector_semantic_hybrid" and text:
+            kwargs["query_type"] = "semantic"
+            kwargs["semantic_configuration_name"] = SEARCH_SEMANTIC_CONFIG
+        odata = facets.odata(self.facet_fields()) if facets else None
+        if odata:
+            kwargs["filter"] = odata
+        return kwargs
+
+    def _to_passage(self, result):
+        # Hybrid queries score by Azure's own rank fusion, which says nothing about similarity
+        hybrid = self.query_type != "vector"
+        passage = Passage(
+            content=result.get(SEARCH_CONTENT_FIELD) or "",
+            title=result.get(SEARCH_TITLE_FIELD),
+            score=None if hybrid else result.get("@search.score"),
+            id=result.get(SEARCH_KEY_FIELD),
+            url=result.get(SEARCH_URL_FIELD) if SEARCH_URL_FIELD else None,
+            filepath=result.get(SEARCH_FILEPATH_FIELD) if SEARCH_FILEPATH_FIELD else None
+        )
+        if hybrid:
+            passage.fused_score = result.get("@search.score")
+        return passage
+
+    def search(self, vector, top_k=None, text=None, facets=None):
+        """Return the passages nearest to a query embedding; hybrid query types also match ``text``,
+        and ``facets`` (a QueryFacets) filters the chunks searched"""
+        results = self._client.search(**self._search_kwargs(vector, top_k, text, facets))
+        return [self._to_passage(result) for result in results]
+
+    async def asearch(self, vector, top_k=None, text=None, facets=None):
+        """Async ``search``"""
+        results = await self._async_client().search(**self._search_kwargs(vector, top_k, text, facets))
+        return [self._to_passage(result) async for result in results]
+
+    def search_many(self, vectors, top_k=None, texts=None, facets=None):
+        """One ranking per query embedding (and its text), searched concurrently"""
+        texts = texts or [None] * len(vectors)
+        if len(vectors) == 1:
+            return [self.search(vectors[0], top_k, texts[0], facets)]
+        return list(self._pool.map(lambda vector, text: self.search(vector, top_k, text, facets), vectors, texts))
+
+    async def asearch_many(self, vectors, top_k=None, texts=None, facets=None):
+        """Async ``search_many``"""
+        texts = texts or [None] * len(vectors)
+        return list(await asyncio.gather(*(self.asearch(vector, top_k, text, facets)
+                                           for vector, text in zip(vectors, texts))))
+
+
+def create_retriever(config, mode=RETRIEVAL_MODE):
+    """Build the retriever for a retrieval mode; the extension mode needs none"""
+    if mode == "client":
+        return AzureSearchRetriever(config)
+    if mode == "local":
+        from local_index import LocalVectorIndex
+        return LocalVectorIndex.load()
+    return None
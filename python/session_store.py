@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Conversation store for Linda Goodman's Zodiac Guide
+Keeps each session's turns compressed outside the UI process and loads only the active window
+
+Sessions are evicted after SESSION_TTL seconds without activity. With the SQLite or Redis
+backend, sessions survive restarts and are shared by every replica.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from history import ConversationHistory
+
+# Seconds of inactivity after which a session is dropped
+SESSION_TTL = int(os.getenv("SESSION_TTL", "3600"))
+# How often the memory and SQLite backends sweep idle sessions (seconds)
+SESSION_SWEEP_INTERVAL = 60
+
+
+def pack_turn(user_message, assistant_message):
+    """Compress one question and answer into a single blob"""
+    return zlib.compress(json.dumps([user_message, assistant_message]).encode("utf-8"))
+
+
+def unpack_turn(blob):
+    """Decompress a turn back into its user and assistant messages"""
+    user_message, assistant_message = json.loads(zlib.decompress(blob).decode("utf-8"))
+    return [{"role": "user", "content": user_message}, {"role": "assistant", "content": assistant_message}]
+
+
+class MemoryBackend:
+    """Per-process store; compressed, but lost on restart and not shared between replicas"""
+
+    def __init__(self):
+        self._sessions = {}  # session id -> {"meta": {...}, "turns": [blob, ...]}
+        self._lock = threading.Lock()
+
+    def get_meta(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return dict(session["meta"]) if session else None
+
+    def get_turns(self, session_id, start):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return list(session["turns"][start:]) if session else []
+
+    def save(self, session_id, meta, new_turns, ttl):
+        with self._lock:
+            session = self._sessions.setdefault(session_id, {"meta": {}, "turns": []})
+            session["meta"] = dict(meta)
+            session["turns"].extend(new_turns)
+
+    def touch(self, session_id, updated, ttl):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session:
+                session["meta"]["updated"] = updated
+
+    def delete(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def evict(self, cutoff):
+        """Drop sessions idle since before ``cutoff``; returns how many"""
+        with self._lock:
+            idle = [sid for sid, session in self._sessions.items() if session["meta"]["updated"] < cutoff]
+            for session_id in idle:
+                del self._sessions[session_id]
+        return len(idle)
+
+    def __len__(self):
+        return len(self._sessions)
+
+
+class SQLiteBackend:
+    """On-disk store shared by every process that opens the same file"""
+
+    def __init__(self, path="sessions.db"):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "id TEXT PRIMARY KEY, meta TEXT NOT NULL, updated REAL NOT NULL)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS session_turns ("
+                "session_id TEXT NOT NULL, idx INTEGER NOT NULL, turn BLOB NOT NULL, PRIMARY KEY (session_id, idx))"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated)")
+
+    def _connect(self):
+        # sqlite3 connections cannot be shared across threads, so keep one per thread
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+
+    def get_meta(self, session_id):
+        row = self._connect().execute("SELECT meta FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_turns(self, session_id, start):
+        rows = self._connect().execute(
+            "SELECT turn FROM session_turns WHERE session_id = ? AND idx >= ? ORDER BY idx", (session_id, start)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def save(self, session_id, meta, new_turns, ttl):
+        first = meta["turns"] - len(new_turns)
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO sessions (id, meta, updated) VALUES (?, ?, ?)",
+                (session_id, json.dumps(meta), meta["updated"])
+            )
+            db.executemany(
+                "INSERT OR REPLACE INTO session_turns (session_id, idx, turn) VALUES (?, ?, ?)",
+                [(session_id, first + i, turn) for i, turn in enumerate(new_turns)]
+            )
+
+    def touch(self, session_id, updated, ttl):
+        with self._connect() as db:
+            row = db.execute("SELECT meta FROM sessions WHERE id = ?", (session_id,)).fetchone()
+            if row:
+                meta = dict(json.loads(row[0]), updated=updated)
+                db.execute("UPDATE sessions SET meta = ?, updated = ? WHERE id = ?",
+                           (json.dumps(meta), updated, session_id))
+
+    def delete(self, session_id):
+        with self._connect() as db:
+            db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            db.execute("DELETE FROM session_turns WHERE session_id = ?", (session_id,))
+
+    def evict(self, cutoff):
+        with self._connect() as db:
+            db.execute(
+                "DELETE FROM session_turns WHERE session_id IN (SELECT id FROM sessions WHERE updated < ?)",
+                (cutoff,)
+            )
+            return db.execute("DELETE FROM sessions WHERE updated < ?", (cutoff,)).rowcount
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+class RedisBackend:
+    """Store backed by any Redis-protocol server; idle sessions expire through Redis key TTLs"""
+
+    def __init__(self, url="redis://localhost:6379/0", prefix="zodiac:session"):
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("The redis session backend needs the 'redis' package: pip install redis")
+        self.redis = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def _meta_key(self, session_id):
+        return f"{self.prefix}:{session_id}:meta"
+
+    def _turns_key(self, session_id):
+        return f"{self.prefix}:{session_id}:turns"
+
+    def get_meta(self, session_id):
+        raw = self.redis.get(self._meta_key(session_id))
+        return json.loads(raw) if raw else None
+
+    def get_turns(self, session_id, start):
+        return self.redis.lrange(self._turns_key(session_id), start, -1)
+
+    def save(self, session_id, meta, new_turns, ttl):
+        pipe = self.redis.pipeline()
+        pipe.set(self._meta_key(session_id), json.dumps(meta), ex=ttl)
+        if new_turns:
+            pipe.rpush(self._turns_key(session_id), *new_turns)
+        pipe.expire(self._turns_key(session_id), ttl)
+        pipe.execute()
+
+    def touch(self, session_id, updated, ttl):
+        meta = self.get_meta(session_id)
+        if meta is None:
+            return
+        meta["updated"] = updated
+        pipe = self.redis.pipeline()
+        pipe.set(self._meta_key(session_id), json.dumps(meta), ex=ttl, xx=True)
+        pipe.expire(self._turns_key(session_id), ttl)
+        pipe.execute()
+
+    def delete(self, session_id):
+        self.redis.delete(self._meta_key(session_id), self._turns_key(session_id))
+
+    def evict(self, cutoff):
+        return 0  # Redis expires idle sessions itself
+
+
+class ConversationStore:
+    """Sessions of ConversationHistory kept as compressed turns.
+
+    ``load`` returns a history holding only the turns that are not yet
+    folded into the rolling summary, which is everything a request can
+    use. Older turns stay compressed in the backend, and ``transcript``
+    reads them back when the whole conversation has to be shown. ``save``
+    appends only the turns added since the session was stored.
+    """
+
+    def __init__(self, backend, ttl=SESSION_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self._last_sweep = 0.0
+
+    @staticmethod
+    def new_session_id():
+        return uuid.uuid4().hex
+
+    def _sweep(self, now):
+        """Evict idle sessions, at most once per sweep interval"""
+        if self.ttl and now - self._last_sweep >= SESSION_SWEEP_INTERVAL:
+            self._last_sweep = now
+            self.backend.evict(now - self.ttl)
+
+    def _live_meta(self, session_id, now):
+        meta = self.backend.get_meta(session_id)
+        if meta and self.ttl and now - meta["updated"] > self.ttl:
+            self.backend.delete(session_id)
+            return None
+        return meta
+
+    def load(self, session_id, **history_options):
+        """The session's active window as a ConversationHistory (empty for a new or expired session)"""
+        now = time.time()
+        self._sweep(now)
+        history = ConversationHistory(**history_options)
+        meta = self._live_meta(session_id, now)
+        if meta is None:
+            return history
+
+        first_turn = meta["summarized_upto"] // 2
+        for turn in self.backend.get_turns(session_id, first_turn):
+            history.messages.extend(unpack_turn(turn))
+        history.offset = first_turn * 2
+        history.summary = meta["summary"]
+        history.summarized_upto = meta["summarized_upto"] - history.offset
+        self.backend.touch(session_id, now, self.ttl)
+        return history
+
+    def save(self, session_id, history):
+        """Store the turns added to a history since it was loaded, plus its summary"""
+        now = time.time()
+        total = (history.offset + len(history.messages)) // 2
+        stored = self.backend.get_meta(session_id)
+        stored_turns = stored["turns"] if stored else 0
+        if total < stored_turns:
+            # The history was cleared or replaced; start the session over
+            self.backend.delete(session_id)
+            stored_turns = 0
+        first_new = max(stored_turns * 2 - history.offset, 0)
+        new_messages = history.messages[first_new:]
+        new_turns = [pack_turn(new_messages[i]["content"], new_messages[i + 1]["content"])
+                     for i in range(0, len(new_messages) - 1, 2)]
+        meta = {
+            "turns": total,
+            "summary": history.summary,
+            "summarized_upto": history.offset + history.summarized_upto,
+            "updated": now,
+        }
+        self.backend.save(session_id, meta, new_turns, self.ttl)
+
+    def transcript(self, session_id):
+        """Every message of the session, for display"""
+        if self._live_meta(session_id, time.time()) is None:
+            return []
+        messages = []
+        for turn in self.backend.get_turns(session_id, 0):
+            messages.extend(unpack_turn(turn))
+        return messages
+
+    def delete(self, session_id):
+        self.backend.delete(session_id)
+
+
+def create_conversation_store():
+    """Build the conversation store described by the SESSION_STORE_* environment variables"""
+    kind = os.getenv("SESSION_STORE_BACKEND", "memory").lower()
+    if kind == "memory":
+        backend = MemoryBackend()
+    elif kind == "sqlite":
+        backend = SQLiteBackend(os.getenv("SESSION_STORE_PATH", "sessions.db"))
+    elif kind == "redis":
+        backend = RedisBackend(os.getenv("SESSION_STORE_REDIS_URL", "redis://localhost:6379/0"))
+    else:
+        raise ValueError(f"Unknown SESSION_STORE_BACKEND: {kind}")
+    return ConversationStore(backend, SESSION_TTL)
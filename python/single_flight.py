@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Request coalescing for Linda Goodman's Zodiac Guide
+Lets concurrent identical questions share one upstream call, streams included
+"""
+
+import asyncio
+import os
+import threading
+
+# Share one generation between identical questions asked at the same time
+SINGLE_FLIGHT = os.getenv("SINGLE_FLIGHT", "on").lower() not in ("off", "0", "false", "no")
+
+
+class StreamCancelled(Exception):
+    """Every subscriber left a shared stream before it finished"""
+
+
+class SingleFlight:
+    """The calls in flight, by key.
+
+    ``join`` returns the flight already running for a key, or registers a new
+    one that the caller (the leader) must complete. A flight leaves the
+    registry as soon as it lands, so later requests start a fresh call (and
+    normally hit the response cache instead).
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def join(self, key, factory):
+        """Return (flight, leader) for a key, creating the flight with ``factory`` if none is running"""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight.followers += 1
+                return flight, False
+            flight = self._flights[key] = factory()
+            flight.on_land = lambda: self._land(key, flight)
+            return flight, True
+
+    def _land(self, key, flight):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def __len__(self):
+        return len(self._flights)
+
+
+class _Flight:
+    def __init__(self):
+        self.followers = 0
+        self.on_land = None
+
+    def _landed(self):
+        if self.on_land:
+            self.on_land()
+
+
+class Call(_Flight):
+    """A blocking call whose result (or error) is handed to every waiter"""
+
+    def __init__(self):
+        super().__init__()
+        self.result = None
+        self.error = None
+        self._done = threading.Event()
+
+    def resolve(self, result=None, error=None):
+        self.result, self.error = result, error
+        self._landed()
+        self._done.set()
+
+    def wait(self):
+        self._done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class AsyncCall(_Flight):
+    """Async ``Call``"""
+
+    def __init__(self):
+        super().__init__()
+        self.result = None
+        self.error = None
+        self._done = asyncio.Event()
+
+    def resolve(self, result=None, error=None):
+        self.result, self.error = result, error
+        self._landed()
+        self._done.set()
+
+    async def wait(self):
+        await self._done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SharedStream(_Flight):
+    """One upstream stream whose chunks are replayed to every subscriber as they arrive.
+
+    The leader ``open``s it once the request is sent, which subscribes the
+    leader in the same step; followers ``subscribe`` after ``wait_open``.
+    Subscribers pull
+    cooperatively: whichever reaches the end of the buffer first reads the
+    next chunk from upstream, so a slow or abandoned subscriber never holds
+    the others back. When the last subscriber leaves early the upstream
+    stream is closed.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+        self.citations = None
+        self.error = None
+        self.done = False
+        self._stream = None
+        self._upstream = None
+        self._pulling = True  # Nobody may pull until the leader opens the stream
+        self._subscribers = 0
+        self._cond = threading.Condition()
+
+    def open(self, stream, citations=None):
+        """Start replaying ``stream``; returns the leader's iterator over it.
+
+        The leader counts as a subscriber from here on, so a follower that
+        subscribes and leaves first cannot cancel the stream under it.
+        """
+        with self._cond:
+            self._upstream = stream
+            self._stream = iter(stream)
+            self.citations = citations
+            self._pulling = False
+            self._subscribers += 1
+            self._cond.notify_all()
+        return self._tap()
+
+    def fail(self, error):
+        """The leader could not open the stream"""
+        self._end(error)
+
+    def _end(self, error=None):
+        with self._cond:
+            self.done, self.error, self._pulling = True, error, False
+            self._cond.notify_all()
+        self._landed()
+
+    def wait_open(self):
+        """Block until the leader has opened the stream; raises the leader's error if it failed"""
+        with self._cond:
+            while self._stream is None and not self.done:
+                self._cond.wait()
+        if self._stream is None:
+            raise self.error
+
+    def subscribe(self):
+        """A new iterator over every chunk of the stream, from the first"""
+        with self._cond:
+            self._subscribers += 1
+        return self._tap()
+
+    def _tap(self):
+        index = 0
+        try:
+            while True:
+                with self._cond:
+                    while index == len(self.chunks) and self._pulling:
+                        self._cond.wait()
+                    if index < len(self.chunks):
+                        chunk = self.chunks[index]
+                    elif self.done:
+                        if self.error is not None:
+                            raise self.error
+                        return
+                    else:
+                        self._pulling = True
+                        chunk = None
+                if chunk is None:
+                    self._pull()
+                    continue
+                index += 1
+                yield chunk
+        finally:
+            self._leave()
+
+    def _pull(self):
+        try:
+            chunk = next(self._stream)
+        except StopIteration:
+            return self._end()
+        except Exception as e:
+            return self._end(e)
+        with self._cond:
+            self.chunks.append(chunk)
+            self._pulling = False
+            self._cond.notify_all()
+
+    def _leave(self):
+        with self._cond:
+            self._subscribers -= 1
+            abandoned = self._subscribers == 0 and not self.done
+        if abandoned:
+            self._end(StreamCancelled("every subscriber left the stream"))
+            close = getattr(self._upstream, "close", None)
+            if close:
+                close()
+
+
+class AsyncSharedStream(SharedStream):
+    """Async ``SharedStream``; subscribers iterate with ``async for``.
+
+    Each upstream read runs in a task of its own, so a subscriber cancelled
+    while it waits (a client disconnecting) never strands the read the
+    others are waiting on.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._cond = asyncio.Condition()
+        self._reading = None
+        self._tasks = set()  # Strong references, so pending tasks are not garbage-collected
+
+    def open(self, stream, citations=None):
+        self._upstream = stream
+        self._stream = stream.__aiter__()
+        self.citations = citations
+        self._pulling = False
+        self._subscribers += 1
+        self._notify()
+        return self._tap()
+
+    def _spawn(self, coroutine):
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _notify(self):
+        # Waking waiters needs the condition's lock; schedule it so callers need not hold it
+        async def notify():
+            async with self._cond:
+                self._cond.notify_all()
+        self._spawn(notify())
+
+    def _end(self, error=None):
+        self.done, self.error, self._pulling = True, error, False
+        self._notify()
+        self._landed()
+
+    async def wait_open(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._stream is not None or self.done)
+        if self._stream is None:
+            raise self.error
+
+    def subscribe(self):
+        self._subscribers += 1
+        return self._tap()
+
+    async def _tap(self):
+        index = 0
+        try:
+            while True:
+                async with self._cond:
+                    await self._cond.wait_for(lambda: index < len(self.chunks) or not self._pulling)
+                    if index < len(self.chunks):
+                        chunk = self.chunks[index]
+                    elif self.done:
+                        if self.error is not None:
+                            raise self.error
+                        return
+                    else:
+                        self._pulling = True
+                        self._reading = self._spawn(self._read())
+                        continue
+                index += 1
+                yield chunk
+        finally:
+            await self._leave()
+
+    async def _read(self):
+        try:
+            chunk = await self._stream.__anext__()
+        except StopAsyncIteration:
+            return self._end()
+        except asyncio.CancelledError:
+            if not self.done:
+                self._end(StreamCancelled("the upstream read was cancelled"))
+            raise
+        except Exception as e:
+            return self._end(e)
+        async with self._cond:
+            self.chunks.append(chunk)
+            self._pulling = False
+            self._cond.notify_all()
+
+    async def _leave(self):
+        self._subscribers -= 1
+        if self._subscribers == 0 and not self.done:
+            self._end(StreamCancelled("every subscriber left the stream"))
+            if self._reading is not None:
+                self._reading.cancel()
+            close = getattr(self._upstream, "close", None)
+            if close:
+                await close()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Streaming helpers for Linda Goodman's Zodiac Guide
+Turns a streamed chat completion into text deltas and collects the Azure Search citations
+"""
+
+import asyncio
+import json
+import time
+
+
+def extract_citations(context):
+    """Pull citations out of an Azure "on your data" context payload"""
+    if not context:
+        return []
+    if not isinstance(context, dict):
+        context = getattr(context, "model_dump", lambda: {})()
+
+    if context.get("citations"):
+        return list(context["citations"])
+
+    # Older API versions wrap the citations in a JSON-encoded tool message
+    for message in context.get("messages", []) or []:
+        if message.get("role") == "tool" and message.get("content"):
+            try:
+                return list(json.loads(message["content"]).get("citations", []))
+            except (ValueError, AttributeError):
+                continue
+    return []
+
+
+class StreamedResponse:
+    """Iterate over a streamed chat completion as text deltas.
+
+    Once iteration finishes, ``text`` holds the full answer and ``citations``
+    holds the sources reported by the Azure Search data source.
+    """
+
+    def __init__(self, stream, on_complete=None, on_error=None):
+        self._stream = stream
+        self._on_complete = on_complete
+        self._on_error = on_error
+        self.text = ""
+        self.citations = []
+        self.finish_reason = None
+        self.cached = False
+        self.first_token_at = None  # time.perf_counter() when the first delta arrived
+        self.metrics = None
+
+    @classmethod
+    def replay(cls, text, citations=None):
+        """Wrap an already complete answer (e.g. a cache hit) as a one-chunk stream"""
+        response = cls(None)
+        response._replay_text = text
+        response.citations = list(citations or [])
+        response.cached = True
+        return response
+
+    def _finish(self):
+        """Call the completion hook once the stream has been fully consumed"""
+        if self._on_complete:
+            self._on_complete(self)
+
+    def _fail(self, error):
+        """Call the error hook when the stream breaks off"""
+        if self._on_error:
+            self._on_error(self, error)
+
+    def _consume(self, chunk):
+        """Record one chunk and return its text delta, if any"""
+        if not chunk.choices:
+            return None
+        choice = chunk.choices[0]
+        delta = choice.delta
+
+        # The data source attaches its context to a delta; the last one seen wins
+        context = getattr(delta, "context", None) if delta else None
+        citations = extract_citations(context)
+        if citations:
+            self.citations = citations
+
+        if choice.finish_reason:
+            self.finish_reason = choice.finish_reason
+
+        content = delta.content if delta else None
+        if content:
+            if self.first_token_at is None:
+                self.first_token_at = time.perf_counter()
+            self.text += content
+        return content
+
+    def __iter__(self):
+        if self._stream is None:
+            self.text, self.finish_reason = self._replay_text, "stop"
+            yield self.text
+            return
+        try:
+            for chunk in self._stream:
+                content = self._consume(chunk)
+                if content:
+                    yield content
+        except Exception as e:
+            self._fail(e)
+            raise
+        self._finish()
+
+
+class AsyncStreamedResponse(StreamedResponse):
+    """Async counterpart of StreamedResponse for use with ``async for``"""
+
+    async def __aiter__(self):
+        if self._stream is None:
+            self.text, self.finish_reason = self._replay_text, "stop"
+            yield self.text
+            return
+        try:
+            async for chunk in self._stream:
+                content = self._consume(chunk)
+                if content:
+                    yield content
+        except Exception as e:
+            await asyncio.to_thread(self._fail, e)
+            raise
+        # The hooks write the response cache and the request log; keep that off the event loop
+        await asyncio.to_thread(self._finish)
+
+    async def aclose(self):
+        """Stop reading an unfinished stream and release its connection"""
+        if self._stream is not None:
+            # A shared stream subscription is an async generator; a direct one is the SDK's stream
+            close = getattr(self._stream, "aclose", None) or self._stream.close
+            await close()
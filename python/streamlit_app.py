@@ -7,72 +7,36 @@ A beautiful web interface for the RAG-powered zodiac assistant
 import streamlit as st
 import os
 import sys
-from dotenv import load_dotenv
-from openai import AzureOpenAI
-import json
-from datetime import datetime
 
 # Import functions from rag-app.py
 sys.path.append(os.path.dirname(__file__))
 
+from client_pool import get_openai_client, get_health_monitor
+from rag_engine import RagEngine, MissingConfigError
+from rag_engine import load_environment as load_engine_environment
+from session_store import create_conversation_store
+from warmup import EXAMPLE_QUESTIONS
+from metrics import SessionStats, start_metrics_server
+from prompt_registry import PROMPT_VARIANT
+
 def load_environment():
     """Load environment variables from .env file"""
-    load_dotenv()
-    
-    required_vars = [
-        "OPENAI_API_KEY",
-        "OPENAI_ENDPOINT", 
-        "CHAT_MODEL",
-        "EMBEDDING_MODEL",
-        "SEARCH_API_KEY",
-        "SEARCH_ENDPOINT",
-        "INDEX_NAME"
-    ]
-    
-    missing_vars = []
-    for var in required_vars:
-        if not os.getenv(var):
-            missing_vars.append(var)
-    
-    if missing_vars:
-        st.error(f"Missing required environment variables: {', '.join(missing_vars)}")
+    try:
+        config = load_engine_environment()
+    except MissingConfigError as e:
+        st.error(f"Missing required environment variables: {', '.join(e.missing_vars)}")
         st.info("Please copy env_template.txt to .env and fill in your Azure service details.")
         return None
     
-    config = {
-        "openai_api_key": os.getenv("OPENAI_API_KEY"),
-        "openai_endpoint": os.getenv("OPENAI_ENDPOINT"),
-        "chat_model": os.getenv("CHAT_MODEL"),
-        "embedding_model": os.getenv("EMBEDDING_MODEL"),
-        "search_api_key": os.getenv("SEARCH_API_KEY"),
-        "search_endpoint": os.getenv("SEARCH_ENDPOINT"),
-        "index_name": os.getenv("INDEX_NAME")
-    }
-    
-    # Debug: Show loaded config (without sensitive data)
-    st.sidebar.write("🔧 Config loaded:")
-    if config['openai_endpoint']:
-        st.sidebar.write(f"  - OpenAI Endpoint: {config['openai_endpoint'][:30]}...")
-    if config['chat_model']:
-        st.sidebar.write(f"  - Chat Model: {config['chat_model']}")
-    if config['search_endpoint']:
-        st.sidebar.write(f"  - Search Endpoint: {config['search_endpoint'][:30]}...")
-    
     return config
 
 def create_openai_client(config):
     """Create and return Azure OpenAI client"""
     try:
-        # Debug: Show what we're about to do
-        st.sidebar.write("🔧 Creating OpenAI client...")
-        st.sidebar.write(f"  - Endpoint: {config['openai_endpoint'][:30]}...")
-        st.sidebar.write(f"  - Model: {config['chat_model']}")
-        
         # Clear any proxy-related environment variables that might interfere
         proxy_vars = ['HTTP_PROXY', 'HTTPS_PROXY', 'http_proxy', 'https_proxy', 'NO_PROXY', 'no_proxy']
         for var in proxy_vars:
             if var in os.environ:
-                st.sidebar.write(f"  - Clearing {var}")
                 del os.environ[var]
         
         # Ensure we have the required config values
@@ -80,29 +44,18 @@ def create_openai_client(config):
             st.error("Missing OpenAI endpoint or API key")
             return None
             
-        # Create client using the openai module directly to avoid proxies issue
-        st.sidebar.write("  - Creating AzureOpenAI client...")
-        
-        # Create client with minimal parameters to avoid proxies issue
-        client = AzureOpenAI(
-            api_version="2023-12-01-preview",
-            azure_endpoint=str(config["openai_endpoint"]),
-            api_key=str(config["openai_api_key"])
-        )
+        # Reuse the process-wide client so reruns and sessions share one connection pool
+        client = get_openai_client(config)
         
-        # Test the client with a simple call
-        try:
-            st.sidebar.write("  - Testing client...")
-            # This will help us identify if the issue is with the client creation or the RAG call
-            test_response = client.chat.completions.create(
-                model=config["chat_model"] or "gpt-4o",
-                messages=[{"role": "user", "content": "Hello"}],
-                max_tokens=10
-            )
-            st.sidebar.success("✅ OpenAI client test successful")
-        except Exception as test_error:
-            st.sidebar.error(f"❌ OpenAI client test failed: {test_error}")
-            return None
+        # Report the background health check instead of sending a billed test prompt on every rerun.
+        # A failed probe may be a transient blip, so warn and keep serving until the next one
+        health = get_health_monitor(config).status()
+        if health["healthy"] is False:
+            st.sidebar.warning(f"⚠️ OpenAI health check failed: {health['last_error']}")
+        elif health["healthy"]:
+            st.sidebar.success("✅ OpenAI health check passed")
+        else:
+            st.sidebar.info("⏳ OpenAI health check pending")
             
         return client
     except Exception as e:
@@ -111,46 +64,56 @@ def create_openai_client(config):
         st.error(f"Error details: {str(e)}")
         return None
 
-def get_zodiac_response(client, config, user_message, conversation_history):
+@st.cache_resource
+def get_rag_engine(config):
+    """Build the RAG engine once per process and share it across sessions"""
+    start_metrics_server()
+    return RagEngine(config)
+
+@st.cache_resource
+def get_conversation_store():
+    """Open the server-side conversation store once per process"""
+    return create_conversation_store()
+
+def get_session_id(store):
+    """This browser session's conversation id, kept in the URL so a reload resumes it"""
+    if "session_id" not in st.session_state:
+        st.session_state.session_id = st.query_params.get("session") or store.new_session_id()
+    st.query_params["session"] = st.session_state.session_id
+    return st.session_state.session_id
+
+def get_zodiac_response(engine, user_message, conversation_history, prompt_variant=None):
     """Get response from Azure OpenAI using RAG"""
     try:
-        # Configure RAG parameters for zodiac content
-        rag_params = {
-            "data_sources": [
-                {
-                    "type": "azure_search",
-                    "parameters": {
-                        "endpoint": config["search_endpoint"],
-                        "index_name": config["index_name"],
-                        "authentication": {
-                            "type": "api_key",
-                            "key": config["search_api_key"],
-                        },
-                        "query_type": "vector",
-                        "embedding_dependency": {
-                            "type": "deployment_name",
-                            "deployment_name": config["embedding_model"],
-                        },
-                    }
-                }
-            ],
-        }
-        
-        # Get response from OpenAI
-        response = client.chat.completions.create(
-            model=config["chat_model"] or "gpt-4o",
-            messages=conversation_history,
-            extra_body=rag_params,
-            temperature=0.7,
-            max_tokens=2000
-        )
-        
-        return response.choices[0].message.content or ""
-        
+        return engine.ask(user_message, conversation_history, prompt_variant).text
+    except Exception as e:
+        st.error(f"Error getting response: {e}")
+        return None
+
+def stream_zodiac_response(engine, user_message, conversation_history, prompt_variant=None):
+    """Start a streamed response from Azure OpenAI using RAG"""
+    try:
+        return engine.ask_stream(user_message, conversation_history, prompt_variant)
     except Exception as e:
         st.error(f"Error getting response: {e}")
         return None
 
+def render_sources(citations):
+    """Show the Azure Search citations under an answer"""
+    with st.expander(f"📚 Sources ({len(citations)})"):
+        for i, source in enumerate(citations, 1):
+            title = source.get("title") or "Unknown"
+            content = source.get("content", "")
+            st.markdown(f"**{i}. {title}**")
+            st.caption(content[:200] + "..." if len(content) > 200 else content)
+
+def render_session_stats(placeholder, stats):
+    """Show this session's request metrics in the sidebar"""
+    with placeholder.container():
+        st.subheader("📊 Session")
+        for line in stats.summary_lines():
+            st.caption(line)
+
 def main():
     """Main Streamlit application"""
     
@@ -162,13 +125,6 @@ def main():
         initial_sidebar_state="expanded"
     )
     
-    # Debug: Check OpenAI version (AFTER page config)
-    try:
-        import openai
-        st.sidebar.write(f"🔍 OpenAI Version: {openai.__version__}")
-    except Exception as e:
-        st.sidebar.write(f"🔍 OpenAI Import Error: {e}")
-    
     # Custom CSS for beautiful styling
     st.markdown("""
     <style>
@@ -226,34 +182,56 @@ def main():
         if config:
             client = create_openai_client(config)
             if client:
+                engine = get_rag_engine(config)
                 st.success("✅ Connected to Azure OpenAI")
             else:
                 st.error("❌ Failed to connect to Azure OpenAI")
+                st.stop()
         else:
             st.error("❌ Configuration error")
             st.stop()
         
+        store = get_conversation_store()
+        session_id = get_session_id(store)
+        
+        st.markdown("---")
+        
+        # Answer style: the condensed prompt is cheaper and faster at the cost of detail
+        # "Auto" lets the tiering policy size each answer to the question
+        styles = {"Detailed": "full", "Concise": "condensed"}
+        if engine.tiering:
+            styles = {"Auto": None, **styles}
+        default_style = "Auto" if engine.tiering else next(
+            (label for label, v in styles.items() if v == PROMPT_VARIANT), "Detailed")
+        style = st.radio("📝 Answer style", list(styles), index=list(styles).index(default_style), horizontal=True)
+        prompt_variant = styles[style]
+        if prompt_variant:
+            st.caption(f"System prompt: {engine.prompt(prompt_variant).tokens} tokens per request")
+        else:
+            st.caption("Quick questions get short answers from the fast model, readings get the full length")
+        
+        st.markdown("---")
+        
+        # Request metrics for this session, refreshed after each answer
+        if "session_stats" not in st.session_state:
+            st.session_state.session_stats = SessionStats()
+        stats_placeholder = st.empty()
+        render_session_stats(stats_placeholder, st.session_state.session_stats)
+        
         st.markdown("---")
         
         # Clear conversation button
         if st.button("🔄 Clear Conversation", use_container_width=True):
-            st.session_state.messages = []
+            store.delete(session_id)
+            st.session_state.session_id = store.new_session_id()
+            st.query_params["session"] = st.session_state.session_id
             st.rerun()
         
         st.markdown("---")
         
         # Example questions
         st.subheader("💡 Example Questions")
-        examples = [
-            "What are the personality traits of a Leo?",
-            "How compatible are Aries and Libra?",
-            "Tell me about Taurus characteristics",
-            "What are the best matches for a Gemini?",
-            "How do fire signs and water signs interact?",
-            "What does Linda Goodman say about Virgo?"
-        ]
-        
-        for example in examples:
+        for example in EXAMPLE_QUESTIONS:
             if st.button(example, key=example, use_container_width=True):
                 st.session_state.user_input = example
                 st.rerun()
@@ -267,114 +245,52 @@ def main():
         - **Linda Goodman's Wisdom**: Based on her astrological work
         """)
     
-    # Main chat interface
-    if "messages" not in st.session_state:
-        st.session_state.messages = [
-            {
-                "role": "system",
-                "content": """You are Linda Goodman's Zodiac Assistant, an engaging and captivating guide to zodiac signs that makes astrology come alive! 
-                
-                Your mission is to:
-                - Make zodiac information fascinating and interactive
-                - Encourage users to explore deeper aspects of astrology
-                - Provide insights that spark curiosity and further questions
-                - Create engaging narratives about zodiac characteristics
-                
-                Your expertise includes:
-                - Comprehensive zodiac sign personality traits and characteristics
-                - Detailed love compatibility analysis between different zodiac signs
-                - Relationship dynamics based on astrological elements
-                - Linda Goodman's interpretations of zodiac signs
-                - Practical insights about zodiac sign behaviors and tendencies
-                - Element-based personality analysis (Fire, Earth, Air, Water)
-                - Modality characteristics (Cardinal, Fixed, Mutable)
-                - Zodiac signs as children, teenagers, and adults
-                - Gender-specific zodiac characteristics (women vs men)
-                - Professional zodiac traits (as employees, bosses, leaders)
-                - Life stage zodiac manifestations
-                
-                When answering questions:
-                - Start with an engaging hook that captures interest
-                - Provide detailed, comprehensive responses with multiple aspects
-                - Include personality traits, strengths, weaknesses, and tendencies
-                - Explain compatibility factors in depth
-                - Reference Linda Goodman's work when providing insights
-                - Include practical examples and scenarios
-                - Cover emotional, intellectual, and behavioral characteristics
-                - Explain how different elements and modalities interact
-                - Provide relationship advice and compatibility insights
-                
-                **Essential: Always Include Examples & Anecdotes**
-                - Provide real-life scenarios and situations
-                - Include specific examples of how traits manifest
-                - Share relatable anecdotes that illustrate zodiac characteristics
-                - Use "Imagine..." or "Picture this..." scenarios
-                - Include workplace, relationship, and daily life examples
-                - Mention famous people or characters who embody the traits
-                - Create vivid, memorable examples that stick with users
-                
-                **Special Focus Areas:**
-                - **As Children**: How zodiac traits manifest in early years, learning styles, family dynamics
-                - **As Women**: Feminine energy expressions, relationship patterns, career approaches
-                - **As Men**: Masculine energy expressions, leadership styles, romantic tendencies
-                - **As Employees**: Work ethic, team dynamics, communication styles, career preferences
-                - **As Bosses/Leaders**: Management styles, decision-making, team motivation, leadership qualities
-                
-                **Engagement Techniques:**
-                - Ask thought-provoking questions to encourage exploration
-                - Suggest related topics they might find interesting
-                - Use phrases like "You might also wonder..." or "This connects to..."
-                - Mention how different life stages affect zodiac expressions
-                - Encourage users to explore their own zodiac journey
-                
-                **Response Structure:**
-                1. Engaging opening that hooks their interest
-                2. Comprehensive analysis of the zodiac sign/topic
-                3. **Specific examples and anecdotes** that illustrate the traits
-                4. Life stage manifestations (child, adult, professional) with examples
-                5. Gender-specific insights when relevant, with relatable scenarios
-                6. Interactive elements that encourage further exploration
-                7. Connection to broader astrological themes
-                
-                **Example Types to Include:**
-                - **Daily Life Scenarios**: "Picture a Leo at a party..." or "Imagine a Virgo organizing their desk..."
-                - **Relationship Situations**: "When a Cancer meets someone new..." or "A Scorpio in love might..."
-                - **Workplace Examples**: "In the office, a Capricorn boss would..." or "As an employee, a Gemini might..."
-                - **Family Dynamics**: "As a parent, a Taurus would..." or "Growing up, an Aries child..."
-                - **Social Interactions**: "At a social gathering, a Libra would..." or "In a group project, a Sagittarius..."
-                
-                Remember: You're not just providing information - you're creating an engaging journey through zodiac wisdom with vivid examples and relatable anecdotes that make users want to explore more! Be captivating, thorough, and always include memorable examples that bring the zodiac to life."""
-            }
-        ]
+    # Main chat interface: the conversation lives in the store, only its active window is loaded
+    conversation = store.load(session_id)
     
     # Chat messages display
     chat_container = st.container()
     
     with chat_container:
-        for message in st.session_state.messages:
-            if message["role"] != "system":
-                with st.chat_message(message["role"]):
-                    st.markdown(message["content"])
+        for message in store.transcript(session_id):
+            with st.chat_message(message["role"]):
+                st.markdown(message["content"])
     
     # User input
     if prompt := st.chat_input("Ask about zodiac signs, compatibility, or astrological insights..."):
-        # Add user message to chat
-        st.session_state.messages.append({"role": "user", "content": prompt})
-        
         # Display user message
         with st.chat_message("user"):
             st.markdown(prompt)
         
-        # Get assistant response
+        # Get assistant response, rendering tokens as they arrive
         with st.chat_message("assistant"):
             with st.spinner("🔍 Searching zodiac wisdom..."):
-                response = get_zodiac_response(client, config, prompt, st.session_state.messages)
+                response = stream_zodiac_response(engine, prompt, conversation, prompt_variant)
+            
+            if response:
+                try:
+                    st.write_stream(response)
+                except Exception as e:
+                    st.error(f"Error getting response: {e}")
+                    response = None
+                finally:
+                    if response is not None:
+                        st.session_state.session_stats.add(response.metrics)
+                        render_session_stats(stats_placeholder, st.session_state.session_stats)
+            
+            if response and response.text:
+                if response.citations:
+                    render_sources(response.citations)
+                conversation.add_turn(prompt, response.text)
                 
-                if response:
-                    st.markdown(response)
-                    st.session_state.messages.append({"role": "assistant", "content": response})
-                else:
-                    st.error("Sorry, I encountered an error. Please try again.")
+                # Fold turns that left the history window into the rolling summary
+                try:
+                    engine.compact_history(conversation)
+                except Exception as e:
+                    st.sidebar.warning(f"Could not summarize older turns: {e}")
+                store.save(session_id, conversation)
+            else:
+                st.error("Sorry, I encountered an error. Please try again.")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Tests for the HTTP API's conversation handling
+"""
+
+import asyncio
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+from api_server import create_app
+from embedding_cache import EmbeddingCache
+from mock_azure import MockAzureServer, MockSettings
+from rag_engine import RagEngine
+from session_store import ConversationStore, MemoryBackend
+
+
+@pytest.fixture(scope="module")
+def server():
+    server = MockAzureServer(settings=MockSettings(latency_ms=0, jitter_ms=0, tokens_per_second=0))
+    server.start()
+    yield server
+    server.stop()
+
+
+def _run(server, scenario):
+    async def main():
+        engine = RagEngine(server.config(), cache=False, embedding_cache=EmbeddingCache(path=""), router=False,
+                           coalesce=False)
+        store = ConversationStore(MemoryBackend())
+        async with TestClient(TestServer(create_app(engine, store))) as client:
+            return await scenario(client, engine, store)
+    return asyncio.run(main())
+
+
+def test_session_turn_is_stored_after_the_answer(server):
+    async def scenario(client, engine, store):
+        response = await client.post("/v1/ask", json={"question": "Why are Leos proud?", "session": "s1"})
+        assert response.status == 200
+        response = await client.post("/v1/ask/stream", json={"question": "And Virgos?", "session": "s1"})
+        body = await response.text()
+        assert "event: done" in body
+        await asyncio.sleep(0.1)  # The turn is stored in the background
+        return store.transcript("s1")
+
+    transcript = _run(server, scenario)
+    assert [m["content"] for m in transcript if m["role"] == "user"] == ["Why are Leos proud?", "And Virgos?"]
+
+
+def test_request_history_is_windowed(server):
+    history = []
+    for i in range(20):
+        history += [{"role": "user", "content": f"Question {i}"}, {"role": "assistant", "content": f"Answer {i}"}]
+
+    async def scenario(client, engine, store):
+        sent = []
+        build_messages = engine.build_messages
+
+        def recording_build_messages(question, history=None, *args, **kwargs):
+            sent.append(engine._history_messages(history))
+            return build_messages(question, history, *args, **kwargs)
+
+        engine.build_messages = recording_build_messages
+        response = await client.post("/v1/ask", json={"question": "Why are Leos proud?", "history": history})
+        assert response.status == 200
+        return sent
+
+    sent = _run(server, scenario)
+    assert sent and len(sent[0]) < len(history)
+    assert sent[0][-1] == {"role": "assistant", "content": "Answer 19"}
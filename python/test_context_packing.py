@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Tests for deduplicating and token-budgeting retrieved passages
+"""
+
+from context_packing import ContextPacker, MinHasher
+from rerank import LexicalReranker
+from retrieval import Passage
+
+_TEXTS = [
+    "Leo children need an audience. Praise them often and they will shine for you.",
+    "The Aries boss wants results yesterday and forgets the slow start of others.",
+    "A Taurus employee works steadily and resents being hurried by anyone.",
+    "Scorpio keeps secrets well and expects the same loyalty from friends.",
+    "Pisces dreams widely and drifts between many worlds at the same time.",
+]
+
+
+def _passages(scores):
+    return [Passage(text, title=f"Chapter {i}", score=score, id=str(i))
+            for i, (text, score) in enumerate(zip(_TEXTS, scores))]
+
+
+def test_low_score_tail_is_dropped():
+    packed, report = ContextPacker(min_score_ratio=0.5).pack("Leo", _passages([0.9, 0.8, 0.7, 0.4, 0.3]))
+    assert [p.id for p in packed] == ["0", "1", "2"]
+    assert report["low_score"] == 2
+
+
+def test_packing_after_rerank_keeps_passages_without_keyword_overlap():
+    # Only the first passage shares a word with the question, so it alone gains a keyword rank
+    ranked = LexicalReranker().rerank("What do Leo children need?", _passages([0.85, 0.84, 0.83, 0.82, 0.81]))
+    packed, report = ContextPacker(min_score_ratio=0.5).pack("What do Leo children need?", ranked)
+    assert report["low_score"] == 0
+    assert len(packed) == 5
+    assert packed[0].id == "0"
+
+
+def test_passages_without_retrieval_scores_are_kept():
+    passages = _passages([None] * 5)
+    for i, passage in enumerate(passages):
+        passage.fused_score = 0.03 / (i + 1)  # A hybrid search's own fused scores
+    packed, report = ContextPacker(min_score_ratio=0.5).pack("Leo", passages)
+    assert report["low_score"] == 0
+    assert len(packed) == 5
+
+
+def test_near_duplicates_are_dropped():
+    passages = _passages([0.9, 0.8])
+    passages[1].content = passages[0].content + " Really."
+    packed, report = ContextPacker().pack("Leo", passages)
+    assert [p.id for p in packed] == ["0"]
+    assert report["duplicates"] == 1
+
+
+def test_budget_caps_tokens():
+    packed, report = ContextPacker(token_budget=40, min_score_ratio=0).pack("Leo", _passages([0.9] * 5))
+    assert report["tokens_out"] <= 40
+    assert report["over_budget"] == 5 - len(packed)
+    assert report["tokens_saved"] == report["tokens_in"] - report["tokens_out"]
+
+
+def test_minhash_similarity():
+    hasher = MinHasher()
+    text = " ".join(_TEXTS)
+    assert hasher.similarity(hasher.signature(text), hasher.signature(text)) == 1.0
+    assert hasher.similarity(hasher.signature(_TEXTS[0]), hasher.signature(_TEXTS[3])) < 0.2
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Tests for the query embedding cache
+"""
+
+import pytest
+from embedding_cache import EmbeddingCache, create_embedding_cache
+
+
+@pytest.mark.parametrize("on_disk", [False, True])
+def test_embedding_cache_hit(tmp_path, on_disk):
+    path = str(tmp_path / "embeddings.db") if on_disk else ""
+    cache = EmbeddingCache(path=path)
+    assert cache.get("Why are Leos proud?", "model") is None
+    cache.put("Why are Leos proud?", "model", [0.5, 0.25])
+    assert cache.get("why are leos proud", "model") == [0.5, 0.25]
+    assert cache.get("Why are Leos proud?", "other-model") is None
+
+
+def test_embedding_cache_survives_restart(tmp_path):
+    path = str(tmp_path / "embeddings.db")
+    EmbeddingCache(path=path).put("Why are Leos proud?", "model", [0.5, 0.25])
+    assert EmbeddingCache(path=path).get("Why are Leos proud?", "model") == [0.5, 0.25]
+
+
+def test_embedding_cache_memory_is_bounded():
+    cache = EmbeddingCache(path="", max_entries=2)
+    for i, text in enumerate(("leo", "virgo", "aries")):
+        cache.put(text, "model", [float(i)])
+    assert cache.get("leo", "model") is None
+    assert cache.get("aries", "model") == [2.0]
+
+
+def test_factory_keeps_embeddings_in_memory_unless_a_path_is_set(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("EMBEDDING_CACHE_PATH", raising=False)
+    assert create_embedding_cache().path == ""
+    assert list(tmp_path.iterdir()) == []
+
+    monkeypatch.setenv("EMBEDDING_CACHE_PATH", str(tmp_path / "embeddings.db"))
+    monkeypatch.setenv("EMBEDDING_CACHE_SIZE", "3")
+    cache = create_embedding_cache()
+    assert cache.path == str(tmp_path / "embeddings.db") and cache.max_entries == 3
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Tests for the conversation history window and rolling summary
+"""
+
+from history import ConversationHistory, count_message_tokens
+
+
+def _history(turns, **options):
+    history = ConversationHistory(**options)
+    for i in range(turns):
+        history.add_turn(f"Question {i} about the signs", f"Answer {i} " + "word " * 40)
+    return history
+
+
+def test_window_keeps_the_last_turns():
+    history = _history(5, token_budget=100_000, max_turns=2)
+    messages = history.request_messages()
+    assert [m["content"] for m in messages if m["role"] == "user"] == ["Question 3 about the signs",
+                                                                       "Question 4 about the signs"]
+
+
+def test_window_fits_the_token_budget():
+    history = _history(6, token_budget=150, max_turns=10)
+    messages = history.request_messages()
+    assert count_message_tokens(messages) <= 150
+    assert messages[-2]["content"] == "Question 5 about the signs"
+    assert len(messages) % 2 == 0  # Whole turns only
+
+
+def test_last_turn_is_kept_even_over_budget():
+    history = _history(3, token_budget=1, max_turns=10)
+    assert [m["content"] for m in history.request_messages()][0] == "Question 2 about the signs"
+
+
+def test_evicted_turns_are_summarized_once():
+    history = _history(4, token_budget=100_000, max_turns=2)
+    calls = []
+
+    def summarize(summary, messages):
+        calls.append(len(messages))
+        return (summary + " " if summary else "") + f"{len(messages) // 2} turns"
+
+    history.compact(summarize)
+    assert calls == [4]
+    assert history.pending_messages() == []
+    history.compact(summarize)
+    assert calls == [4]  # Nothing new to fold in
+
+    history.add_turn("Question 4 about the signs", "Answer 4")
+    history.compact(summarize)
+    assert calls == [4, 2]
+    messages = history.request_messages()
+    assert messages[0] == {"role": "system", "content": "Summary of the earlier conversation:\n2 turns 1 turns"}
+    assert len(messages) == 1 + 2 * 2
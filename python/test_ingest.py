@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Tests for incremental ingestion into a local index
+"""
+
+import asyncio
+import os
+import subprocess
+import sys
+import pytest
+from embedding_cache import EmbeddingCache
+from ingest import LocalIndexTarget, Manifest, chunk_document, ingest, source_files
+from local_index import LocalVectorIndex
+from mock_azure import MockAzureServer
+from rag_engine import RagEngine
+
+_CHAPTERS = {
+    "leo.md": "# The Leo Child\n\nLeo children need an audience. Praise them often.\n\n"
+              "# The Leo Boss\n\nThe Leo boss rules the office like a throne room.",
+    "virgo.md": "# The Virgo Woman\n\nShe notices every detail and forgives few of them.",
+    "aries.txt": "Aries rushes in where angels fear to tread.",
+}
+
+
+@pytest.fixture(scope="module")
+def server():
+    server = MockAzureServer()
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def library(tmp_path, server):
+    source = tmp_path / "library"
+    source.mkdir()
+    for name, text in _CHAPTERS.items():
+        (source / name).write_text(text, encoding="utf-8")
+    engine = RagEngine(server.config(), cache=False, embedding_cache=EmbeddingCache(path=""), router=False)
+    target_path = str(tmp_path / "index")
+    manifest_path = str(tmp_path / "manifest.json")
+
+    def run(**options):
+        before = server.stats().get("embeddings", 0)
+        report = asyncio.run(ingest(engine, LocalIndexTarget(target_path), Manifest(manifest_path),
+                                    source_files(str(source)), **options))
+        return report, server.stats().get("embeddings", 0) - before
+
+    return source, target_path, run
+
+
+def test_chunks_follow_markdown_headings():
+    chunks = chunk_document(_CHAPTERS["leo.md"], "leo.md")
+    assert [chunk["title"] for chunk in chunks] == ["The Leo Child", "The Leo Boss"]
+    assert chunk_document(_CHAPTERS["aries.txt"], "aries.txt")[0]["title"] == "Aries"
+
+
+def test_unchanged_files_are_skipped(library):
+    source, target_path, run = library
+    report, calls = run()
+    assert report["changed"] == 3 and report["chunks_embedded"] == 4 and report["failed"] == 0
+    assert calls > 0
+    assert len(LocalVectorIndex.load(target_path)) == 4
+
+    report, calls = run()
+    assert report["unchanged"] == 3 and report["changed"] == 0
+    assert report["chunks_embedded"] == 0
+    assert calls == 0
+
+
+def test_touched_file_is_not_re_embedded(library):
+    source, target_path, run = library
+    run()
+    os.utime(source / "virgo.md", (1, 1))
+    report, calls = run()
+    assert report["changed"] == 0 and calls == 0
+
+
+def test_edited_and_removed_files_are_reingested(library):
+    source, target_path, run = library
+    run()
+    (source / "leo.md").write_text(_CHAPTERS["leo.md"].replace("throne room", "royal court"), encoding="utf-8")
+    (source / "aries.txt").unlink()
+    report, calls = run()
+    assert report["changed"] == 1 and report["removed"] == 1
+    # Only the edited section is embedded again; the untouched one keeps its chunk
+    assert report["chunks_embedded"] == 1 and report["chunks_kept"] == 1
+    assert report["chunks_deleted"] == 2
+    assert calls == 1
+
+    index = LocalVectorIndex.load(target_path)
+    contents = [chunk["content"] for chunk in index.chunks]
+    assert len(index) == 3
+    assert any("royal court" in content for content in contents)
+    assert not any("throne room" in content or "Aries" in content for content in contents)
+
+
+def test_force_reingests_everything(library):
+    source, target_path, run = library
+    run()
+    report, calls = run(force=True)
+    assert report["changed"] == 3 and report["chunks_embedded"] == 4
+    assert len(LocalVectorIndex.load(target_path)) == 4
+
+
+def test_command_line_builds_a_local_index_from_scratch(tmp_path, server):
+    source = tmp_path / "library"
+    source.mkdir()
+    (source / "leo.md").write_text(_CHAPTERS["leo.md"], encoding="utf-8")
+    config = server.config()
+    env = dict(os.environ, OPENAI_API_KEY=config["openai_api_key"], OPENAI_ENDPOINT=config["openai_endpoint"],
+               CHAT_MODEL=config["chat_model"], EMBEDDING_MODEL=config["embedding_model"],
+               SEARCH_API_KEY=config["search_api_key"], SEARCH_ENDPOINT=config["search_endpoint"],
+               INDEX_NAME=config["index_name"], RETRIEVAL_MODE="local",
+               LOCAL_INDEX_PATH=str(tmp_path / "index"), EMBEDDING_CACHE_PATH="")
+    result = subprocess.run(
+        [sys.executable, "ingest.py", "run", "--source", str(source), "--target", "local",
+         "--manifest", str(tmp_path / "manifest.json")],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env, capture_output=True, text=True, timeout=120
+    )
+    assert result.returncode == 0, result.stderr
+    assert len(LocalVectorIndex.load(str(tmp_path / "index"))) == 2
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Tests for routing questions between local answers and RAG
+"""
+
+import pytest
+from intent_router import IntentRouter, find_signs
+
+
+@pytest.fixture
+def router():
+    return IntentRouter(answer_locally=True, fact_context=True)
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("What element is Scorpio?", "**Scorpio** is a **Water** sign"),
+    ("Is Gemini mutable?", "Yes — ♊ **Gemini** is a **Mutable** sign"),
+    ("Is Leo a water sign?", "No — ♌ **Leo** is a **Fire** sign, not Water"),
+    ("Which signs are fire signs?", "The **Fire** signs are ♈ Aries, ♌ Leo, ♐ Sagittarius"),
+    ("Am I a Leo if I was born on July 30?", "Yes — someone born on July 30 is ♌ **Leo**"),
+])
+def test_fact_questions_are_answered_locally(router, question, expected):
+    route = router.route(question)
+    assert route.intent == "fact"
+    assert expected in route.answer
+
+
+@pytest.mark.parametrize("question", [
+    "Is Leo a fire sign or a water sign?",
+    "Is Aries cardinal or fixed?",
+    "Is Scorpio ruled by Mars or Venus?",
+    "Which signs are fire or water signs?",
+])
+def test_questions_naming_two_values_of_an_attribute_go_to_rag(router, question):
+    route = router.route(question)
+    assert route.intent == "rag"
+    assert route.answer is None
+
+
+def test_open_questions_go_to_rag_with_sign_facts(router):
+    route = router.route("Why are Scorpios so intense?")
+    assert route.intent == "rag"
+    assert [sign.name for sign in route.signs] == ["Scorpio"]
+    assert route.context is not None
+
+
+def test_pair_questions_route_to_compatibility(router):
+    route = router.route("How compatible are Aries and Libra?")
+    assert route.intent == "compatibility"
+    assert [sign.name for sign in route.signs] == ["Aries", "Libra"]
+    assert route.exact
+
+
+def test_find_signs():
+    assert [sign.name for sign in find_signs("Leos and a Virgo")] == ["Leo", "Virgo"]
@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+"""
+Tests for request metrics and the JSONL request log
+"""
+
+import json
+import threading
+import metrics
+from metrics import RequestMetrics
+
+
+def test_finishing_a_request_does_not_wait_for_the_request_log(monkeypatch, tmp_path):
+    path = tmp_path / "requests.jsonl"
+    monkeypatch.setattr(metrics, "log_request",
+                        lambda record, path=str(path): metrics._request_log.write(record, path))
+    release = threading.Event()
+    real_open = open
+    monkeypatch.setattr("builtins.open", lambda *args, **kwargs: release.wait(5) and real_open(*args, **kwargs))
+
+    finished = RequestMetrics("extension").finish(prompt_tokens=10, completion_tokens=5)
+    assert not path.exists()  # The writer thread is still blocked on the file
+    release.set()
+    metrics.flush_request_log()
+    monkeypatch.undo()
+
+    (record,) = [json.loads(line) for line in path.read_text().splitlines()]
+    assert record == finished.to_dict()
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Tests for keyword reranking of retrieved passages
+"""
+
+from rerank import LexicalReranker, content_terms
+from retrieval import Passage
+
+
+def _candidates():
+    return [
+        Passage("The Ram charges ahead.", title="Aries", score=0.84, id="1"),
+        Passage("Bulls are patient and stubborn.", title="Taurus", score=0.83, id="2"),
+        Passage("A Leo child needs an audience and loves praise.", title="The Leo Child", score=0.82, id="3"),
+        Passage("Twins talk fast.", title="Gemini", score=0.81, id="4"),
+    ]
+
+
+def test_content_terms_drop_stopwords_and_plurals():
+    assert content_terms("How do Leos love their children?") == ["leo", "love", "children"]
+
+
+def test_keyword_match_rises():
+    ranked = LexicalReranker().rerank("How should I raise a Leo child?", _candidates(), top_k=3)
+    assert ranked[0].id == "3"
+    assert len(ranked) == 3
+
+
+def test_rerank_keeps_retrieval_scores():
+    candidates = _candidates()
+    ranked = LexicalReranker().rerank("How should I raise a Leo child?", candidates, top_k=4)
+    assert {p.id: p.score for p in ranked} == {"1": 0.84, "2": 0.83, "3": 0.82, "4": 0.81}
+    assert all(p.fused_score > 0 for p in ranked)
+    assert all(p.fused_score is None for p in candidates)
+
+
+def test_budget_refuses_slow_reranking():
+    reranker = LexicalReranker(budget=0.1)
+    reranker.seconds_per_passage = 0.01
+    assert reranker.fits(0.05, 5)
+    assert not reranker.fits(0.05, 6)
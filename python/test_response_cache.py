@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Tests for the response cache
+"""
+
+import pytest
+import response_cache
+from response_cache import MemoryBackend, ResponseCache, SQLiteBackend, cache_key
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryBackend()
+    return SQLiteBackend(str(tmp_path / "response_cache.db"))
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(response_cache.time, "time", lambda: now[0])
+    return now
+
+
+def _embed(text):
+    # Questions about the same sign point the same way
+    return [1.0 if sign in text else 0.0 for sign in ("leo", "virgo", "aries")] + [0.1]
+
+
+def test_exact_hit_ignores_case_and_punctuation(backend, clock):
+    cache = ResponseCache(backend)
+    lookup = cache.lookup("Why are Leos proud?")
+    assert not lookup.hit
+    cache.store(lookup, "Because the Sun rules them.", [{"title": "Leo"}])
+    hit = cache.lookup("  why are leos PROUD ")
+    assert hit.hit and hit.tier == "exact"
+    assert hit.entry["text"] == "Because the Sun rules them."
+    assert hit.entry["citations"] == [{"title": "Leo"}]
+
+
+def test_conversation_context_separates_answers(backend, clock):
+    cache = ResponseCache(backend)
+    history = [{"role": "user", "content": "Tell me about Leo"}, {"role": "assistant", "content": "Leo is..."}]
+    cache.store(cache.lookup("What about their love life?", history), "Leo in love...")
+    assert cache.lookup("What about their love life?", history).hit
+    assert not cache.lookup("What about their love life?").hit
+    assert not cache.lookup("What about their love life?", history, namespace="other-prompt").hit
+    assert cache_key("Why?", history) != cache_key("Why?")
+
+
+def test_entries_expire_after_ttl(backend, clock):
+    cache = ResponseCache(backend, ttl=60)
+    cache.store(cache.lookup("Why are Leos proud?"), "Because.")
+    clock[0] += 59
+    assert cache.lookup("Why are Leos proud?").hit
+    clock[0] += 2
+    assert not cache.lookup("Why are Leos proud?").hit
+    assert len(backend) == 0  # The stale entry is dropped on lookup
+
+
+def test_semantic_hit_within_threshold(backend, clock):
+    cache = ResponseCache(backend, semantic_threshold=0.9, embed=_embed)
+    cache.store(cache.lookup("Why are leo people proud?"), "Because.")
+    hit = cache.lookup("what makes a leo so proud")
+    assert hit.hit and hit.tier == "semantic"
+    assert not cache.lookup("why are virgo people tidy?").hit
+
+
+def test_semantic_tier_skips_expired_entries(backend, clock):
+    cache = ResponseCache(backend, ttl=60, semantic_threshold=0.9, embed=_embed)
+    cache.store(cache.lookup("Why are leo people proud?"), "Because.")
+    clock[0] += 61
+    assert not cache.lookup("what makes a leo so proud").hit
+
+
+def test_memory_backend_evicts_least_recently_used():
+    backend = MemoryBackend(max_entries=2)
+    cache = ResponseCache(backend)
+    for question in ("leo", "virgo", "aries"):
+        cache.store(cache.lookup(question), question)
+    assert len(backend) == 2
+    assert not cache.lookup("leo").hit
+    assert cache.lookup("aries").hit
+
+
+def test_semantic_index_sees_entries_from_other_processes(tmp_path, clock, monkeypatch):
+    path = str(tmp_path / "response_cache.db")
+    reader = ResponseCache(SQLiteBackend(path), semantic_threshold=0.9, embed=_embed)
+    writer = ResponseCache(SQLiteBackend(path), semantic_threshold=0.9, embed=_embed)
+    assert not reader.lookup("what makes a leo so proud").hit  # Loads the (empty) index
+    writer.store(writer.lookup("Why are leo people proud?"), "Because.")
+    assert not reader.lookup("what makes a leo so proud").hit  # Not reloaded yet
+    monkeypatch.setattr(response_cache, "SEMANTIC_INDEX_REFRESH", 0)
+    assert reader.lookup("what makes a leo so proud").hit
+
+
+def test_semantic_index_skips_entries_evicted_by_the_backend(clock):
+    backend = MemoryBackend(max_entries=1)
+    cache = ResponseCache(backend, semantic_threshold=0.9, embed=_embed)
+    cache.store(cache.lookup("Why are leo people proud?"), "Leo.")
+    cache.store(cache.lookup("Why are virgo people tidy?"), "Virgo.")  # Evicts the Leo answer
+    assert not cache.lookup("what makes a leo so proud").hit
+    assert cache.lookup("what makes a virgo so tidy").entry["text"] == "Virgo."
+
+
+def test_semantic_lookup_serves_the_most_similar_entry(clock):
+    cache = ResponseCache(semantic_threshold=0.5, embed=_embed)
+    cache.store(cache.lookup("leo and virgo"), "Both.")
+    cache.store(cache.lookup("leo alone"), "Leo.")
+    assert cache.lookup("just leo please").entry["text"] == "Leo."
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Tests for merging retrieval rankings
+"""
+
+import retrieval
+from mock_azure import MockAzureServer
+from retrieval import Passage, reciprocal_rank_fusion, RRF_K
+
+
+def _passages(*ids, score=0.8):
+    return [Passage(f"Passage {i}", id=i, score=score - n * 0.01) for n, i in enumerate(ids)]
+
+
+def test_fusion_orders_by_summed_reciprocal_rank():
+    first = _passages("a", "b", "c")
+    second = _passages("c", "b", "d")
+    fused = reciprocal_rank_fusion([first, second], top_k=10)
+    assert [p.id for p in fused] == ["c", "b", "a", "d"]
+    assert fused[0].fused_score == 1 / (RRF_K + 3) + 1 / (RRF_K + 1)
+    assert fused[1].fused_score == 2 / (RRF_K + 2)
+    assert fused[2].fused_score == 1 / (RRF_K + 1)
+
+
+def test_fusion_keeps_retrieval_scores():
+    first = _passages("a", "b", score=0.9)
+    second = _passages("b", "a", score=0.7)
+    fused = reciprocal_rank_fusion([first, second], top_k=2)
+    # Each fused passage keeps its best retrieval score, and the inputs are untouched
+    assert {p.id: p.score for p in fused} == {"a": 0.9, "b": 0.89}
+    assert [p.score for p in first] == [0.9, 0.89]
+    assert [p.score for p in second] == [0.7, 0.69]
+    assert all(p.fused_score is None for p in first + second)
+
+
+def test_fusion_keeps_top_k():
+    fused = reciprocal_rank_fusion([_passages("a", "b", "c")], top_k=2)
+    assert [p.id for p in fused] == ["a", "b"]
+
+
+def test_fusion_dedupes_passages_without_ids_by_content():
+    first = [Passage("Leo rules the heart"), Passage("Aries leads")]
+    second = [Passage("Leo rules the heart")]
+    fused = reciprocal_rank_fusion([first, second], top_k=5)
+    assert [p.content for p in fused] == ["Leo rules the heart", "Aries leads"]
+
+
+def test_unreadable_schema_is_logged_and_not_cached(monkeypatch, capsys):
+    server = MockAzureServer()
+    server.start()
+    try:
+        config = server.config()
+        assert retrieval.index_fields(config) is None  # The mock serves no index schema
+        assert "Could not read the schema" in capsys.readouterr().err
+
+        retriever = retrieval.AzureSearchRetriever(config)
+        schemas = iter([None, {"id", "content", "signs", "life_stages"}])
+        monkeypatch.setattr(retrieval, "index_fields", lambda config: next(schemas))
+        assert retriever.facet_fields() == set()
+        assert retriever.facet_fields() == set()  # Not read again before the retry interval
+        monkeypatch.setattr(retrieval, "SCHEMA_RETRY_SECONDS", 0)
+        assert retriever.facet_fields() == {"signs", "life_stages"}
+        assert retriever.can_filter()
+    finally:
+        server.stop()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Tests for session expiry in every conversation store backend
+"""
+
+import os
+import uuid
+import pytest
+import session_store
+from session_store import ConversationStore, MemoryBackend, RedisBackend, SQLiteBackend
+
+TTL = 100
+
+
+def _redis_backend():
+    url = os.getenv("SESSION_STORE_REDIS_URL")
+    if not url:
+        pytest.skip("SESSION_STORE_REDIS_URL is not set")
+    pytest.importorskip("redis")
+    backend = RedisBackend(url, prefix=f"zodiac:test:{uuid.uuid4().hex}")
+    backend.redis.ping()
+    return backend
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        backend = MemoryBackend()
+    elif request.param == "sqlite":
+        backend = SQLiteBackend(str(tmp_path / "sessions.db"))
+    else:
+        backend = _redis_backend()
+    return ConversationStore(backend, ttl=TTL)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(session_store.time, "time", lambda: now[0])
+    return now
+
+
+def _save_turn(store, session_id):
+    history = store.load(session_id)
+    history.add_turn("What element is Leo?", "Fire.")
+    store.save(session_id, history)
+
+
+def test_session_round_trip(store, clock):
+    _save_turn(store, "s1")
+    history = store.load("s1")
+    assert [m["content"] for m in history.messages] == ["What element is Leo?", "Fire."]
+    assert store.transcript("s1") == history.messages
+
+
+def test_idle_session_expires(store, clock):
+    _save_turn(store, "s1")
+    clock[0] += TTL + 1
+    assert store.load("s1").messages == []
+    assert store.transcript("s1") == []
+
+
+def test_loading_a_session_keeps_it_alive(store, clock):
+    _save_turn(store, "s1")
+    for _ in range(3):
+        clock[0] += TTL * 0.8
+        assert len(store.load("s1").messages) == 2
+    # Active for longer than the TTL in total, but never idle that long
+    assert clock[0] - 1_000_000.0 > TTL
+    clock[0] += TTL * 0.8
+    assert len(store.transcript("s1")) == 2
+
+
+def test_touch_updates_stored_meta(store, clock):
+    _save_turn(store, "s1")
+    store.backend.touch("s1", clock[0] + 50, TTL)
+    assert store.backend.get_meta("s1")["updated"] == clock[0] + 50
+    store.backend.touch("missing", clock[0], TTL)
+    assert store.backend.get_meta("missing") is None
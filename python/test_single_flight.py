@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Tests for coalescing identical calls and streams
+"""
+
+import asyncio
+import threading
+import pytest
+from single_flight import SingleFlight, Call, AsyncCall, SharedStream, AsyncSharedStream, StreamCancelled
+
+
+class Upstream:
+    """A stream that counts the chunks read from it and whether it was closed"""
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.reads = 0
+        self.closed = False
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            self.reads += 1
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+
+class AsyncUpstream(Upstream):
+    async def _iterate(self):
+        for chunk in self.chunks:
+            self.reads += 1
+            yield chunk
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def close(self):
+        self.closed = True
+
+
+class SlowAsyncUpstream(AsyncUpstream):
+    """An async stream that holds its second chunk back until released"""
+
+    def __init__(self, chunks):
+        super().__init__(chunks)
+        self.release = asyncio.Event()
+
+    async def _iterate(self):
+        for i, chunk in enumerate(self.chunks):
+            if i == 1:
+                await self.release.wait()
+            self.reads += 1
+            yield chunk
+
+
+def test_join_makes_one_leader_until_the_flight_lands():
+    flights = SingleFlight()
+    call, leader = flights.join("key", Call)
+    same, follower_leads = flights.join("key", Call)
+    assert leader and not follower_leads and same is call
+    assert call.followers == 1
+    call.resolve("answer")
+    assert len(flights) == 0
+    assert flights.join("key", Call)[1]
+
+
+def test_followers_get_the_leaders_result_and_error():
+    call = Call()
+    results = []
+    waiters = [threading.Thread(target=lambda: results.append(call.wait())) for _ in range(3)]
+    for waiter in waiters:
+        waiter.start()
+    call.resolve("answer")
+    for waiter in waiters:
+        waiter.join(5)
+    assert results == ["answer"] * 3
+
+    failed = Call()
+    failed.resolve(error=ValueError("upstream"))
+    with pytest.raises(ValueError):
+        failed.wait()
+
+
+def test_shared_stream_reads_upstream_once():
+    upstream = Upstream(["a", "b", "c"])
+    shared = SharedStream()
+    leader = shared.open(upstream)
+    shared.wait_open()
+    follower = shared.subscribe()
+    assert list(leader) == ["a", "b", "c"]
+    assert list(follower) == ["a", "b", "c"]
+    assert upstream.reads == 3
+    assert not upstream.closed
+
+
+def test_follower_leaving_before_the_leader_reads_keeps_the_stream():
+    upstream = Upstream(["a", "b", "c"])
+    shared = SharedStream()
+    leader = shared.open(upstream)
+    follower = shared.subscribe()
+    assert next(follower) == "a"
+    follower.close()
+    assert list(leader) == ["a", "b", "c"]
+    assert not upstream.closed
+
+
+def test_stream_is_cancelled_when_every_subscriber_leaves():
+    upstream = Upstream(["a", "b", "c"])
+    shared = SharedStream()
+    leader = shared.open(upstream)
+    assert next(leader) == "a"
+    leader.close()
+    assert upstream.closed
+    assert isinstance(shared.error, StreamCancelled)
+
+
+def test_leader_failure_reaches_followers():
+    shared = SharedStream()
+    shared.fail(RuntimeError("could not open"))
+    with pytest.raises(RuntimeError):
+        shared.wait_open()
+
+
+def test_async_call():
+    async def scenario():
+        call = AsyncCall()
+        waiters = [asyncio.create_task(call.wait()) for _ in range(3)]
+        await asyncio.sleep(0)
+        call.resolve("answer")
+        return await asyncio.gather(*waiters)
+
+    assert asyncio.run(scenario()) == ["answer"] * 3
+
+
+def test_async_follower_leaving_before_the_leader_reads_keeps_the_stream():
+    async def scenario():
+        upstream = AsyncUpstream(["a", "b", "c"])
+        shared = AsyncSharedStream()
+        leader = shared.open(upstream)
+        await shared.wait_open()
+        follower = shared.subscribe()
+        assert await follower.__anext__() == "a"
+        await follower.aclose()
+        chunks = [chunk async for chunk in leader]
+        return chunks, upstream
+
+    chunks, upstream = asyncio.run(scenario())
+    assert chunks == ["a", "b", "c"]
+    assert upstream.reads == 3 and not upstream.closed
+
+
+def test_async_stream_is_cancelled_when_every_subscriber_leaves():
+    async def scenario():
+        upstream = AsyncUpstream(["a", "b", "c"])
+        shared = AsyncSharedStream()
+        leader = shared.open(upstream)
+        assert await leader.__anext__() == "a"
+        await leader.aclose()
+        return shared, upstream
+
+    shared, upstream = asyncio.run(scenario())
+    assert upstream.closed
+    assert isinstance(shared.error, StreamCancelled)
+
+
+def test_async_cancelling_the_reading_subscriber_leaves_the_others_running():
+    async def consume(chunks):
+        return [chunk async for chunk in chunks]
+
+    async def scenario():
+        upstream = SlowAsyncUpstream(["a", "b", "c"])
+        shared = AsyncSharedStream()
+        leader = asyncio.create_task(consume(shared.open(upstream)))
+        await asyncio.sleep(0.01)  # The leader has "a" and is waiting on the read of "b"
+        follower = asyncio.create_task(consume(shared.subscribe()))
+        await asyncio.sleep(0.01)
+        leader.cancel()  # Its client went away
+        await asyncio.sleep(0.01)
+        upstream.release.set()
+        chunks = await asyncio.wait_for(follower, 2)
+        return chunks, leader, upstream
+
+    chunks, leader, upstream = asyncio.run(scenario())
+    assert chunks == ["a", "b", "c"]
+    assert leader.cancelled()
+    assert upstream.reads == 3 and not upstream.closed
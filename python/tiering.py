@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Answer tiering for Linda Goodman's Zodiac Guide
+Picks the deployment, answer length and prompt for each request from what it asks for
+"""
+
+import os
+import re
+from intent_router import find_signs
+
+TIERING = os.getenv("TIERING", "on").lower() not in ("off", "0", "false", "no")
+# Smaller, faster deployment for quick answers; quick answers use CHAT_MODEL when unset
+FAST_CHAT_MODEL = os.getenv("FAST_CHAT_MODEL", "")
+
+# "model" is "fast" or "default"; a prompt_variant of None keeps the request's or engine's own
+TIERS = {
+    "quick": {"model": "fast", "max_tokens": 500, "prompt_variant": "condensed"},
+    "standard": {"model": "default", "max_tokens": 1200, "prompt_variant": None},
+    "reading": {"model": "default", "max_tokens": 2000, "prompt_variant": None},
+}
+
+_WORD_PATTERN = re.compile(r"[a-z']+")
+# Asked for brevity
+_BRIEF_WORDS = {"briefly", "brief", "quick", "quickly", "short", "summarize", "summary", "tldr", "one-line"}
+# Asked for depth
+_DEPTH_WORDS = {"detail", "detailed", "depth", "deep", "deeply", "everything", "reading", "thorough",
+                "thoroughly", "comprehensive", "elaborate", "explain", "describe", "compare", "comparison",
+                "versus", "vs", "difference", "differences", "interact", "interaction"}
+# How short follow-ups open: "And Virgo?", "What about at work?", "Why?"
+_FOLLOW_UP_OPENERS = ("and ", "what about", "how about", "why", "how so", "really", "so ", "ok", "okay", "thanks")
+_YES_NO_OPENERS = ("is ", "are ", "does ", "do ", "can ", "will ", "should ", "would ")
+# Words at most in a quick question, and at least in a reading
+QUICK_MAX_WORDS = 8
+READING_MIN_WORDS = 25
+
+
+class TierDecision:
+    """The generation settings chosen for one request, and why"""
+
+    def __init__(self, tier, model, max_tokens, prompt_variant, reason):
+        self.tier = tier
+        self.model = model
+        self.max_tokens = max_tokens
+        self.prompt_variant = prompt_variant
+        self.reason = reason
+
+    def to_dict(self):
+        return {
+            "tier": self.tier,
+            "model": self.model,
+            "max_tokens": self.max_tokens,
+            "prompt_variant": self.prompt_variant,
+            "reason": self.reason,
+        }
+
+
+class TieringPolicy:
+    """Rule-based classifier from a request to a tier of TIERS.
+
+    "reading" is for compatibility questions, several signs, long questions
+    or ones asking for depth; "quick" for short follow-ups, yes/no questions
+    and requests for brevity, on FAST_CHAT_MODEL with the condensed prompt;
+    everything else is "standard".
+    """
+
+    def __init__(self, tiers=None, fast_model=FAST_CHAT_MODEL):
+        self.tiers = tiers or TIERS
+        self.fast_model = fast_model
+
+    def classify(self, question, has_history=False, route=None):
+        """Return (tier, reason) for a question"""
+        text = question.strip().lower()
+        words = _WORD_PATTERN.findall(text)
+        signs = route.signs if route is not None and route.signs else find_signs(question)
+
+        if _BRIEF_WORDS.intersection(words):
+            return "quick", "asks for brevity"
+        if route is not None and route.intent == "compatibility":
+            return "reading", "compatibility question"
+        if _DEPTH_WORDS.intersection(words):
+            return "reading", "asks for depth"
+        if len(signs) > 1:
+            return "reading", f"{len(signs)} signs"
+        if len(words) >= READING_MIN_WORDS:
+            return "reading", f"{len(words)} words"
+        if len(words) <= QUICK_MAX_WORDS:
+            if has_history and text.startswith(_FOLLOW_UP_OPENERS):
+                return "quick", "short follow-up"
+            if text.startswith(_YES_NO_OPENERS):
+                return "quick", "yes/no question"
+        return "standard", "default"
+
+    def decide(self, question, has_history=False, route=None, default_model="gpt-4o", max_tokens=None,
+               prompt_variant=None):
+        """The TierDecision for a request.
+
+        ``max_tokens`` caps the tier's answer length, and an explicit
+        ``prompt_variant`` wins over the tier's.
+        """
+        tier, reason = self.classify(question, has_history, route)
+        settings = self.tiers[tier]
+        model = self.fast_model if settings["model"] == "fast" and self.fast_model else default_model
+        limit = min(settings["max_tokens"], max_tokens) if max_tokens else settings["max_tokens"]
+        return TierDecision(tier, model, limit, prompt_variant or settings["prompt_variant"], reason)
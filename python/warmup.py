@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Cache warming for Linda Goodman's Zodiac Guide
+Answers the example questions and the most frequent logged ones ahead of the first users
+
+    python warmup.py run [--questions asked.jsonl] [--top 20] [--concurrency 4] [--force]
+    python warmup.py status
+
+The answers are stored in a small SQLite file the engine checks before the
+response cache. The API server can also warm at startup (WARMUP_ON_START=on)
+and only reports ready once warming has finished.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from collections import Counter
+from compatibility import index_stamp
+from metrics import LOCAL_ROUTES
+from response_cache import cache_key, normalize_question
+
+WARM_CACHE_DB = os.getenv("WARM_CACHE_DB", "warm_answers.db")
+# Questions to warm besides the examples: a text file (one per line) or JSONL with a "question" field
+WARMUP_QUESTIONS = os.getenv("WARMUP_QUESTIONS", "")
+# How many of the most frequent questions from that file to warm
+WARMUP_TOP = int(os.getenv("WARMUP_TOP", "20"))
+WARMUP_CONCURRENCY = int(os.getenv("WARMUP_CONCURRENCY", "4"))
+WARMUP_ON_START = os.getenv("WARMUP_ON_START", "off").lower() in ("on", "1", "true", "yes")
+
+# The example buttons of the Streamlit sidebar, which every new user sees first
+EXAMPLE_QUESTIONS = [
+    "What are the personality traits of a Leo?",
+    "How compatible are Aries and Libra?",
+    "Tell me about Taurus characteristics",
+    "What are the best matches for a Gemini?",
+    "How do fire signs and water signs interact?",
+    "What does Linda Goodman say about Virgo?",
+]
+
+
+def top_questions(path, top=WARMUP_TOP):
+    """The ``top`` most frequent questions in a log file, most frequent first"""
+    counts = Counter()
+    originals = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            question = line
+            if line.startswith("{"):
+                try:
+                    question = json.loads(line).get("question") or ""
+                except ValueError:
+                    continue
+            key = normalize_question(question)
+            if key:
+                counts[key] += 1
+                originals.setdefault(key, question.strip())
+    return [originals[key] for key, _ in counts.most_common(top)]
+
+
+def warmup_questions(path=WARMUP_QUESTIONS, top=WARMUP_TOP):
+    """The examples followed by the top logged questions, without duplicates"""
+    questions, seen = [], set()
+    for question in EXAMPLE_QUESTIONS + (top_questions(path, top) if path else []):
+        key = normalize_question(question)
+        if key not in seen:
+            seen.add(key)
+            questions.append(question)
+    return questions
+
+
+def warm_version(engine):
+    """Version stamp of the answers an engine would give: model, retrieval mode and index.
+    Prompts are part of each answer's key, so a new prompt version simply misses."""
+    payload = json.dumps({
+        "model": engine.config["chat_model"],
+        "mode": engine.retrieval_mode,
+        "index": engine.config["index_name"],
+        "index_stamp": index_stamp(engine),
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class WarmAnswers:
+    """Pre-generated answers to opening questions in a SQLite file, loaded into memory.
+
+    Entries are keyed like the response cache (question, conversation
+    context and prompt id) and compressed on disk; a ``meta`` table records
+    the version stamp they were generated under.
+    """
+
+    def __init__(self, path=WARM_CACHE_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                "key TEXT PRIMARY KEY, question TEXT NOT NULL, prompt TEXT NOT NULL, text BLOB NOT NULL, "
+                "citations TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._entries = {}
+        for key, text, citations in self._db.execute("SELECT key, text, citations FROM answers"):
+            self._entries[key] = {"text": zlib.decompress(text).decode("utf-8"), "citations": json.loads(citations)}
+
+    @classmethod
+    def load(cls, engine, path=WARM_CACHE_DB):
+        """Open the answers for serving, or return None if the file is missing or was built for another version"""
+        if not path or not os.path.exists(path):
+            return None
+        answers = cls(path)
+        if answers.version != warm_version(engine):
+            print(f"⚠️ {path} is out of date; refresh it with: python warmup.py run", file=sys.stderr)
+            return None
+        return answers
+
+    @property
+    def version(self):
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return row[0] if row else None
+
+    def reset(self, version):
+        """Drop every answer and start over for a new version"""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM answers")
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (version,))
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, question, history=None, prompt_id=""):
+        """The stored answer to a question in a conversation context, or None"""
+        return self._entries.get(cache_key(question, history, prompt_id))
+
+    def put(self, question, prompt_id, text, citations=None):
+        """Store the answer to an opening question"""
+        key = cache_key(question, None, prompt_id)
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO answers (key, question, prompt, text, citations, created) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, question, prompt_id, zlib.compress(text.encode("utf-8")), json.dumps(citations or []),
+                 time.time())
+            )
+            self._entries[key] = {"text": text, "citations": citations or []}
+
+
+async def open_connections(engine, count):
+    """Open up to ``count`` pooled keep-alive connections to Azure OpenAI with free calls"""
+    results = await asyncio.gather(*(engine.async_client.models.list() for _ in range(count)),
+                                   return_exceptions=True)
+    return sum(not isinstance(r, Exception) for r in results)
+
+
+async def warm(engine, questions, variants=None, path=WARM_CACHE_DB, concurrency=WARMUP_CONCURRENCY, force=False,
+               on_question=None):
+    """Answer every question not yet stored and attach the store to the engine.
+
+    Returns a report with the counts and how long warming took.
+    """
+    started = time.perf_counter()
+    answers = WarmAnswers(path)
+    version = await asyncio.to_thread(warm_version, engine)
+    if force or answers.version != version:
+        answers.reset(version)
+
+    variants = variants or [engine.prompt_variant]
+    pending = [(question, variant) for variant in variants for question in questions
+               if answers.get(question, None, engine.prompt(variant).id) is None]
+    semaphore = asyncio.Semaphore(concurrency)
+    counts = {"generated": 0, "local": 0, "failed": 0}
+
+    async def answer(question, variant):
+        async with semaphore:
+            try:
+                result = await engine.aask(question, prompt_variant=variant)
+                if result.metrics and result.metrics.route in LOCAL_ROUTES:
+                    counts["local"] += 1  # Answered without Azure already; nothing to warm
+                elif result.finish_reason != "stop":
+                    raise RuntimeError(f"answer cut short ({result.finish_reason})")
+                else:
+                    answers.put(question, engine.prompt(variant).id, result.text, result.citations)
+                    counts["generated"] += 1
+                error = None
+            except Exception as e:
+                counts["failed"] += 1
+                error = f"{type(e).__name__}: {e}"
+            if on_question:
+                on_question(question, variant, error)
+
+    connections = await open_connections(engine, concurrency)
+    await asyncio.gather(*(answer(question, variant) for question, variant in pending))
+    engine.warm = answers
+    return {
+        **counts,
+        "kept": len(questions) * len(variants) - len(pending),
+        "connections": connections,
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+
+
+def main():
+    """Command-line entry point"""
+    from prompt_registry import SYSTEM_PROMPT_VARIANTS
+
+    parser = argparse.ArgumentParser(description="Pre-answer the opening questions new users ask most")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="Answer the questions that are not stored yet")
+    run.add_argument("--questions", default=WARMUP_QUESTIONS,
+                     help="Logged questions: text (one per line) or JSONL with a 'question' field")
+    run.add_argument("--top", type=int, default=WARMUP_TOP, help="Most frequent logged questions to warm")
+    run.add_argument("--variant", action="append", choices=sorted(SYSTEM_PROMPT_VARIANTS),
+                     help="Prompt variant to warm (repeatable; default: the configured one)")
+    run.add_argument("--concurrency", type=int, default=WARMUP_CONCURRENCY, help="Questions answered at once")
+    run.add_argument("--force", action="store_true", help="Answer every question again")
+    run.add_argument("--db", default=WARM_CACHE_DB, help="Answer file")
+    status = commands.add_parser("status", help="Show how many answers are stored and whether they are current")
+    status.add_argument("--db", default=WARM_CACHE_DB, help="Answer file")
+    args = parser.parse_args()
+
+    from rag_engine import RagEngine, load_environment, MissingConfigError
+    try:
+        config = load_environment()
+    except MissingConfigError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    # Answers are generated through the plain RAG path, never from the cache or an older file
+    engine = RagEngine(config, cache=False, warm=False)
+
+    if args.command == "status":
+        answers = WarmAnswers(args.db)
+        current = answers.version == warm_version(engine)
+        print(f"📊 {args.db}: {len(answers)} answers, {'✅ current' if current else '⚠️ out of date'}")
+        return
+
+    questions = warmup_questions(args.questions, args.top)
+    print(f"🔥 Warming {len(questions)} questions into {args.db}...")
+
+    def report(question, variant, error):
+        print(f"{'❌' if error else '✅'} [{variant}] {question[:60]}" + (f": {error}" if error else ""))
+
+    result = asyncio.run(warm(engine, questions, args.variant, args.db, args.concurrency, args.force, report))
+    print(f"\n🎉 Generated {result['generated']}, failed {result['failed']}, kept {result['kept']}, "
+          f"{result['local']} answered locally in {result['seconds']}s")
+    if result["failed"]:
+        print("🔁 Run the same command again to retry the failed questions.")
+
+
+if __name__ == "__main__":
+    main()